@@ -0,0 +1,85 @@
+"""
+Measure the throughput, in cells per second, of exporting a streamed JSON
+/v2/observations response to Parquet, Feather and CSV in row groups, as
+api.export_observations() does, against building the full dataframe and
+writing that with pandas.
+
+Parquet and Feather require pyarrow, formats that cannot be written are
+skipped.
+
+Run from the repository root:
+
+    python -m benchmarks.export_benchmark --sizes 1e5 1e6 --rows 100000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import warnings
+
+from benchmarks.synthetic import synthetic_hypercube
+from transmart.api.v2 import export
+from transmart.api.v2.data_structures import ObservationSet, read_hypercube_stream
+
+CHUNK_SIZE = 64 * 1024
+
+
+def chunks(payload):
+    return (payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE))
+
+
+def export_batches(payload, path, format, rows):
+    star = read_hypercube_stream(chunks(payload), export.export_dtypes(format))
+    return export.write_batches(star.iter_batches(rows), path, format)
+
+
+def export_frame(payload, path, format):
+    frame = ObservationSet.from_stream(chunks(payload), export.export_dtypes(format)).dataframe
+    if format == 'csv':
+        frame.to_csv(path, index=False)
+    elif format == 'parquet':
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_feather(path)
+
+
+def seconds(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e5, 1e6])
+    parser.add_argument('--rows', type=int, default=export.DEFAULT_ROWS, help='cells per row group.')
+    parser.add_argument('--formats', nargs='+', default=list(export.EXPORT_FORMATS))
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)
+
+    formats = []
+    for format in args.formats:
+        try:
+            export.check_export_format(format)
+            formats.append(format)
+        except ImportError as e:
+            print('Skipping {}: {}'.format(format, e))
+
+    print('{:>10}{:>9}{:>14}{:>14}{:>14}{:>10}'.format(
+        'cells', 'format', 'batches (s)', 'cells/s', 'frame (s)', 'MB'))
+    with tempfile.TemporaryDirectory() as directory:
+        for size in map(int, args.sizes):
+            payload = json.dumps(synthetic_hypercube(size)).encode()
+            for format in formats:
+                path = os.path.join(directory, 'observations.' + format)
+                batches = seconds(lambda: export_batches(payload, path, format, args.rows))
+                mb = os.path.getsize(path) / 2 ** 20
+                frame = seconds(lambda: export_frame(payload, path, format))
+                print('{:>10}{:>9}{:>14.3f}{:>14.0f}{:>14.3f}{:>10.1f}'.format(
+                    size, format, batches, size / batches, frame, mb))
+            del payload
+
+
+if __name__ == '__main__':
+    main()
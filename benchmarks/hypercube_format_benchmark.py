@@ -0,0 +1,64 @@
+"""
+Compare payload size and decoding time of JSON and protobuf hypercube
+responses for a synthetic numeric dataset.
+
+Protobuf decoding time depends heavily on the protobuf runtime, which is
+printed as well: the pure python implementation is several times slower
+than the compiled (cpp or upb) ones.
+
+Run from the repository root:
+
+    python -m benchmarks.hypercube_format_benchmark --cells 200000
+"""
+import argparse
+import json
+import time
+
+from google.protobuf.internal import api_implementation
+
+from benchmarks.synthetic import synthetic_hypercube
+from tests.mock_server import encode_hypercube
+from transmart.api.v2.data_structures import ObservationSet
+
+CHUNK_SIZE = 64 * 1024
+
+
+def chunks(payload):
+    return (payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE))
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cells', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    response = synthetic_hypercube(args.cells)
+    json_payload = json.dumps(response).encode()
+    protobuf_payload = encode_hypercube(response)
+
+    runs = [
+        ('json', json_payload, lambda: ObservationSet(json.loads(json_payload))),
+        ('json, stream=True', json_payload, lambda: ObservationSet.from_stream(chunks(json_payload))),
+        ('protobuf', protobuf_payload, lambda: ObservationSet.from_protobuf(chunks(protobuf_payload))),
+    ]
+
+    print('{} cells, protobuf runtime: {}'.format(args.cells, api_implementation.Type()))
+    print('{:<20}{:>12}{:>12}{:>14}'.format('format', 'MB', 'seconds', 'cells/s'))
+    for name, payload, decode in runs:
+        seconds = timed(decode, args.repeat)
+        print('{:<20}{:>12.1f}{:>12.3f}{:>14.0f}'.format(
+            name, len(payload) / 2 ** 20, seconds, args.cells / seconds))
+
+
+if __name__ == '__main__':
+    main()
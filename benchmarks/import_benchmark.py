@@ -0,0 +1,54 @@
+"""
+Measure how long a headless `import transmart` takes, in fresh interpreters,
+and fail when it exceeds a budget. Also fails when the import loads any of
+the interactive dependencies, which should only load on first use.
+
+Run from the repository root:
+
+    python -m benchmarks.import_benchmark --budget 1.0
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+INTERACTIVE = ('ipywidgets', 'IPython', 'bqplot', 'whoosh')
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import transmart
+seconds = time.perf_counter() - start
+print(json.dumps(dict(seconds=seconds, mode=transmart.dependency_mode,
+                      loaded=[m for m in {modules!r} if m in sys.modules])))
+""".format(modules=INTERACTIVE)
+
+
+def measure():
+    output = subprocess.run([sys.executable, '-c', SCRIPT], check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--budget', type=float, default=1.0, help='maximum median seconds.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.repeat)]
+    median = statistics.median(run['seconds'] for run in runs)
+    loaded = sorted(set().union(*[run['loaded'] for run in runs]))
+
+    print('import transmart ({} mode): median {:.3f}s, best {:.3f}s, budget {:.3f}s'.format(
+        runs[0]['mode'], median, min(run['seconds'] for run in runs), args.budget))
+    if loaded:
+        print('Interactive modules loaded on import: {}'.format(', '.join(loaded)))
+
+    if median > args.budget or loaded:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
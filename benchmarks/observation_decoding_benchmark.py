@@ -0,0 +1,68 @@
+"""
+Measure how decoding a JSON /v2/observations response into the observations
+dataframe scales with the number of cells, for the column-wise decoder of
+ObservationSet and for the former cell by cell one, json_normalize over
+_format_observations. Both results are checked to be equal.
+
+The former decoder takes minutes and many GB above a million cells, so it is
+only run up to --baseline-max cells. A synthetic response of 1e7 cells needs
+about 8 GB of memory by itself.
+
+Run from the repository root:
+
+    python -m benchmarks.observation_decoding_benchmark --sizes 1e3 1e4 1e5 1e6 1e7
+"""
+import argparse
+import copy
+import time
+import warnings
+
+import pandas.testing as pdt
+from pandas.io.json import json_normalize
+
+from benchmarks.synthetic import synthetic_hypercube
+from transmart.api.v2.data_structures import ObservationSet, _format_observations
+
+
+def cell_by_cell(response):
+    # _format_observations adds the elements to the declarations.
+    response = dict(response, dimensionDeclarations=copy.deepcopy(response['dimensionDeclarations']))
+    return json_normalize(_format_observations(response))
+
+
+def best_of(func, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e3, 1e4, 1e5, 1e6, 1e7])
+    parser.add_argument('--baseline-max', type=float, default=1e6,
+                        help='largest number of cells to run the cell by cell decoder for.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)
+
+    print('{:>10}{:>14}{:>14}{:>14}{:>10}'.format('cells', 'columns (s)', 'cells/s', 'cell by cell', 'speed-up'))
+    for size in map(int, args.sizes):
+        response = synthetic_hypercube(size)
+        seconds, frame = best_of(lambda: ObservationSet(response).dataframe, args.repeat)
+
+        baseline, speed_up = '-', '-'
+        if size <= args.baseline_max:
+            baseline_seconds, expected = best_of(lambda: cell_by_cell(response), 1 if size > 1e5 else args.repeat)
+            pdt.assert_frame_equal(expected, frame)
+            baseline = '{:.3f}'.format(baseline_seconds)
+            speed_up = '{:.1f}x'.format(baseline_seconds / seconds)
+
+        print('{:>10}{:>14.3f}{:>14.0f}{:>14}{:>10}'.format(size, seconds, size / seconds, baseline, speed_up))
+        del response, frame
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure the local observation store: writing a synthetic observation set,
+reopening the store, and queries that scan the memory-mapped columns.
+
+Run from the repository root:
+
+    python -m benchmarks.observation_store_benchmark --cells 1e6
+"""
+import argparse
+import tempfile
+import time
+import warnings
+
+from benchmarks.synthetic import synthetic_hypercube
+from transmart.api.v2.data_structures import ObservationStar
+from transmart.api.v2.observation_store import ObservationStore
+
+
+def best_of(func, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cells', type=float, default=1e6)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', FutureWarning)
+
+    star = ObservationStar.from_json(synthetic_hypercube(int(args.cells)))
+    with tempfile.TemporaryDirectory() as directory:
+        seconds, _ = best_of(lambda: ObservationStore(directory).add(star), 1)
+        print('{:<40}{:>10.3f} s'.format('write {} cells'.format(len(star)), seconds))
+
+        seconds, store = best_of(lambda: ObservationStore(directory), args.repeat)
+        print('{:<40}{:>10.2f} ms'.format('reopen', seconds * 1000))
+
+        for name, constraint in (('query one concept', {'concept': 'SYN:3'}),
+                                 ('query concept and 10 subjects', {'concept': 'SYN:3', 'subject': list(range(-9, 1))}),
+                                 ('query all', {})):
+            seconds, frame = best_of(lambda: store.query(**constraint), args.repeat)
+            print('{:<40}{:>10.3f} s {:>10} rows'.format(name, seconds, len(frame)))
+
+        seconds, frame = best_of(lambda: store.observations(concept='SYN:3').dataframe, args.repeat)
+        print('{:<40}{:>10.3f} s {:>10} rows'.format('observations of one concept', seconds, len(frame)))
+
+
+if __name__ == '__main__':
+    main()
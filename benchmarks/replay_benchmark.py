@@ -0,0 +1,79 @@
+"""
+Benchmark the parsing paths of TransmartV2 on a recorded cassette,
+without network access, see transmart.api.cassette.
+
+Without --cassette, a cassette with a synthetic /v2/observations response
+is created. To benchmark realistic payloads, record one first:
+
+    from transmart.api.cassette import RecordingTransport
+    transport = RecordingTransport('observations.jsonl.gz')
+    api = tm.get_api(host, ..., transport=transport)
+    api.observations(constraint)
+    transport.close()
+
+Run from the repository root:
+
+    python -m benchmarks.replay_benchmark --cells 200000
+    python -m benchmarks.replay_benchmark --cassette observations.jsonl.gz --constraint '{"type": "true"}'
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import requests
+
+from benchmarks.synthetic import synthetic_hypercube
+from tests.test_values import access_token
+from transmart import get_api
+from transmart.api.cassette import Cassette, ReplayTransport
+
+HOST = 'http://transmart.replay'
+KC_URL = 'http://keycloak.replay'
+TOKEN_URL = KC_URL + '/auth/realms/replay/protocol/openid-connect/token'
+JSON = {'Content-Type': 'application/json'}
+
+
+def synthetic_cassette(path, n_cells, constraint):
+    cassette = Cassette(path)
+    token = access_token if isinstance(access_token, str) else access_token.decode()
+    form = requests.Request('POST', TOKEN_URL, data=dict(grant_type='refresh_token', refresh_token='replay',
+                                                         client_id='transmart-client',
+                                                         scope='offline_access')).prepare().body
+    cassette.add('POST', TOKEN_URL, form, 200, JSON, json.dumps({'access_token': token}).encode(), 0.01)
+
+    body = requests.Request('POST', HOST + '/v2/observations',
+                            json={'type': 'clinical', 'constraint': constraint}).prepare().body
+    cassette.add('POST', HOST + '/v2/observations', body, 200, JSON,
+                 json.dumps(synthetic_hypercube(n_cells)).encode(), 1.0)
+    cassette.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cassette', help='recorded cassette, defaults to a synthetic one.')
+    parser.add_argument('--constraint', default='{"type": "true"}', help='constraint of the recorded query.')
+    parser.add_argument('--cells', type=int, default=100000, help='cells of the synthetic response.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', action='store_true', help='wait as long as the recorded requests.')
+    args = parser.parse_args()
+    constraint = json.loads(args.constraint)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.cassette
+        if path is None:
+            path = os.path.join(tmp, 'synthetic.jsonl.gz')
+            synthetic_cassette(path, args.cells, constraint)
+
+        api = get_api(host=HOST, kc_url=KC_URL, kc_realm='replay', offline_token='replay',
+                      interactive=False, transport=ReplayTransport(path, latency=args.latency))
+
+        for stream in (False, True):
+            print('\nobservations(stream={})'.format(stream))
+            with api.profile():
+                for _ in range(args.repeat):
+                    api.observations(constraint, stream=stream)
+
+
+if __name__ == '__main__':
+    main()
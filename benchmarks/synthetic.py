@@ -0,0 +1,48 @@
+"""
+Synthetic /v2/observations hypercube responses for benchmarks.
+"""
+import random
+
+
+def synthetic_hypercube(n_cells, n_patients=1000, n_concepts=50, n_visits=5, seed=0):
+    """
+    Create a JSON hypercube with numeric observations for n_cells cells,
+    spread over patients, concepts and trial visits of a single study.
+    """
+    rng = random.Random(seed)
+
+    declarations = [
+        {'name': 'study', 'inline': False, 'fields': [{'name': 'name', 'type': 'String'}]},
+        {'name': 'concept', 'inline': False, 'fields': [{'name': 'conceptPath', 'type': 'String'},
+                                                        {'name': 'conceptCode', 'type': 'String'},
+                                                        {'name': 'name', 'type': 'String'}]},
+        {'name': 'patient', 'inline': False, 'fields': [{'name': 'id', 'type': 'Int'},
+                                                        {'name': 'inTrialId', 'type': 'String'},
+                                                        {'name': 'sex', 'type': 'String'},
+                                                        {'name': 'age', 'type': 'Int'}]},
+        {'name': 'trial visit', 'inline': False, 'fields': [{'name': 'id', 'type': 'Int'},
+                                                            {'name': 'relTimeLabel', 'type': 'String'}]},
+        {'name': 'start time', 'inline': True, 'valueType': 'Timestamp'},
+    ]
+
+    elements = {
+        'study': [{'name': 'SYNTHETIC'}],
+        'concept': [{'conceptPath': '\\Synthetic\\Measurement {}\\'.format(i),
+                     'conceptCode': 'SYN:{}'.format(i),
+                     'name': 'Measurement {}'.format(i)} for i in range(n_concepts)],
+        'patient': [{'id': -i, 'inTrialId': str(i), 'sex': rng.choice(('male', 'female')),
+                     'age': rng.randint(18, 90)} for i in range(n_patients)],
+        'trial visit': [{'id': -i, 'relTimeLabel': 'Week {}'.format(i)} for i in range(n_visits)],
+    }
+
+    cells = [{'dimensionIndexes': [0,
+                                   rng.randrange(n_concepts),
+                                   rng.randrange(n_patients),
+                                   rng.randrange(n_visits)],
+              'inlineDimensions': ['2017-01-{:02d}T00:00:00Z'.format(1 + i % 28)],
+              'numericValue': round(rng.gauss(100, 15), 3)}
+             for i in range(n_cells)]
+
+    return {'dimensionDeclarations': declarations,
+            'cells': cells,
+            'dimensionElements': elements}
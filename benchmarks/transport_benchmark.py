@@ -0,0 +1,56 @@
+"""
+Compare requests per second against the mock server in tests/mock_server.py,
+sending every call with a bare requests.post (a new connection per call) and
+through the pooled keep-alive Transport.
+
+Run from the repository root:
+
+    python -m benchmarks.transport_benchmark -n 2000
+"""
+import argparse
+import time
+from threading import Thread
+
+import requests
+
+from tests.mock_server import MockServerRequestHandler, TestServer, get_free_port
+from transmart.api.transport import Transport
+
+
+def start_server():
+    port = get_free_port()
+    server = TestServer(('localhost', port), MockServerRequestHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://localhost:{}/v2/patients'.format(port)
+
+
+def requests_per_second(post, url, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        r = post(url, json={'constraint': {'type': 'true'}})
+        r.raise_for_status()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', type=int, default=1000, help='requests per run.')
+    args = parser.parse_args()
+
+    server, url = start_server()
+    try:
+        transport = Transport()
+        before = requests_per_second(requests.post, url, args.n)
+        after = requests_per_second(transport.post, url, args.n)
+    finally:
+        server.shutdown()
+
+    print('{:<24}{:>12}'.format('transport', 'req/s'))
+    print('{:<24}{:>12.0f}'.format('requests.post', before))
+    print('{:<24}{:>12.0f}'.format('Transport (keep-alive)', after))
+    print('speed-up: {:.2f}x'.format(after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,8 @@ if os.environ.get('READTHEDOCS') == 'True':
 
 minimal = ["requests", "click", "pyjwt"]
 backend = ["pandas", "arrow"]
+asynchronous = ["aiohttp"]
+export = ["pyarrow"]
 
 setuptools.setup(
     name="transmart",
@@ -32,7 +34,7 @@ setuptools.setup(
 
     description="An python client for communicating with the transmart rest api.",
 
-    packages=setuptools.find_packages(exclude=['tests', 'tests.*']),
+    packages=setuptools.find_packages(exclude=['tests', 'tests.*', 'benchmarks', 'benchmarks.*']),
     include_package_data=True,
 
     keywords=['transmart', 'rest', 'api', 'data', 'science'],
@@ -43,10 +45,13 @@ setuptools.setup(
 
     extras_require={
         "backend": backend,
+        "async": asynchronous,
+        "export": export,
         "full": required_packages},
     entry_points={
         'console_scripts': [
-            'transmart-keycloak = transmart.api.utils.keycloak_role_manager:_role_manager_entry_point'
+            'transmart-keycloak = transmart.api.utils.keycloak_role_manager:_role_manager_entry_point',
+            'transmart-replay = transmart.api.utils.slow_query_replay:_replay_entry_point'
         ]
     },
 
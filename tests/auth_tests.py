@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+import jwt
+
+from transmart.api.auth import KeyCloakAuth
+from transmart.api.token_cache import TokenCache
+
+
+class TokenResponse:
+    ok = True
+
+    def __init__(self, token):
+        self.token = token
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'access_token': self.token}
+
+
+class KeyCloakTransport:
+    """ Hands out tokens with the given lifetime, slowly, and counts the requests. """
+
+    def __init__(self, lifetime, delay=0.0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.requests = 0
+        self._posted = threading.Condition()
+
+    def post(self, url, data):
+        with self._posted:
+            self.requests += 1
+            self._posted.notify_all()
+        time.sleep(self.delay)
+        now = int(time.time())
+        return TokenResponse(jwt.encode({'iat': now, 'exp': now + self.lifetime}, 'secret', algorithm='HS256'))
+
+    def wait_for_requests(self, n, timeout=30):
+        """ Wait until n token requests were made, or the timeout passed. """
+        with self._posted:
+            return self._posted.wait_for(lambda: self.requests >= n, timeout)
+
+
+def get_auth(transport, **kwargs):
+    return KeyCloakAuth(url='http://keycloak', realm='test', offline_token='offline token',
+                        transport=transport, **kwargs)
+
+
+class KeyCloakAuthTestCase(unittest.TestCase):
+
+    def test_reuse_valid_token(self):
+        transport = KeyCloakTransport(lifetime=300)
+        auth = get_auth(transport)
+        for _ in range(5):
+            self.assertIsNotNone(auth.access_token)
+        self.assertEqual(1, transport.requests)
+
+    def test_single_flight_refresh(self):
+        transport = KeyCloakTransport(lifetime=300, delay=0.1)
+        auth = get_auth(transport)
+        auth.expiry = time.time()
+
+        threads = [threading.Thread(target=lambda: auth.access_token) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(2, transport.requests)
+
+    def test_background_renewal(self):
+        transport = KeyCloakTransport(lifetime=20)
+        auth = get_auth(transport, renewal=0.06)
+        first = auth.access_token
+        # Renewed tokens are only renewed again after minutes.
+        transport.lifetime = 3600
+        self.assertTrue(transport.wait_for_requests(2))
+        with auth._lock:
+            # The renewal holds the lock until the new token is set.
+            auth.stop_renewal()
+        self.assertEqual(2, transport.requests)
+        self.assertNotEqual(first, auth.access_token)
+        self.assertEqual(2, transport.requests)
+
+        self.assertRaises(ValueError, get_auth, transport, renewal=2)
+
+    def test_lazy_token(self):
+        transport = KeyCloakTransport(lifetime=300)
+        auth = get_auth(transport, fetch_token=False)
+        self.assertEqual(0, transport.requests)
+        self.assertIsNotNone(auth.access_token)
+        self.assertEqual(1, transport.requests)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = TokenCache(os.path.join(self.dir.name, 'tokens'))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_shared_token(self):
+        transport = KeyCloakTransport(lifetime=300, delay=0.1)
+        auths = []
+        threads = [threading.Thread(target=lambda: auths.append(get_auth(transport, token_cache=self.cache)))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(1, transport.requests)
+        self.assertEqual(1, len({auth.access_token for auth in auths}))
+
+        files = [f for f in os.listdir(self.cache.directory) if f.endswith('.json')]
+        self.assertEqual(1, len(files))
+        mode = os.stat(os.path.join(self.cache.directory, files[0])).st_mode
+        self.assertEqual(0o600, stat.S_IMODE(mode))
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(self.cache.directory).st_mode))
+        with open(os.path.join(self.cache.directory, files[0])) as f:
+            self.assertNotIn('offline token', f.read())
+
+        # Other clients or offline tokens do not share the token.
+        get_auth(transport, token_cache=self.cache, client_id='other')
+        self.assertEqual(2, transport.requests)
+
+    def test_existing_directory(self):
+        os.chmod(self.dir.name, 0o755)
+        TokenCache(self.dir.name)
+        self.assertEqual(0o755, stat.S_IMODE(os.stat(self.dir.name).st_mode))
+
+    def test_async_shared_token(self):
+        transport = KeyCloakTransport(lifetime=300)
+        token = get_auth(transport, token_cache=self.cache).access_token
+        auth = get_auth(transport, token_cache=self.cache, fetch_token=False)
+        self.assertEqual(token, asyncio.run(auth.access_token_async(session=None)))
+        self.assertEqual(1, transport.requests)
+
+    def test_expired_token(self):
+        transport = KeyCloakTransport(lifetime=5)
+        get_auth(transport, token_cache=self.cache)
+        get_auth(transport, token_cache=self.cache)
+        self.assertEqual(2, transport.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from transmart.api.cache import ResponseCache, MemoryCache, get_constraint_identity
+
+from tests.mock_server import TestMockServer, retry
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.tmp.name, ttls={'/v2/observations/counts': 5})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ttl_longest_prefix(self):
+        self.assertEqual(5, self.cache.ttl('/v2/observations/counts_per_concept'))
+        self.assertEqual(600, self.cache.ttl('/v2/observations'))
+        self.assertFalse(self.cache.cacheable('/v2/admin/system/clear_cache'))
+
+    def test_key_ignores_ordering(self):
+        self.assertEqual(self.cache.key('/v2/patients', {'a': 1, 'b': [1, {'c': 2, 'd': 3}]}),
+                         self.cache.key('/v2/patients', {'b': [1, {'d': 3, 'c': 2}], 'a': 1}))
+
+    def test_put_get(self):
+        key = self.cache.key('/v2/studies')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, '/v2/studies', b'{"studies": []}', etag='"abc"')
+        entry = self.cache.get(key)
+        self.assertTrue(entry.fresh)
+        self.assertEqual('"abc"', entry.etag)
+        self.assertEqual({'studies': []}, entry.json())
+
+    def test_lru_eviction(self):
+        body = os.urandom(1000)
+        keys = [self.cache.key(i) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, '/v2/studies', body)
+            os.utime(self.cache._path(key), (i, i))
+
+        # Room for three entries, using the first makes the second least recently used.
+        self.cache.max_size = 3500
+        self.cache.get(keys[0])
+        self.cache.put(self.cache.key(3), '/v2/studies', body)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+        self.assertEqual(1, self.cache.stats.evictions)
+
+
+class MemoryCacheTestCase(unittest.TestCase):
+
+    def test_constraint_identity(self):
+        a = {'type': 'concept', 'conceptCode': 'AGE'}
+        b = {'conceptCode': 'SEX', 'type': 'concept'}
+        self.assertEqual(get_constraint_identity({'type': 'and', 'args': [a, b]}),
+                         get_constraint_identity({'args': [b, a], 'type': 'and'}))
+        self.assertNotEqual(get_constraint_identity({'type': 'and', 'args': [a, b]}),
+                            get_constraint_identity({'type': 'or', 'args': [a, b]}))
+
+    def test_lru_and_ttl(self):
+        memo = MemoryCache(maxsize=2, ttl=None)
+        memo.set('a', 1)
+        memo.set('b', 2)
+        memo.get('a')
+        memo.set('c', 3)
+        self.assertIsNone(memo.get('b'))
+        self.assertEqual(1, memo.get('a'))
+        self.assertEqual(1, memo.stats.evictions)
+
+        memo.ttl = -1
+        self.assertIsNone(memo.get('a'))
+        self.assertEqual(4, memo.get_or_call('d', lambda: 4))
+
+
+class CachedApiTestCase(TestMockServer):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.api.cache = ResponseCache(self.tmp.name, ttls={'/v2/studies': 0})
+
+    def tearDown(self):
+        self.api.cache = None
+        self.tmp.cleanup()
+
+    @retry
+    def test_hits_and_revalidation(self):
+        first = self.api.patients().json
+        second = self.api.patients().json
+        self.assertEqual(first, second)
+
+        self.api.get_studies()
+        self.api.get_studies()
+
+        stats = self.api.cache.stats
+        self.assertEqual(2, stats.misses)
+        self.assertEqual(2, stats.hits)
+        self.assertEqual(1, stats.revalidated)
+
+    @retry
+    def test_memoized_counts(self):
+        a = {'type': 'concept', 'conceptCode': 'CV:DEM:AGE'}
+        b = {'type': 'study_name', 'studyId': 'CATEGORICAL_VALUES'}
+        self.assertIsNone(self.api.memo)
+        self.assertIsNot(self.api.observations.counts_per_concept(a), self.api.observations.counts_per_concept(a))
+
+        self.api.memo = MemoryCache()
+        try:
+            first = self.api.observations.counts_per_concept({'type': 'and', 'args': [a, b]})
+            second = self.api.observations.counts_per_concept({'type': 'and', 'args': [b, a]})
+            self.assertIs(first, second)
+            self.assertEqual(1, len(self.api.memo))
+
+            self.api._invalidate_caches()
+            self.assertEqual(0, len(self.api.memo))
+        finally:
+            self.api.memo = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+import tempfile
+import time
+
+import pandas.testing as pdt
+
+from transmart import get_api
+from transmart.api.cassette import RecordingTransport, ReplayTransport, UnrecordedRequest, Cassette
+
+from tests.mock_server import TestMockServer, retry
+from tests.test_values import access_token
+
+
+class CassetteTestCase(TestMockServer):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'cassette.jsonl.gz')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def replay_api(self, **kwargs):
+        return get_api(host='http://replay.invalid',
+                       kc_url='http://keycloak.invalid',
+                       kc_realm='test',
+                       client_id='test',
+                       offline_token='another offline token',
+                       interactive=False,
+                       transport=ReplayTransport(self.path, **kwargs))
+
+    @retry
+    def test_record_and_replay(self):
+        recording = RecordingTransport(self.path)
+        api = get_api(host=self.api.host,
+                      kc_url=self.api.auth.url,
+                      kc_realm='test',
+                      client_id='test',
+                      offline_token='offline token',
+                      interactive=False,
+                      transport=recording)
+        expected = api.observations().dataframe
+        patients = api.patients().dataframe
+        studies = api.get_studies().dataframe
+        recording.close()
+
+        with gzip.open(self.path, 'rt') as f:
+            content = f.read()
+        self.assertNotIn(access_token if isinstance(access_token, str) else access_token.decode(), content)
+        self.assertNotIn('offline token', content)
+
+        api = self.replay_api()
+        pdt.assert_frame_equal(expected, api.observations().dataframe)
+        pdt.assert_frame_equal(patients, api.patients().dataframe)
+        pdt.assert_frame_equal(studies, api.get_studies().dataframe)
+        streamed = api.observations(stream=True).dataframe
+        pdt.assert_frame_equal(expected.sort_index(axis=1), streamed.sort_index(axis=1))
+
+        self.assertRaises(UnrecordedRequest, api.observations, concept='unknown')
+
+    @retry
+    def test_recorded_latency(self):
+        cassette = Cassette(self.path)
+        cassette.add('POST', 'http://kc/auth/realms/test/protocol/openid-connect/token', None, 200,
+                     {'Content-Type': 'application/json'}, b'{"access_token": "secret"}', 0.05)
+        cassette.save()
+        cassette = Cassette.load(self.path)
+        self.assertEqual(1, len(cassette))
+
+        start = time.perf_counter()
+        r = ReplayTransport(cassette, latency=True).post('http://other/auth/realms/test/protocol/openid-connect/token')
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertNotIn('secret', r.text)
+        self.assertEqual(200, r.status_code)
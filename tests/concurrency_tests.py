@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import unittest
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from transmart.api.concurrency import SingleFlight, AdaptiveLimiter, TokenBucket
+from transmart.api.transport import Transport, get_transport
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def run_concurrently(self, flight, func, n=8):
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(flight.do('key', func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        return threads, results, errors
+
+    def wait_for_followers(self, flight, n):
+        deadline = time.time() + 5
+        while flight.deduplicated < n and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_shared_result(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            release.wait()
+            return {'count': 1}
+
+        threads, results, errors = self.run_concurrently(flight, func)
+        self.wait_for_followers(flight, 7)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(8, len(results))
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual((1, 7), (flight.calls, flight.deduplicated))
+        self.assertEqual(0, flight.in_flight)
+
+    def test_shared_error(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def func():
+            release.wait()
+            raise ValueError('server error')
+
+        threads, results, errors = self.run_concurrently(flight, func, n=4)
+        self.wait_for_followers(flight, 3)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(4, len(errors))
+        self.assertEqual(4, flight.deduplicated + flight.calls)
+        self.assertEqual('ok', flight.do('key', lambda: 'ok'))
+
+
+class AdaptiveLimiterTestCase(unittest.TestCase):
+
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(max_limit=10, initial_limit=2)
+        for _ in range(6):
+            limiter.acquire()
+            limiter.release(0.1)
+        self.assertEqual(4, limiter.limit)
+
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(0.1)
+        self.assertEqual(10, limiter.limit)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(max_limit=10, backoff=0.5)
+        limiter.acquire()
+        limiter.release(0.1, overload=True)
+        self.assertEqual(5, limiter.limit)
+        self.assertEqual(1, limiter.overloads)
+
+        # Slow responses for an endpoint count as overload.
+        limiter = AdaptiveLimiter(max_limit=10, backoff=0.5, tolerance=2)
+        for latency in (0.1, 0.1, 0.1, 1.0):
+            limiter.acquire()
+            limiter.release(latency, key='/v2/studies')
+        self.assertEqual(5, limiter.limit)
+
+        # But slow endpoints are not compared with fast ones.
+        limiter.acquire()
+        limiter.release(1.0, key='/v2/observations')
+        self.assertEqual(1, limiter.overloads)
+
+    def test_record(self):
+        limiter = AdaptiveLimiter(max_limit=10, initial_limit=2)
+        limiter.acquire()
+        limiter.record(0.1)
+        self.assertEqual((2.5, 1), (limiter._limit, limiter.in_flight))
+        limiter.release()
+        self.assertEqual((2.5, 0), (limiter._limit, limiter.in_flight))
+
+    def test_queue(self):
+        limiter = AdaptiveLimiter(max_limit=1)
+        limiter.acquire()
+
+        t = threading.Thread(target=limiter.acquire)
+        t.start()
+        deadline = time.time() + 5
+        while limiter.queue_depth < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(dict(limit=1, in_flight=1, queue_depth=1, overloads=0), limiter.metrics())
+
+        limiter.release(0.1)
+        t.join(5)
+        self.assertEqual((1, 0), (limiter.in_flight, limiter.queue_depth))
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_rate(self):
+        bucket = TokenBucket(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(10):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TransportTestCase(unittest.TestCase):
+
+    def test_given_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=7)
+        session.mount('https://', adapter)
+        transport = Transport(session=session)
+        self.assertIs(session, transport.session)
+        self.assertIs(adapter, session.get_adapter('https://example.com'))
+
+    def test_no_read_timeout(self):
+        self.assertEqual((10, None), Transport().timeout)
+
+    def test_verify(self):
+        self.assertEqual('ca.pem', get_transport(verify='ca.pem').verify)
+        transport = Transport(verify=False)
+        self.assertIs(transport, get_transport(transport))
+        self.assertIs(transport, get_transport(transport, verify=False))
+        self.assertRaises(ValueError, get_transport, transport, verify=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
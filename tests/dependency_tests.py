@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import subprocess
+import sys
+import unittest
+
+SCRIPT = """
+import sys
+import transmart
+print([m for m in ('ipywidgets', 'IPython', 'bqplot', 'whoosh') if m in sys.modules])
+"""
+
+
+class DependencyTestCase(unittest.TestCase):
+
+    def test_headless_import(self):
+        output = subprocess.run([sys.executable, '-c', SCRIPT], check=True, stdout=subprocess.PIPE).stdout
+        self.assertEqual('[]', output.decode().strip().splitlines()[-1])
+
+    def test_dependency_mode(self):
+        import transmart
+        self.assertEqual('FULL', transmart.dependency_mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+
+from transmart.api.instrumentation import Instrumentation, timed, percentile
+
+from tests.mock_server import TestMockServer, retry
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def test_hooks(self):
+        instrumentation = Instrumentation()
+        events = []
+        instrumentation.on_request_start(lambda r: events.append(('start', r.endpoint)))
+        instrumentation.on_request_end(lambda r: events.append(('end', dict(r.stages))))
+        instrumentation.on_parse_end(lambda r: events.append(('parsed', list(r.stages))))
+
+        with instrumentation.request('get', '/v2/studies') as record:
+            with timed('server'):
+                pass
+            with instrumentation.request('get', '/v2/studies') as nested:
+                self.assertIs(record, nested)
+            instrumentation.request_end(record)
+            with timed('normalize'):
+                pass
+
+        self.assertEqual(['start', 'end', 'parsed'], [e for e, _ in events])
+        self.assertEqual(['server'], list(events[1][1]))
+        self.assertEqual(['server', 'normalize'], events[2][1])
+        self.assertEqual(1, len(instrumentation.records))
+
+    def test_stats(self):
+        self.assertEqual(90, percentile(range(1, 101), 90))
+        self.assertEqual(3, percentile([3], 50))
+        self.assertIsNone(percentile([], 50))
+
+        instrumentation = Instrumentation()
+        for _ in range(3):
+            with instrumentation.request('get', '/v2/studies') as record:
+                record.bytes_received = 10
+        with self.assertRaises(ValueError):
+            with instrumentation.request('get', '/v2/patients'):
+                raise ValueError()
+
+        stats = instrumentation.stats()
+        self.assertEqual(['/v2/studies', '/v2/patients'], list(stats))
+        self.assertEqual((3, 30, 0), (stats['/v2/studies']['calls'],
+                                      stats['/v2/studies']['bytes_received'],
+                                      stats['/v2/studies']['errors']))
+        self.assertEqual(1, stats['/v2/patients']['errors'])
+        self.assertEqual({'mean', 'p50', 'p90', 'p99'}, set(stats['/v2/studies']['timings']['total']))
+
+
+class ProfileTestCase(TestMockServer):
+
+    @retry
+    def test_profile(self):
+        out = io.StringIO()
+        with self.api.profile(file=out) as records:
+            self.api.observations()
+            self.api.observations(stream=True)
+            self.api.patients()
+
+        self.assertEqual(3, len(records))
+        observations, streamed, patients = records
+        self.assertEqual(['token', 'server', 'download', 'decode', 'format', 'normalize'],
+                         list(observations.stages))
+        self.assertEqual(['token', 'server', 'decode', 'normalize'], list(streamed.stages))
+        self.assertEqual(observations.bytes_received, streamed.bytes_received)
+        self.assertGreater(observations.bytes_sent, 0)
+        self.assertEqual(200, patients.status)
+
+        table = out.getvalue()
+        self.assertIn('/v2/observations', table)
+        self.assertIn('normalize', table)
+
+
+if __name__ == '__main__':
+    unittest.main()
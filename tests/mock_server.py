@@ -1,9 +1,11 @@
 import json
 import socket
+from hashlib import sha1
 import time
 import unittest
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from threading import Thread
+from urllib.parse import parse_qs
 
 import requests
 from functools import wraps
@@ -11,22 +13,186 @@ from functools import wraps
 from tests.test_values import GET_JSON_RESPONSES, POST_JSON_RESPONSES
 from transmart import get_api
 
+PROTOBUF_MEDIA_TYPE = 'application/x-protobuf'
+
+
+def encode_hypercube(response):
+    """ Serialize a JSON hypercube response in the protobuf format of hypercube.proto. """
+    import pandas as pd
+    from google.protobuf.internal.encoder import _VarintBytes
+    from transmart.api.v2 import hypercube_pb2 as pb
+
+    types = {'Double': pb.DOUBLE, 'String': pb.STRING, 'Int': pb.INT,
+             'Timestamp': pb.TIMESTAMP, 'Object': pb.OBJECT}
+
+    def value(v):
+        if isinstance(v, str):
+            return pb.Value(stringValue=v)
+        if isinstance(v, float):
+            return pb.Value(doubleValue=v)
+        return pb.Value(intValue=v)
+
+    def column(values, type_):
+        col = pb.DimensionElementFieldColumn()
+        present = [v for v in values if v is not None]
+        col.absentValueIndices.extend(i for i, v in enumerate(values) if v is None)
+        if type_ == pb.TIMESTAMP:
+            col.timestampValue.extend(int(pd.Timestamp(v).value // 10 ** 6) for v in present)
+        elif type_ == pb.INT:
+            col.intValue.extend(present)
+        elif type_ == pb.DOUBLE:
+            col.doubleValue.extend(present)
+        else:
+            col.stringValue.extend(present)
+        return col
+
+    declarations = response['dimensionDeclarations']
+    cells = response['cells']
+    header = pb.Header(last=not cells)
+    for d in declarations:
+        header.dimensionDeclarations.add(
+            name=d['name'], inline=bool(d.get('inline')),
+            fields=[pb.FieldDefinition(name=f['name'], type=types.get(f['type'], pb.OBJECT))
+                    for f in d.get('fields') or []])
+    messages = [header]
+
+    for i, cell in enumerate(cells):
+        inline = cell['inlineDimensions']
+        message = pb.Cell(
+            dimensionIndexes=[0 if index is None else index + 1 for index in cell['dimensionIndexes']],
+            inlineDimensions=[value(v) for v in inline if v is not None],
+            absentInlineDimensions=[j for j, v in enumerate(inline) if v is None],
+            last=i == len(cells) - 1)
+        if 'numericValue' in cell:
+            message.numericValue = cell['numericValue']
+        if 'stringValue' in cell:
+            message.stringValue = cell['stringValue']
+        messages.append(message)
+
+    footer = pb.Footer()
+    for d in declarations:
+        if d.get('inline'):
+            continue
+        elements = response['dimensionElements'][d['name']]
+        dimension = footer.dimension.add(name=d['name'], empty=not elements)
+        if not d.get('fields'):
+            dimension.fields.append(column(elements, pb.STRING))
+            continue
+        for j, f in enumerate(d['fields']):
+            values = [e.get(f['name']) for e in elements]
+            if all(v is None for v in values):
+                dimension.absentFieldColumnIndices.append(j)
+            else:
+                dimension.fields.append(column(values, types.get(f['type'], pb.OBJECT)))
+    messages.append(footer)
+
+    return b''.join(_VarintBytes(m.ByteSize()) + m.SerializeToString() for m in messages)
+
+
+def _concept_codes(constraint):
+    """ Concept codes selected anywhere in a constraint. """
+    if isinstance(constraint, dict):
+        if constraint.get('type') == 'concept':
+            return {constraint['conceptCode']}
+        return set().union(*[_concept_codes(v) for v in constraint.values()])
+    if isinstance(constraint, list):
+        return set().union(*[_concept_codes(v) for v in constraint])
+    return set()
+
+
+def filter_hypercube(response, constraint):
+    """ Keep only the cells of the concepts in the constraint, if it has any. """
+    codes = _concept_codes(constraint)
+    if not codes or 'cells' not in response:
+        return response
+
+    position = [d['name'] for d in response['dimensionDeclarations'] if not d.get('inline')].index('concept')
+    concepts = response['dimensionElements']['concept']
+    cells = [c for c in response['cells']
+             if concepts[c['dimensionIndexes'][position]]['conceptCode'] in codes]
+    return dict(response, cells=cells)
+
+
+def _truncate(node, depth):
+    """ Node with at most depth levels, nodes at the last level lose their children. """
+    node = dict(node)
+    children = node.pop('children', None)
+    if children is not None and depth != 1:
+        node['children'] = [_truncate(c, depth - 1) for c in children]
+    return node
+
+
+def select_tree_nodes(response, query):
+    """ The subtree of the root parameter, up to the depth parameter, like tranSMART. """
+    params = parse_qs(query)
+    root = params.get('root', [None])[0]
+    depth = int(params.get('depth', ['0'])[0])
+    nodes = response['tree_nodes']
+    if root is not None:
+        stack, nodes = list(nodes), []
+        while stack:
+            node = stack.pop()
+            if node['fullName'] == root:
+                nodes = [node]
+                break
+            stack.extend(node.get('children', []))
+    return {'tree_nodes': [_truncate(node, depth) for node in nodes]}
+
 
 class MockServerRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, like tranSMART and KeyCloak do.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
 
     def general(self, data):
+        # Consume the request body so the connection can be reused.
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            body = json.loads(body.decode('utf-8'))
+        else:
+            body = {}
+
+        handle, _, query = self.path.partition('?')
+        for constraint in parse_qs(query).get('constraint', []):
+            # tranSMART parses constraint parameters as JSON, and rejects anything else.
+            try:
+                json.loads(constraint)
+            except ValueError:
+                self.send_error(requests.codes.bad_request, 'Constraint is not JSON: {}'.format(constraint))
+                return
+        response = filter_hypercube(data[handle], body.get('constraint'))
+        if handle == '/v2/tree_nodes':
+            response = select_tree_nodes(response, query)
+        if self.headers.get('Accept') == PROTOBUF_MEDIA_TYPE:
+            content_type = PROTOBUF_MEDIA_TYPE
+            response_content = encode_hypercube(response)
+        else:
+            content_type = 'application/json; charset=utf-8'
+            response_content = json.dumps(response).encode('utf-8')
+
+        etag = '"{}"'.format(sha1(response_content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(requests.codes.not_modified)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
 
         # Process an HTTP GET request and return a response with an HTTP 200 status.
         self.send_response(requests.codes.ok)
 
         # Add response headers.
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Type', content_type)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(response_content)))
         self.end_headers()
 
         # Add response content.
-        handle = self.path.split('?')[0]
-        response_content = json.dumps(data[handle])
-        self.wfile.write(response_content.encode('utf-8'))
+        self.wfile.write(response_content)
+
+    def log_message(self, format, *args):
+        pass
 
     def do_GET(self):
         self.general(GET_JSON_RESPONSES)
@@ -45,7 +211,7 @@ def get_free_port():
     return port
 
 
-class TestServer(HTTPServer):
+class TestServer(ThreadingHTTPServer):
     def shutdown(self):
         self.socket.close()
         super().shutdown()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from transmart.api.instrumentation import RequestRecord
+from transmart.api.slow_query_log import SlowQueryLog, read_slow_query_log
+from transmart.api.utils.slow_query_replay import replay, format_report
+
+from tests.mock_server import TestMockServer, retry
+
+
+class SlowQueryLogTestCase(TestMockServer):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'slow.jsonl')
+        self.api.slow_query_log = SlowQueryLog(self.path, threshold=0)
+        self.api.instrumentation.on_parse_end(self.api.slow_query_log)
+
+    def tearDown(self):
+        self.api.instrumentation.hooks['on_parse_end'].remove(self.api.slow_query_log)
+        self.api.slow_query_log.close()
+        self.dir.cleanup()
+
+    @retry
+    def test_log_and_replay(self):
+        self.api.observations(concept='CV:DEM:AGE')
+        self.api.patients()
+
+        entries = list(read_slow_query_log(self.path))
+        self.assertEqual(['/v2/observations', '/v2/patients'], [e['endpoint'] for e in entries])
+        observations = entries[0]
+        self.assertEqual({'type': 'concept', 'conceptCode': 'CV:DEM:AGE'}, observations['constraint'])
+        self.assertEqual(2, observations['rows'])
+        self.assertGreater(observations['bytes_received'], 0)
+        self.assertIn('normalize', observations['stages'])
+        self.assertEqual(4, entries[1]['rows'])
+
+        results = replay(self.api, entries, concurrency=2)
+        self.assertEqual([None, None], [r['error'] for r in results])
+        self.assertEqual(observations['bytes_received'], results[0]['replayed_bytes'])
+        self.assertIn('median ratio', format_report(results))
+
+    def test_threshold_and_rotation(self):
+        log = SlowQueryLog(os.path.join(self.dir.name, 'rotating.jsonl'), threshold=0, max_bytes=2000)
+        with self.api.profile(file=False) as records:
+            for _ in range(10):
+                self.api.patients()
+        for record in records:
+            log(record)
+        log.threshold = 3600
+        log(records[0])
+        log.close()
+
+        self.assertTrue(os.path.exists(log.path + '.1'))
+        entries = list(read_slow_query_log(log.path))
+        self.assertEqual(10, len(entries))
+        self.assertEqual(sorted(e['started'] for e in entries), [e['started'] for e in entries])
+
+    def test_mutating_calls(self):
+        log = SlowQueryLog(os.path.join(self.dir.name, 'mutating.jsonl'), threshold=0)
+        for method, endpoint in (('POST', '/v2/patient_sets'), ('GET', '/v2/admin/system/clear_cache')):
+            record = RequestRecord(method, endpoint)
+            record.duration = 1.0
+            log(record)
+        log.close()
+        self.assertEqual([], list(read_slow_query_log(log.path)))
+
+        # Entries of older logs are not sent again.
+        entry = dict(endpoint='/v2/patient_sets', method='POST', params={'name': 'test'},
+                     body={'type': 'true'}, duration=1.0)
+        with mock.patch.object(self.api, '_request') as request:
+            results = replay(self.api, [entry])
+        request.assert_not_called()
+        self.assertTrue(results[0]['skipped'])
+        self.assertIn('1 of 1 calls skipped', format_report(results))
+
+
+if __name__ == '__main__':
+    unittest.main()
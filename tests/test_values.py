@@ -58,10 +58,88 @@ POST_JSON_RESPONSES = {
              'religion': None,
              'sex': 'MALE',
              'subjectIds': {"SUBJ_ID": "RINGO"},
-             'trial': 'CLINICAL_TRIAL'}]}
+             'trial': 'CLINICAL_TRIAL'}]},
+    '/v2/observations/counts_per_concept': {
+        'countsPerConcept': {
+            'CV:DEM:AGE': {'observationCount': 3, 'patientCount': 3},
+            'CV:DEM:SEX:M': {'observationCount': 4, 'patientCount': 2}}},
+    '/v2/observations': {
+        'dimensionDeclarations': [
+            {'name': 'study', 'dimensionType': 'attribute', 'sortIndex': None,
+             'valueType': None, 'fields': [{'name': 'name', 'type': 'String'}], 'inline': False},
+            {'name': 'concept', 'dimensionType': 'attribute', 'sortIndex': None,
+             'valueType': None, 'fields': [{'name': 'conceptPath', 'type': 'String'},
+                                           {'name': 'conceptCode', 'type': 'String'},
+                                           {'name': 'name', 'type': 'String'}], 'inline': False},
+            {'name': 'patient', 'dimensionType': 'subject', 'sortIndex': 1,
+             'valueType': None, 'fields': [{'name': 'id', 'type': 'Int'},
+                                           {'name': 'inTrialId', 'type': 'String'},
+                                           {'name': 'sex', 'type': 'String'}], 'inline': False},
+            {'name': 'trial visit', 'dimensionType': 'attribute', 'sortIndex': None,
+             'valueType': None, 'fields': [{'name': 'id', 'type': 'Int'},
+                                           {'name': 'relTimeLabel', 'type': 'String'}], 'inline': False},
+            {'name': 'start time', 'dimensionType': 'attribute', 'sortIndex': None,
+             'valueType': 'Timestamp', 'inline': True},
+        ],
+        'cells': [
+            {'inlineDimensions': ['2016-03-29T09:00:00Z'], 'dimensionIndexes': [0, 0, 0, 0],
+             'numericValue': 20},
+            {'inlineDimensions': [None], 'dimensionIndexes': [0, 0, 1, 0],
+             'numericValue': 26.5},
+            {'inlineDimensions': ['2016-03-29T10:30:00Z'], 'dimensionIndexes': [0, 1, 0, 1],
+             'stringValue': 'Female'},
+            {'inlineDimensions': [None], 'dimensionIndexes': [0, 1, 2, None],
+             'stringValue': 'Male'},
+        ],
+        'dimensionElements': {
+            'study': [{'name': 'CATEGORICAL_VALUES'}],
+            'concept': [
+                {'conceptPath': '\\Demographics\\Age\\', 'conceptCode': 'CV:DEM:AGE', 'name': 'Age'},
+                {'conceptPath': '\\Demographics\\Gender\\', 'conceptCode': 'CV:DEM:SEX', 'name': 'Gender'}],
+            'patient': [
+                {'id': -40, 'inTrialId': '3', 'sex': 'female'},
+                {'id': -50, 'inTrialId': '2', 'sex': 'male'},
+                {'id': -60, 'inTrialId': '1', 'sex': 'male'}],
+            'trial visit': [
+                {'id': -1, 'relTimeLabel': 'Baseline'},
+                {'id': -2, 'relTimeLabel': 'Week 1'}],
+        }},
 }
 
+TREE_NODES = {
+    'tree_nodes': [
+        {'name': 'Public Studies', 'fullName': '\\Public Studies\\', 'type': 'UNKNOWN',
+         'visualAttributes': ['FOLDER', 'ACTIVE'],
+         'children': [
+             {'name': 'CATEGORICAL_VALUES', 'fullName': '\\Public Studies\\CATEGORICAL_VALUES\\',
+              'type': 'STUDY', 'studyId': 'CATEGORICAL_VALUES',
+              'visualAttributes': ['FOLDER', 'ACTIVE', 'STUDY'],
+              'constraint': {'type': 'study_name', 'studyId': 'CATEGORICAL_VALUES'},
+              'children': [
+                  {'name': 'Demographics', 'fullName': '\\Public Studies\\CATEGORICAL_VALUES\\Demographics\\',
+                   'type': 'UNKNOWN', 'studyId': 'CATEGORICAL_VALUES', 'visualAttributes': ['FOLDER', 'ACTIVE'],
+                   'children': [
+                       {'name': 'Age',
+                        'fullName': '\\Public Studies\\CATEGORICAL_VALUES\\Demographics\\Age\\',
+                        'type': 'NUMERIC', 'studyId': 'CATEGORICAL_VALUES', 'conceptCode': 'CV:DEM:AGE',
+                        'conceptPath': '\\Demographics\\Age\\',
+                        'visualAttributes': ['LEAF', 'ACTIVE', 'NUMERICAL'],
+                        'constraint': {'type': 'concept', 'conceptCode': 'CV:DEM:AGE'}},
+                       {'name': 'Gender',
+                        'fullName': '\\Public Studies\\CATEGORICAL_VALUES\\Demographics\\Gender\\',
+                        'type': 'CATEGORICAL', 'studyId': 'CATEGORICAL_VALUES', 'conceptCode': 'CV:DEM:SEX',
+                        'conceptPath': '\\Demographics\\Gender\\',
+                        'visualAttributes': ['LEAF', 'ACTIVE', 'CATEGORICAL'],
+                        'constraint': {'type': 'concept', 'conceptCode': 'CV:DEM:SEX'}}]}]}]}]}
+
 GET_JSON_RESPONSES = {
+    '/v2/tree_nodes': TREE_NODES,
+    '/v2/pedigree/relation_types': {
+        'relationTypes': [
+            {'id': 1, 'label': 'PAR', 'description': 'Parent', 'symmetrical': False, 'biological': False},
+            {'id': 2, 'label': 'SPO', 'description': 'Spouse', 'symmetrical': True, 'biological': False}]},
+    '/v2/dimensions/concept/elements': {
+        'elements': POST_JSON_RESPONSES['/v2/observations']['dimensionElements']['concept']},
     '/v2/studies': {
         'studies': [
             {'bioExperimentId': -10,
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 
+import io
+import time
 import unittest
-from transmart.api.v2.api import TransmartV2
+
+import pandas as pd
+import pandas.testing as pdt
+from transmart.api.v2.api import TransmartV2, Query, CACHE_STEPS
+from transmart.api.v2.data_structures import ObservationStar
 
 from tests.mock_server import TestMockServer, retry
 
@@ -24,6 +30,130 @@ class V2TestCase(TestMockServer):
         self.assertEqual((9, 4), studies.dataframe.shape)
         self.assertEqual(9, len(self.api.studies))
 
+    @retry
+    def test_shared_transport(self):
+        self.assertIs(self.api.transport, self.api.auth.transport)
+        self.api.patients()
+        self.api.patients()
+        pool = self.api.transport.session.get_adapter(self.api.host).poolmanager
+        self.assertEqual(1, len(pool.pools))
+
+    @retry
+    def test_stream_observations(self):
+        expected = self.api.observations().dataframe
+        streamed = self.api.observations(stream=True)
+        self.assertIsNone(streamed.json)
+        self.assertEqual((4, 12), expected.shape)
+        pdt.assert_frame_equal(expected.sort_index(axis=1), streamed.dataframe.sort_index(axis=1))
+
+    @retry
+    def test_star_observations(self):
+        expected = self.api.observations().dataframe
+        for kwargs in ({}, {'stream': True}, {'format': 'protobuf'}):
+            star = self.api.observations(star=True, **kwargs)
+            self.assertIsInstance(star, ObservationStar)
+            self.assertEqual(4, len(star.facts))
+            pdt.assert_frame_equal(expected, star.dataframe)
+
+    @retry
+    def test_stream_holds_limiter_slot(self):
+        def in_flight():
+            return sum(m['in_flight'] for m in self.api.transport.metrics().values())
+
+        q = Query(handle='/v2/observations', method='POST', json={'type': 'clinical', 'constraint': {'type': 'true'}})
+        with self.api._request(q, stream=True) as r:
+            self.assertEqual(1, in_flight())
+            time.sleep(0.5)
+            r.content
+        self.assertEqual(0, in_flight())
+        self.api._request(q)
+        self.assertEqual(0, in_flight())
+
+        # The limit adapts to the time until the headers, not to reading the body.
+        limiter = self.api.transport.limiter('{}:{}'.format(self.host, self.mock_server_port))
+        self.assertLess(limiter._latencies[('POST', '/v2/observations')], 0.5)
+
+    @retry
+    def test_observation_batches(self):
+        expected = self.api.observations().dataframe.sort_index(axis=1)
+        for kwargs in ({}, {'stream': True}, {'format': 'protobuf'}):
+            batches = list(self.api.observations(rows=3, **kwargs))
+            self.assertEqual([3, 1], [len(batch) for batch in batches])
+            pdt.assert_frame_equal(expected, pd.concat(batches).sort_index(axis=1))
+
+    @retry
+    def test_protobuf_observations(self):
+        expected = self.api.observations().dataframe
+        observations = self.api.observations(format='protobuf')
+        pdt.assert_frame_equal(expected.sort_index(axis=1), observations.dataframe.sort_index(axis=1))
+        self.assertRaises(ValueError, self.api.observations, format='xml')
+
+    @retry
+    def test_sharded_observations(self):
+        def rows(frame):
+            frame = frame.sort_index(axis=1)
+            return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+        expected = rows(self.api.observations().dataframe)
+        for format in ('json', 'protobuf'):
+            sharded = self.api.sharded_observations(by='concept', format=format, processes=0)
+            self.assertIsNone(sharded.json)
+            pdt.assert_frame_equal(expected, rows(sharded.dataframe))
+
+        with self.api.profile(file=io.StringIO()) as records:
+            sharded = self.api.sharded_observations(by='concept', shards=1, processes=1)
+        pdt.assert_frame_equal(expected, rows(sharded.dataframe))
+        shards = [r for r in records if r.shard is not None]
+        self.assertEqual([('/v2/observations', 0)], [(r.endpoint, r.shard) for r in shards])
+        self.assertRaises(ValueError, self.api.sharded_observations, by='visit')
+
+    @retry
+    def test_batch(self):
+        constraints = [{'type': 'concept', 'conceptCode': str(i)} for i in range(20)]
+        result = self.api.batch('counts_per_concept', constraints, max_workers=4)
+        self.assertTrue(result.ok)
+        self.assertEqual(20, len(result))
+        self.assertEqual((40, 4), result.dataframe.shape)
+        self.assertEqual(list(range(20)), list(result.dataframe.constraint.unique()))
+
+        metrics = self.api.transport.metrics()['{}:{}'.format(self.host, self.mock_server_port)]
+        self.assertEqual((0, 0), (metrics['in_flight'], metrics['queue_depth']))
+        self.assertLessEqual(metrics['limit'], self.api.transport.max_concurrency)
+
+    def test_batch_errors(self):
+        def endpoint(constraint):
+            if constraint % 3 == 0:
+                raise ValueError(constraint)
+            return {'observationCount': constraint, 'patientCount': 1}
+
+        result = self.api.batch(endpoint, range(9), max_workers=3)
+        self.assertEqual([0, 3, 6], sorted(result.errors))
+        self.assertIsNone(result[3])
+        self.assertEqual(4, result[4]['observationCount'])
+        self.assertEqual([1, 2, 4, 5, 7, 8], list(result.dataframe.observationCount))
+        self.assertRaises(ValueError, result.raise_for_errors)
+
+
+class InteractiveV2TestCase(TestMockServer):
+    interactive = True
+
+    @retry
+    def test_build_cache(self):
+        self.assertEqual(9, len(self.api.studies))
+        self.assertIn('\\Public Studies\\CATEGORICAL_VALUES\\Demographics\\Age\\', self.api.tree_dict)
+        self.assertEqual('PAR', self.api.relation_types['Parent'])
+        self.assertEqual(['\\Public Studies\\CATEGORICAL_VALUES\\Demographics\\Gender\\'],
+                         self.api.search_tree_node('gender'))
+
+    @retry
+    def test_build_cache_progress(self):
+        calls = []
+        self.api.build_cache(progress=lambda *args: calls.append(args), wait=True)
+        self.assertEqual(sorted(CACHE_STEPS), sorted(step for step, _, _ in calls))
+        self.assertEqual([1, 2, 3, 4], [done for _, done, _ in calls])
+        self.assertEqual({4}, {total for _, _, total in calls})
+        self.assertIsNotNone(self.api.tree_dict)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from tests.mock_server import TestMockServer
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp not installed')
+class AsyncV2TestCase(TestMockServer):
+
+    def get_async_api(self):
+        from transmart.api.v2.async_api import AsyncTransmartV2
+        url = 'http://{}:{}'.format(self.host, self.mock_server_port)
+        return AsyncTransmartV2(host=url, kc_url=url, kc_realm='test',
+                                client_id='test', offline_token='offline token')
+
+    def test_concurrent_patients(self):
+        async def run():
+            async with self.get_async_api() as api:
+                # The token is fetched by the first query, not when connecting.
+                self.assertIsNone(api.auth._access_token)
+                return await asyncio.gather(*[api.patients() for _ in range(10)])
+
+        results = asyncio.run(run())
+        self.assertEqual(10, len(results))
+        for patients in results:
+            self.assertEqual((4, 11), patients.dataframe.shape)
+
+    def test_dimension_elements(self):
+        async def run():
+            async with self.get_async_api() as api:
+                return await api.dimension_elements('concept', constraint={'type': 'concept',
+                                                                           'conceptCode': 'CV:DEM:AGE'})
+
+        elements = asyncio.run(run())['elements']
+        self.assertIn('CV:DEM:AGE', [e['conceptCode'] for e in elements])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,18 @@
+import json
 import unittest
-from transmart.api.v2.data_structures import ObservationSet
+from transmart.api.v2.data_structures import ObservationSet, ObservationStar, _format_observations, \
+    compact_dtypes, memory_report
 import pandas as pd
 import pandas.testing as pdt
 
+from tests.mock_server import encode_hypercube
+from tests.test_values import POST_JSON_RESPONSES
+
+
+def chunked(data, size):
+    encoded = json.dumps(data).encode()
+    return (encoded[i:i + size] for i in range(0, len(encoded), size))
+
 
 class ObservationSetTestCase(unittest.TestCase):
 
@@ -79,3 +89,174 @@ class ObservationSetTestCase(unittest.TestCase):
             {'inline_dim1': 'inline_dim1 el1', 'dim1.name': 'dim1 el2', 'dim2.name': 'dim2 el1', 'stringValue': 'A'},
             {'inline_dim1': 'inline_dim1 el2', 'dim1.name': 'dim1 el1', 'dim2.name': 'dim2 el2', 'numericValue': 25},
         ]).sort_index(axis=1))
+
+    def test_matches_json_normalize(self):
+        response = json.loads(json.dumps(POST_JSON_RESPONSES['/v2/observations']))
+        response['cells'].insert(0, {'inlineDimensions': [None], 'dimensionIndexes': [0, 1, None],
+                                     'stringValue': 'Unknown'})
+        expected = pd.io.json.json_normalize(_format_observations(json.loads(json.dumps(response))))
+
+        pdt.assert_frame_equal(expected, ObservationSet(response).dataframe)
+        self.assertEqual((0, 0), ObservationSet(dict(response, cells=[])).dataframe.shape)
+
+    def test_null_values_and_heterogeneous_elements(self):
+        response = {
+            'dimensionDeclarations': [{'name': 'concept'}, {'name': 'patient'}, {'name': 'visit', 'inline': True}],
+            'dimensionElements': {
+                'concept': [{'conceptCode': 'A'}, {'conceptCode': 'B', 'unit': 'kg'},
+                            {'conceptCode': 'C', 'scale': 1.5, 'extra': {'note': 'never used'}}],
+                'patient': [{'id': 1, 'age': 30}, {'age': 40, 'id': 2, 'sex': None},
+                            {'id': 3, 'age': 'unknown'}],
+            },
+            'cells': [
+                {'dimensionIndexes': [0, 0], 'inlineDimensions': ['V1'], 'numericValue': None},
+                {'dimensionIndexes': [1, None], 'inlineDimensions': ['V2'], 'stringValue': None},
+                {'dimensionIndexes': [0, 1], 'inlineDimensions': [None], 'numericValue': 5},
+                {'dimensionIndexes': [1, 0], 'inlineDimensions': ['V1'], 'stringValue': 'x',
+                 'numericValue': None},
+            ],
+        }
+        expected = pd.io.json.json_normalize(_format_observations(json.loads(json.dumps(response))))
+        self.assertIn('numericValue', expected.columns)
+
+        pdt.assert_frame_equal(expected, ObservationSet(json.loads(json.dumps(response))).dataframe)
+        pdt.assert_frame_equal(expected, ObservationSet.from_stream(chunked(response, 16)).dataframe)
+
+    def test_star(self):
+        response = POST_JSON_RESPONSES['/v2/observations']
+        expected = ObservationSet(json.loads(json.dumps(response))).dataframe
+        star = ObservationStar.from_json(json.loads(json.dumps(response)))
+
+        self.assertEqual(['study', 'concept', 'patient', 'trial visit', 'start time', 'stringValue',
+                          'numericValue'], list(star.facts.columns))
+        self.assertEqual('int8', star.facts.patient.dtype)
+        self.assertEqual([0, 1, 0, 2], list(star.facts.patient))
+        self.assertEqual(-1, star.facts['trial visit'][3])
+        self.assertEqual((3, 3), star.dimensions['patient'].shape)
+        self.assertEqual(4, len(star))
+
+        pdt.assert_frame_equal(expected, star.dataframe)
+        self.assertEqual(['\\Demographics\\Age\\', '\\Demographics\\Gender\\'], list(star.all_concepts))
+        self.assertEqual(['CV:DEM:AGE', 'CV:DEM:AGE', 'CV:DEM:SEX', 'CV:DEM:SEX'],
+                         list(star.labels('concept', 'concept.conceptCode')))
+
+        joined = star.join('patient')
+        self.assertIn('concept', joined.columns)
+        self.assertNotIn('patient', joined.columns)
+        pdt.assert_series_equal(expected['patient.inTrialId'], joined['patient.inTrialId'])
+        self.assertRaises(ValueError, star.join, 'visit')
+
+        encoded = encode_hypercube(response)
+        pdt.assert_frame_equal(star.facts, ObservationStar.from_protobuf([encoded]).facts)
+        pdt.assert_frame_equal(star.facts, ObservationStar.from_stream(chunked(response, 64)).facts)
+
+    def test_star_empty(self):
+        response = {'dimensionDeclarations': [], 'cells': [], 'dimensionElements': {}}
+        star = ObservationStar.from_json(response)
+        self.assertEqual(0, len(star))
+        self.assertEqual((0, 0), star.dataframe.shape)
+
+    def test_lazy(self):
+        response = json.loads(json.dumps(POST_JSON_RESPONSES['/v2/observations']))
+        expected = ObservationSet(json.loads(json.dumps(response))).dataframe
+        observations = ObservationSet(response, keep_json=False)
+
+        self.assertEqual(4, len(observations))
+        self.assertEqual(['\\Demographics\\Age\\', '\\Demographics\\Gender\\'],
+                         list(observations.concepts))
+        self.assertEqual(['3', '2', '1'], list(observations.patients['patient.inTrialId']))
+        self.assertFalse(observations.decoded)
+        self.assertIs(response, observations.json)
+
+        selected = observations.select('patient.inTrialId', 'numericValue')
+        pdt.assert_frame_equal(expected.loc[:, ['patient.inTrialId', 'numericValue']], selected)
+        self.assertIsNone(observations.json)
+        self.assertFalse(observations.decoded)
+        self.assertRaises(ValueError, observations.select, 'visit.name')
+
+        pdt.assert_frame_equal(expected, observations.dataframe)
+        self.assertTrue(observations.decoded)
+        self.assertEqual(list(expected['concept.conceptPath'].unique()), list(observations.all_concepts))
+        pdt.assert_frame_equal(observations.patients, ObservationSet(response).patients)
+
+    def test_iter_batches(self):
+        response = POST_JSON_RESPONSES['/v2/observations']
+        observations = ObservationSet(json.loads(json.dumps(response)))
+        batches = list(observations.iter_batches(rows=3))
+
+        self.assertEqual([3, 1], [len(batch) for batch in batches])
+        self.assertFalse(observations.decoded)
+        pdt.assert_frame_equal(observations.dataframe, pd.concat(batches))
+        self.assertEqual([2, 2], [len(batch) for batch in observations.iter_batches(rows=2)])
+        self.assertRaises(ValueError, observations.iter_batches, 0)
+        for batch in ObservationSet(json.loads(json.dumps(response))).iter_batches(rows=1):
+            pdt.assert_series_equal(observations.dataframe.dtypes, batch.dtypes)
+
+        star = ObservationStar.from_json(json.loads(json.dumps(response)), dtypes='compact')
+        first, second = star.iter_batches(rows=2)
+        self.assertEqual(list(first['concept.conceptPath'].cat.categories),
+                         list(second['concept.conceptPath'].cat.categories))
+
+    def test_compact_dtypes(self):
+        response = POST_JSON_RESPONSES['/v2/observations']
+        expected = ObservationSet(json.loads(json.dumps(response))).dataframe
+        df = ObservationSet(json.loads(json.dumps(response)), dtypes='compact').dataframe
+
+        self.assertEqual(list(expected.columns), list(df.columns))
+        self.assertEqual('category', df['concept.conceptPath'].dtype.name)
+        self.assertEqual('float32', df['numericValue'].dtype.name)
+        self.assertEqual('datetime64[ns]', df['start time'].dtype.name)
+        self.assertEqual(list(expected['concept.conceptPath']), list(df['concept.conceptPath']))
+        pdt.assert_series_equal(expected['numericValue'], df['numericValue'].astype(float))
+        pdt.assert_series_equal(pd.to_datetime(expected['start time']).dt.tz_localize(None), df['start time'])
+
+        star = ObservationStar.from_protobuf([encode_hypercube(response)], dtypes='compact')
+        pdt.assert_frame_equal(df, star.dataframe)
+        self.assertEqual([2], list(star.dataframe.groupby('concept.conceptPath', observed=True).size().unique()))
+
+        self.assertRaises(ValueError, ObservationSet, response, dtypes='small')
+
+    def test_compact_column_types(self):
+        df = pd.DataFrame({'start time': ['2016-03-29T09:00:00Z', None],
+                           'code': ['a', 'a'],
+                           'name': ['a', 'b'],
+                           'count': [1, 2],
+                           'value': [0.1, 2]})
+        compact = compact_dtypes(df)
+        self.assertEqual(['datetime64[ns]', 'category', 'object', 'int8', 'float64'],
+                         list(compact.dtypes.astype(str)))
+        self.assertEqual(pd.Timestamp('2016-03-29 09:00'), compact['start time'][0])
+
+        report = memory_report(df, compact)
+        self.assertEqual('total', report.index[-1])
+        self.assertEqual('category', report.loc['code', 'compact dtype'])
+        self.assertGreater(report.loc['total', 'ratio'], 1)
+
+    def test_stream_matches_json(self):
+        response = POST_JSON_RESPONSES['/v2/observations']
+        expected = ObservationSet(json.loads(json.dumps(response))).dataframe.sort_index(axis=1)
+
+        for size in (1, 7, 1024):
+            df = ObservationSet.from_stream(chunked(response, size)).dataframe
+            pdt.assert_frame_equal(expected, df.sort_index(axis=1))
+
+    def test_stream_empty(self):
+        response = {'dimensionDeclarations': [], 'cells': [], 'dimensionElements': {}}
+        df = ObservationSet.from_stream(chunked(response, 3)).dataframe
+        self.assertEqual(df.size, 0)
+        self.assertEqual(len(df.columns), 0)
+
+    def test_protobuf_matches_json(self):
+        response = POST_JSON_RESPONSES['/v2/observations']
+        expected = ObservationSet(json.loads(json.dumps(response))).dataframe.sort_index(axis=1)
+        encoded = encode_hypercube(response)
+
+        for size in (1, 5, 4096):
+            chunks = (encoded[i:i + size] for i in range(0, len(encoded), size))
+            df = ObservationSet.from_protobuf(chunks).dataframe
+            pdt.assert_frame_equal(expected, df.sort_index(axis=1))
+
+    def test_protobuf_empty(self):
+        response = {'dimensionDeclarations': [], 'cells': [], 'dimensionElements': {}}
+        df = ObservationSet.from_protobuf([encode_hypercube(response)]).dataframe
+        self.assertEqual(df.size, 0)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+import pandas.testing as pdt
+
+from transmart.api.v2.export import pyarrow, check_export_format
+
+from tests.mock_server import TestMockServer, retry
+
+
+class ExportTestCase(TestMockServer):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @retry
+    def test_csv(self):
+        path = os.path.join(self.directory, 'observations.csv')
+        expected = self.api.observations().dataframe
+
+        for response_format in ('json', 'protobuf'):
+            self.assertEqual(4, self.api.export_observations(path=path, format='csv', rows=3,
+                                                             response_format=response_format))
+            exported = pd.read_csv(path)
+            self.assertEqual(sorted(expected.columns), sorted(exported.columns))
+            self.assertEqual(list(expected['concept.conceptPath']), list(exported['concept.conceptPath']))
+            pdt.assert_series_equal(expected['numericValue'], exported['numericValue'])
+
+        self.assertRaises(ValueError, self.api.export_observations, path=path, format='xlsx')
+        self.assertRaises(ValueError, self.api.export_observations, format='csv')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow not installed')
+    @retry
+    def test_parquet_and_feather(self):
+        expected = self.api.observations(dtypes='compact').dataframe
+        for format, read in (('parquet', pd.read_parquet), ('feather', pd.read_feather)):
+            path = os.path.join(self.directory, 'observations.' + format)
+            self.assertEqual(4, self.api.export_observations(path=path, format=format, rows=3))
+            exported = read(path)
+            self.assertEqual('category', exported['concept.conceptPath'].dtype.name)
+            pdt.assert_frame_equal(expected, exported, check_dtype=False, check_categorical=False)
+
+    @unittest.skipIf(pyarrow is not None, 'pyarrow installed')
+    def test_requires_pyarrow(self):
+        self.assertRaises(ImportError, check_export_format, 'parquet')
+        check_export_format('csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from transmart.api.v2.lazy_tree import LazyTree
+
+from tests.mock_server import TestMockServer, retry
+
+STUDY = '\\Public Studies\\CATEGORICAL_VALUES\\'
+DEMOGRAPHICS = STUDY + 'Demographics\\'
+AGE = DEMOGRAPHICS + 'Age\\'
+GENDER = DEMOGRAPHICS + 'Gender\\'
+
+
+class LazyTreeTestCase(TestMockServer):
+
+    @retry
+    def test_top_levels(self):
+        tree = LazyTree(self.api, depth=2, prefetch=0)
+        self.assertEqual([STUDY], list(tree))
+        self.assertEqual({STUDY}, tree.unexpanded)
+        self.assertEqual('CATEGORICAL_VALUES', tree[STUDY]['studyId'])
+
+    @retry
+    def test_load_path(self):
+        tree = LazyTree(self.api, depth=2, prefetch=0)
+        self.assertEqual('CV:DEM:AGE', tree[AGE]['conceptCode'])
+        self.assertEqual({STUDY, AGE, GENDER}, set(tree))
+        self.assertEqual(set(), tree.unexpanded)
+        self.assertEqual([AGE, GENDER], tree.children(DEMOGRAPHICS))
+        self.assertIsNone(tree.get(DEMOGRAPHICS + 'Weight\\'))
+
+    @retry
+    def test_empty_subtree(self):
+        tree = LazyTree(self.api, depth=2, prefetch=0)
+        unknown = '\\Unknown\\'
+        self.assertEqual({}, self.api.tree_nodes(root=unknown).tree_dict)
+        self.assertEqual([], tree._load(unknown))
+        self.assertEqual([], tree.children(unknown))
+        self.assertEqual([STUDY], list(tree))
+
+    @retry
+    def test_prefetch(self):
+        loaded = []
+        tree = LazyTree(self.api, depth=2, prefetch=0)
+        tree.on_load(lambda nodes: loaded.extend(nodes))
+        for future in tree.prefetch([STUDY, AGE]):
+            future.result()
+        self.assertEqual({DEMOGRAPHICS}, tree.unexpanded)
+        self.assertEqual([], loaded)
+
+        tree.load_all()
+        self.assertEqual([AGE, GENDER], sorted(loaded))
+        self.assertRaises(ValueError, LazyTree, self.api, depth=0)
+
+    @retry
+    def test_lazy_build_cache(self):
+        self.api.lazy_tree = 2
+        try:
+            self.api.build_cache(wait=True)
+            self.assertIsInstance(self.api.tree_dict, LazyTree)
+            self.api.tree_dict.load_all()
+            self.assertEqual([GENDER], self.api.search_tree_node('gender'))
+        finally:
+            self.api.lazy_tree = False
+
+
+if __name__ == '__main__':
+    unittest.main()
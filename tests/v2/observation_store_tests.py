@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas.testing as pdt
+
+import transmart
+from transmart.api.v2.data_structures import ObservationSet
+from transmart.api.v2.observation_store import ObservationStore, QUERY_COLUMNS
+
+from tests.test_values import POST_JSON_RESPONSES
+
+AGE = 'CV:DEM:AGE'
+
+
+def observation_set(**kwargs):
+    return ObservationSet(json.loads(json.dumps(POST_JSON_RESPONSES['/v2/observations'])), **kwargs)
+
+
+class ObservationStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reopen(self):
+        store = ObservationStore(self.directory)
+        self.assertTrue(store.add(observation_set(keep_json=False)))
+        self.assertFalse(store.add(observation_set()))
+
+        store = ObservationStore(self.directory)
+        self.assertEqual(4, len(store))
+        self.assertIsInstance(store._segments[0].facts['patient'].values, np.memmap)
+        pdt.assert_frame_equal(observation_set().dataframe, store.observations().dataframe)
+
+        age = store.observations(concept=AGE)
+        self.assertEqual([AGE, AGE], list(age.dataframe['concept.conceptCode']))
+        self.assertEqual(0, len(store.observations(study='OTHER_STUDY').dataframe))
+
+        other = json.loads(json.dumps(POST_JSON_RESPONSES['/v2/observations']))
+        other['dimensionElements']['study'] = [{'name': 'OTHER_STUDY'}]
+        self.assertTrue(store.add(ObservationSet(other)))
+        store = ObservationStore(self.directory)
+        self.assertEqual(8, len(store))
+        self.assertEqual(8, len(store.observations().dataframe))
+        self.assertEqual([0, 4], list(store.query(concept=AGE, subject=store.data['patient.id'][0]).index))
+        self.assertEqual(['OTHER_STUDY'] * 4, list(store.observations(study='OTHER_STUDY').dataframe['study.name']))
+
+    def test_compact(self):
+        store = ObservationStore(self.directory)
+        store.add(observation_set(), dtypes='compact')
+        expected = observation_set(dtypes='compact').dataframe
+        pdt.assert_frame_equal(expected, ObservationStore(self.directory).observations().dataframe)
+        self.assertRaises(ValueError, store.add, observation_set().dataframe)
+
+    @unittest.skipIf(transmart.dependency_mode != 'FULL', 'dashboard dependencies not installed')
+    def test_hypercube_query(self):
+        from transmart.api.v2.dashboard.hypercube import Hypercube, dimensions
+        self.assertEqual(dimensions, QUERY_COLUMNS)
+
+        hypercube = Hypercube()
+        hypercube.add_variable(observation_set().dataframe)
+        store = ObservationStore(self.directory)
+        store.add(observation_set())
+
+        self.assertEqual(hypercube.total_subjects, store.total_subjects)
+        for constraint in ({'concept': AGE}, {'study': 'CATEGORICAL_VALUES', 'concept': [AGE, 'CV:DEM:SEX']}):
+            pdt.assert_frame_equal(hypercube.query(**constraint), store.query(**constraint), check_dtype=False)
+
+        subjects = set(hypercube.data['patient.id'][:1])
+        hypercube.subject_mask = subjects
+        store.subject_mask = subjects
+        pdt.assert_frame_equal(hypercube.query(concept=AGE), store.query(concept=AGE), check_dtype=False)
+        pdt.assert_frame_equal(hypercube.query(concept=AGE, no_filter=True),
+                               store.query(concept=AGE, no_filter=True), check_dtype=False)
+        self.assertEqual(1, len(store.query(concept=AGE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
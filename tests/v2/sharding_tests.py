@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from transmart.api.v2 import sharding
+
+
+class ShardingTestCase(unittest.TestCase):
+
+    def test_partition(self):
+        self.assertEqual([[1, 2], [3, 4], [5]], sharding.partition([1, 2, 3, 4, 5], 3))
+        self.assertEqual([[1], [2]], sharding.partition([1, 2], 5))
+        self.assertEqual([], sharding.partition([], 2))
+
+    def test_element_shards(self):
+        elements = [{'conceptCode': 'A'}, {'conceptCode': 'B'}, {'conceptCode': 'C'}]
+        self.assertEqual(3, len(sharding.concept_shards(elements)))
+        grouped = sharding.concept_shards(elements, 2)
+        self.assertEqual('or', grouped[0]['type'])
+        self.assertEqual({'type': 'concept', 'conceptCode': 'C'}, grouped[1])
+
+    def test_start_time_shards(self):
+        shards = sharding.start_time_shards(['2017-01-01', '2016-01-01', '2017-01-01'])
+        self.assertEqual(['<-', '<-->', '->'], [s['operator'] for s in shards[:3]])
+        self.assertEqual(['2015-12-31T23:59:59+00:00'], shards[0]['values'])
+        self.assertEqual(['2016-01-01T00:00:00+00:00', '2016-12-31T23:59:59+00:00'], shards[1]['values'])
+        self.assertEqual(['2017-01-01T00:00:00+00:00'], shards[2]['values'])
+        self.assertEqual({'type': 'negation', 'arg': {'type': 'or', 'args': shards[:3]}}, shards[3])
+        self.assertRaises(ValueError, sharding.start_time_shards, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
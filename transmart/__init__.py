@@ -7,6 +7,7 @@
 
 # flake8: noqa
 
+from importlib.util import find_spec
 from itertools import chain
 import logging
 logger = logging.getLogger('tm-api')
@@ -18,10 +19,12 @@ full = ("whoosh", "ipywidgets", "IPython", "bqplot")
 
 missing_dependencies = set()
 
+# Only look the modules up, importing them would take seconds.
 for dependency in chain(minimal, backend, full):
     try:
-        __import__(dependency)
-    except ImportError as e:
+        if find_spec(dependency) is None:
+            missing_dependencies.add(dependency)
+    except (ImportError, ValueError):
         missing_dependencies.add(dependency)
 
 if missing_dependencies:
@@ -42,7 +45,7 @@ else:
     dependency_mode = 'FULL'
 
 del (minimal, backend, full, _hard, missing_dependencies,
-     chain, dependency, logging)
+     chain, find_spec, dependency, logging)
 
 from .main import get_api
 
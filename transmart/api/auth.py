@@ -1,19 +1,31 @@
 import abc
+import asyncio
 import jwt
-import requests
+import logging
+import threading
 import time
 from getpass import getpass
 
+from .token_cache import TokenCache
+from .transport import Transport
+
+logger = logging.getLogger('tm-api')
+
 
 class Authenticator(metaclass=abc.ABCMeta):
 
-    def __init__(self, url, offline_token=None, realm=None, client_id=None):
+    def __init__(self, url, offline_token=None, realm=None, client_id=None, transport=None, fetch_token=True):
+        """
+        :param fetch_token: get a token right away, if False only when it is first used.
+        """
         self.url = url
         self.offline_token = offline_token
         self.realm = realm
         self.client_id = client_id or self._default_client_id
+        self.transport = transport or Transport()
         self._access_token = None
-        self.get_token()
+        if fetch_token:
+            self.get_token()
 
     @property
     @abc.abstractmethod
@@ -33,17 +45,26 @@ class Authenticator(metaclass=abc.ABCMeta):
     def refresh(self):
         pass
 
+    async def access_token_async(self, session):
+        """
+        Access token for use in asyncio code. Authenticators that cannot
+        refresh asynchronously get the blocking access_token in a thread.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: self.access_token)
+
 
 class LegacyAuth(Authenticator):
     _default_client_id = 'glowingbear-js'
 
     @property
     def access_token(self):
-        return self.get_token
+        if self._access_token is None:
+            self.get_token()
+        return self._access_token
 
     def get_token(self):
         user = input('Username: ')
-        r = requests.post(
+        r = self.transport.post(
             "{}/oauth/token".format(self.url),
             params=dict(
                 grant_type='password',
@@ -66,9 +87,22 @@ class LegacyAuth(Authenticator):
 class KeyCloakAuth(Authenticator):
     _default_client_id = 'transmart-client'
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def __init__(self, *args, renewal=None, token_cache=None, **kwargs):
+        """
+        :param renewal: fraction of the token lifetime after which the token
+            is renewed in a background thread, e.g. 0.75, so requests never
+            wait for a token. None (default) refreshes when a request needs it.
+        :param token_cache: True or a TokenCache to share access tokens with
+            other processes through the disk. Requires an offline token.
+        """
+        if renewal is not None and not 0 < renewal < 1:
+            raise ValueError('Renewal must be a fraction between 0 and 1, got {!r}.'.format(renewal))
         self.expiry = None
+        self.renewal = renewal
+        self.token_cache = TokenCache() if token_cache is True else token_cache or None
+        self._lock = threading.Lock()
+        self._timer = None
+        super().__init__(*args, **kwargs)
 
     @property
     def handle(self):
@@ -77,7 +111,10 @@ class KeyCloakAuth(Authenticator):
     @property
     def access_token(self):
         if not self.has_valid_token():
-            self.get_token()
+            # Only one thread refreshes, the others wait for and reuse its token.
+            with self._lock:
+                if not self.has_valid_token():
+                    self.get_token()
 
         return self._access_token
 
@@ -88,30 +125,124 @@ class KeyCloakAuth(Authenticator):
             return True
         return False
 
-    def get_token(self):
+    def _token_request_data(self):
         offline_token = self.offline_token or input('Offline token: ')
-        r = requests.post(
+        return dict(
+            grant_type='refresh_token',
+            refresh_token=offline_token,
+            client_id=self.client_id,
+            scope='offline_access',
+        )
+
+    @staticmethod
+    def _decode(access_token):
+        return jwt.decode(access_token, options={'verify_signature': False})
+
+    def _set_token(self, json):
+        self._access_token = json.get('access_token')
+        contents = self._decode(self._access_token)
+        self.expiry = contents.get('exp', None)
+        self._schedule_renewal(contents.get('iat'))
+
+    def _is_newer(self, json):
+        """ Whether a cached token is valid and expires later than the current one. """
+        try:
+            expiry = self._decode(json['access_token']).get('exp')
+        except (KeyError, jwt.InvalidTokenError):
+            return False
+        return expiry is not None and expiry > time.time() + 10 and expiry > (self.expiry or 0)
+
+    def _schedule_renewal(self, issued=None):
+        if self.renewal is None or self.expiry is None:
+            return
+
+        now = time.time()
+        lifetime = self.expiry - (issued or now)
+        # Renew before requests would refresh the token themselves, 10 seconds before expiry.
+        delay = min(self.renewal * lifetime, self.expiry - now - 10)
+
+        self.stop_renewal()
+        if delay < 1:
+            logger.debug('Token lifetime too short for background renewal.')
+            return
+        self._timer = threading.Timer(delay, self._renew)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _renew(self):
+        try:
+            with self._lock:
+                self.get_token()
+        except Exception as e:
+            # The next request refreshes the token instead.
+            logger.warning('Background token renewal failed: {!r}'.format(e))
+
+    def start_renewal(self, fraction=0.75):
+        """ Renew the token in a background thread after fraction of its lifetime. """
+        self.renewal = fraction
+        self._schedule_renewal()
+
+    def stop_renewal(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _request_token(self):
+        r = self.transport.post(
             url=self.handle,
-            data=dict(
-                grant_type='refresh_token',
-                refresh_token=offline_token,
-                client_id=self.client_id,
-                scope='offline_access',
-            )
+            data=self._token_request_data()
         )
 
         if not r.ok:
             r.raise_for_status()
 
-        self._access_token = r.json().get('access_token')
-        contents = jwt.decode(self._access_token, options={'verify_signature': False})
-        self.expiry = contents.get('exp', None)
+        return r.json()
+
+    def get_token(self):
+        if self.token_cache is None or not self.offline_token:
+            self._set_token(self._request_token())
+            return
+
+        # Other processes wait while one refreshes, and then reuse its token.
+        key = self.token_cache.key(self.url, self.realm, self.client_id, self.offline_token)
+        with self.token_cache.lock(key):
+            cached = self.token_cache.get(key)
+            if cached is not None and self._is_newer(cached):
+                self._set_token(cached)
+                return
+
+            token = self._request_token()
+            self._set_token(token)
+            self.token_cache.put(key, token)
+
+    async def get_token_async(self, session):
+        """ Same as get_token() without a token cache, but using an aiohttp.ClientSession. """
+        async with session.post(self.handle, data=self._token_request_data()) as r:
+            r.raise_for_status()
+            self._set_token(await r.json(content_type=None))
+
+    async def access_token_async(self, session):
+        """
+        Access token for use in asyncio code. Callers in one event loop should
+        hold an asyncio.Lock, so only one of them refreshes the token.
+        """
+        if self.has_valid_token():
+            return self._access_token
+        if self.token_cache is not None and self.offline_token:
+            # The token cache waits for a lock shared with other processes, so
+            # refresh the blocking way in a thread, like access_token does.
+            return await super().access_token_async(session)
+
+        await self.get_token_async(session)
+        return self._access_token
 
     def refresh(self):
-        self.get_token()
+        with self._lock:
+            self.get_token()
 
 
-def get_auth(host, offline_token=None, kc_url=None, kc_realm=None, client_id=None) -> Authenticator:
+def get_auth(host, offline_token=None, kc_url=None, kc_realm=None, client_id=None,
+             transport=None, token_renewal=None, token_cache=None, fetch_token=True) -> Authenticator:
     """
     Returns appropriate authenticator depending on the provided parameter.
     If kc_url is provided returns the KeyCloakAuth, else LegacyAuth.
@@ -121,6 +252,12 @@ def get_auth(host, offline_token=None, kc_url=None, kc_realm=None, client_id=Non
     :param kc_url: KeyCloak hostname (e.g. https://keycloak-test.thehyve.net)
     :param kc_realm: Realm that is registered for the transmart api host to listen.
     :param client_id: client id in keycloak.
+    :param transport: Transport used for token requests.
+    :param token_renewal: fraction of the token lifetime after which KeyCloak
+        tokens are renewed in the background, None to renew when needed.
+    :param token_cache: True or a TokenCache to share KeyCloak access tokens
+        between processes through the disk.
+    :param fetch_token: get a token right away, if False only when it is first used.
     :return: Authenticator
     """
 
@@ -128,6 +265,10 @@ def get_auth(host, offline_token=None, kc_url=None, kc_realm=None, client_id=Non
         return KeyCloakAuth(url=kc_url,
                             realm=kc_realm,
                             offline_token=offline_token,
-                            client_id=client_id)
+                            client_id=client_id,
+                            transport=transport,
+                            renewal=token_renewal,
+                            token_cache=token_cache,
+                            fetch_token=fetch_token)
     else:
-        return LegacyAuth(host, client_id)
+        return LegacyAuth(host, client_id, transport=transport, fetch_token=fetch_token)
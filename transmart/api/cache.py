@@ -0,0 +1,288 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+
+logger = logging.getLogger('tm-api')
+
+user = os.path.expanduser('~')
+cache_dir = os.path.join(user, '.transmart-api-cache', 'responses')
+
+# Seconds a cached response is used without asking the server, by handle prefix.
+# Zero stores the response, but revalidates it on every use. None disables caching.
+DEFAULT_TTLS = {
+    '/v2/studies': 3600,
+    '/v2/tree_nodes': 3600,
+    '/v2/pedigree/relation_types': 24 * 3600,
+    '/v2/supported_fields': 24 * 3600,
+    '/v2/concepts': 3600,
+    '/v2/observations': 600,
+    '/v2/patients': 600,
+    '/v2/dimensions': 600,
+    '/v2/patient_sets': None,
+    '/v2/admin': None,
+}
+DEFAULT_TTL = 600
+DEFAULT_MAX_SIZE = 512 * 2 ** 20
+
+_MISSING = object()
+
+
+def _canonical_constraint(value):
+    if isinstance(value, dict):
+        value = {k: _canonical_constraint(v) for k, v in value.items()}
+        if value.get('type') in ('and', 'or') and isinstance(value.get('args'), list):
+            value['args'] = sorted(value['args'], key=lambda arg: json.dumps(arg, sort_keys=True, default=str))
+        return value
+    if isinstance(value, list):
+        return [_canonical_constraint(item) for item in value]
+    return value
+
+
+def get_constraint_identity(constraint):
+    """
+    Calculate a single sha1 for a constraint dictionary, that does not depend
+    on the ordering of keys, nor on the ordering of arguments of and/or groups.
+    """
+    canonical = json.dumps(_canonical_constraint(constraint), sort_keys=True,
+                           separators=(',', ':'), default=str)
+    return sha1(canonical.encode()).hexdigest()
+
+
+def clear_cache():
+    print('Removing cached responses at: {!r}'.format(cache_dir))
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+class CacheStats:
+    """ Hit and miss counters of a ResponseCache. """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self):
+        return ('{}(hits={}, misses={}, revalidated={}, stores={}, evictions={}, hit_rate={:.1%})'
+                .format(self.__class__.__name__, self.hits, self.misses, self.revalidated,
+                        self.stores, self.evictions, self.hit_rate))
+
+
+class CacheEntry:
+
+    def __init__(self, path, meta, body):
+        self.path = path
+        self.etag = meta.get('etag')
+        self.stored = meta.get('stored', 0)
+        self.ttl = meta.get('ttl', 0)
+        self.body = body
+
+    @property
+    def fresh(self):
+        return time.time() < self.stored + self.ttl
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of JSON responses, stored gzip compressed in
+    ~/.transmart-api-cache/responses. Entries expire after a time-to-live
+    per endpoint, after which they are revalidated with the server using
+    their ETag where possible. When the cache grows beyond max_size, the
+    least recently used entries are removed.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE, ttls=None, default_ttl=DEFAULT_TTL):
+        """
+        :param directory: where to store responses, defaults to ~/.transmart-api-cache/responses.
+        :param max_size: maximum total size in bytes of the compressed responses.
+        :param ttls: dictionary of handle prefix to time-to-live in seconds, updating
+            DEFAULT_TTLS. Use 0 to always revalidate, or None to never cache a handle.
+        :param default_ttl: time-to-live for handles not matching any prefix.
+        """
+        self.directory = directory or cache_dir
+        self.max_size = max_size
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return '{}({!r}, {})'.format(self.__class__.__name__, self.directory, self.stats)
+
+    def record(self, event):
+        """ Count a cache event: 'hits', 'misses' or 'revalidated'. """
+        with self._lock:
+            setattr(self.stats, event, getattr(self.stats, event) + 1)
+
+    def ttl(self, handle):
+        """ Time-to-live for a handle, the longest matching prefix wins. """
+        matches = [prefix for prefix in self.ttls if handle.startswith(prefix)]
+        if not matches:
+            return self.default_ttl
+        return self.ttls[max(matches, key=len)]
+
+    def cacheable(self, handle):
+        return self.ttl(handle) is not None
+
+    @staticmethod
+    def key(*parts):
+        """ Canonical hash of the request, see get_constraint_identity. """
+        return get_constraint_identity(list(parts))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.gz')
+
+    def get(self, key):
+        """ Return the CacheEntry for key, or None if it is not cached. """
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rb') as f:
+                meta = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+        except (OSError, EOFError, ValueError):
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return CacheEntry(path, meta, body)
+
+    def put(self, key, handle, body, etag=None):
+        """ Store the raw response body for key. """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = dict(handle=handle, etag=etag, stored=time.time(), ttl=self.ttl(handle))
+
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write(json.dumps(meta).encode('utf-8') + b'\n')
+            f.write(body)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.stats.stores += 1
+            if self._size is not None:
+                self._size += os.path.getsize(path) - replaced
+
+        self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.gz'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            if self._size <= self.max_size:
+                return
+
+            for _, size, path in sorted(self._entries()):
+                if self._size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._size -= size
+                self.stats.evictions += 1
+                logger.debug('Evicted cached response {!r}.'.format(path))
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._size = 0
+
+
+class MemoryCache:
+    """
+    Bounded, thread-safe in-process LRU cache where entries expire after a
+    time-to-live. Values are returned as stored, so do not modify them.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        """
+        :param maxsize: maximum number of entries kept.
+        :param ttl: seconds after which an entry expires, None to never expire.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '{}({}/{} entries, {})'.format(self.__class__.__name__, len(self), self.maxsize, self.stats)
+
+    def get(self, key, default=None):
+        with self._lock:
+            stored, value = self._data.get(key, (None, _MISSING))
+            if value is _MISSING or (self.ttl is not None and time.monotonic() > stored + self.ttl):
+                self._data.pop(key, None)
+                self.stats.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            self.stats.stores += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def get_or_call(self, key, func):
+        """ Return the cached value for key, or call func and cache its result. """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
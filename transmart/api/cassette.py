@@ -0,0 +1,219 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import base64
+import gzip
+import io
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from hashlib import sha1
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import jwt
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .transport import Transport
+
+SCRUBBED = 'scrubbed'
+# Form fields and JSON response members holding credentials.
+SECRET_FIELDS = ('refresh_token', 'access_token', 'id_token', 'password', 'client_secret')
+# Response headers that no longer apply to the decoded body that is stored.
+DROPPED_HEADERS = ('Content-Encoding', 'Transfer-Encoding', 'Content-Length', 'Set-Cookie')
+
+# A decodable token without credentials, that does not expire during replay.
+# It is signed with a public key of the length HS256 asks for, not a secret.
+SCRUBBED_KEY = SCRUBBED.ljust(32, '-')
+SCRUBBED_TOKEN = jwt.encode({'sub': SCRUBBED, 'exp': 2 ** 32}, SCRUBBED_KEY, algorithm='HS256')
+if isinstance(SCRUBBED_TOKEN, bytes):
+    SCRUBBED_TOKEN = SCRUBBED_TOKEN.decode()
+
+
+class UnrecordedRequest(Exception):
+    pass
+
+
+def _scrub_body(body):
+    """ Request body without credentials, for form encoded token requests. """
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    try:
+        fields = parse_qsl(body.decode('utf-8'), keep_blank_values=True, strict_parsing=True)
+    except ValueError:
+        return body
+    return urlencode([(k, SCRUBBED if k in SECRET_FIELDS else v) for k, v in fields]).encode('utf-8')
+
+
+def _scrub_response(body):
+    """ Replace tokens in JSON token responses. """
+    try:
+        content = json.loads(body.decode('utf-8'))
+    except ValueError:
+        return body
+    if not isinstance(content, dict) or not any(k in content for k in SECRET_FIELDS):
+        return body
+    content.update({k: SCRUBBED_TOKEN for k in SECRET_FIELDS if k in content})
+    return json.dumps(content).encode('utf-8')
+
+
+def request_key(method, url, body=None):
+    """
+    Identify a request by method, path, sorted query parameters and the
+    hash of its scrubbed body, so requests match regardless of the host
+    and credentials used.
+    """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return '{} {}?{} {}'.format(method.upper(), parts.path, query, sha1(_scrub_body(body)).hexdigest())
+
+
+class Cassette:
+    """
+    Recorded request and response pairs, saved as a gzip compressed file
+    with one JSON interaction per line. Credentials are scrubbed: the
+    Authorization header is not stored, and tokens in request and response
+    bodies are replaced.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.interactions = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.interactions)
+
+    def __repr__(self):
+        return '{}({!r}, {} interactions)'.format(self.__class__.__name__, self.path, len(self))
+
+    @classmethod
+    def load(cls, path):
+        cassette = cls(path)
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            cassette.interactions = [json.loads(line) for line in f if line.strip()]
+        return cassette
+
+    def save(self, path=None):
+        self.path = path or self.path
+        with self._lock, gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            for interaction in self.interactions:
+                f.write(json.dumps(interaction) + '\n')
+
+    def add(self, method, url, request_body, status, headers, body, elapsed):
+        """
+        Add an interaction.
+
+        :param method: HTTP method of the request.
+        :param url: full url of the request, including query parameters.
+        :param request_body: bytes sent, None for no body.
+        :param status: response status code.
+        :param headers: response headers.
+        :param body: decoded response body as bytes.
+        :param elapsed: seconds until the response was received.
+        """
+        headers = {k: v for k, v in headers.items() if k not in DROPPED_HEADERS}
+        interaction = dict(key=request_key(method, url, request_body),
+                           method=method.upper(),
+                           path=urlsplit(url).path,
+                           status=status,
+                           headers=headers,
+                           body=base64.b64encode(_scrub_response(body)).decode('ascii'),
+                           elapsed=elapsed)
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def responses(self):
+        """ Interactions per request key, in recorded order. """
+        responses = defaultdict(list)
+        for interaction in self.interactions:
+            responses[interaction['key']].append(interaction)
+        return responses
+
+
+class RecordingTransport(Transport):
+    """
+    Transport that sends requests to the server as usual, and records
+    every request and response in a Cassette. Call save(), or close()
+    the transport, to write the cassette.
+    """
+
+    def __init__(self, path, **kwargs):
+        """
+        :param path: file to save the cassette to.
+        :param kwargs: see Transport.
+        """
+        super().__init__(**kwargs)
+        self.cassette = Cassette(path)
+
+    def request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        r = super().request(method, url, **kwargs)
+        body = r.content
+        self.cassette.add(method, r.request.url, r.request.body, r.status_code, r.headers, body,
+                          time.perf_counter() - start)
+        return r
+
+    def save(self):
+        self.cassette.save()
+
+    def close(self):
+        self.save()
+        super().close()
+
+
+class ReplayTransport(Transport):
+    """
+    Transport that answers requests from a Cassette in-process, without
+    network access. Identical requests get their recorded responses in
+    order, the last one is repeated when they run out.
+    """
+
+    def __init__(self, cassette, latency=False, **kwargs):
+        """
+        :param cassette: Cassette, or path of a saved cassette.
+        :param latency: if True, wait as long as the recorded request took,
+            otherwise respond immediately.
+        :param kwargs: see Transport.
+        """
+        super().__init__(**kwargs)
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette.load(cassette)
+        self.latency = latency
+        self._responses = self.cassette.responses()
+        self._played = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, data=None, json=None, headers=None, **kwargs):
+        prepared = requests.Request(method.upper(), url, params=params, data=data,
+                                    json=json, headers=headers).prepare()
+        key = request_key(prepared.method, prepared.url, prepared.body)
+
+        with self._lock:
+            recorded = self._responses.get(key)
+            if not recorded:
+                raise UnrecordedRequest('No response recorded for {}'.format(key))
+            interaction = recorded[min(self._played[key], len(recorded) - 1)]
+            self._played[key] += 1
+
+        if self.latency:
+            time.sleep(interaction['elapsed'])
+
+        body = base64.b64decode(interaction['body'])
+        r = requests.Response()
+        r.status_code = interaction['status']
+        r.headers = CaseInsensitiveDict(interaction['headers'])
+        r.headers['Content-Length'] = str(len(body))
+        r.raw = io.BytesIO(body)
+        r._content = body
+        r._content_consumed = True
+        r.url = prepared.url
+        r.request = prepared
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.elapsed = timedelta(seconds=interaction['elapsed'] if self.latency else 0)
+        return r
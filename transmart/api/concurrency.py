@@ -0,0 +1,214 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import threading
+import time
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs the
+    call, callers arriving while it is in flight wait for and share its
+    result (or exception) instead of running it again.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.deduplicated = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{}(calls={}, deduplicated={})'.format(self.__class__.__name__, self.calls, self.deduplicated)
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def do(self, key, func):
+        """ Call func, unless a call for key is already in flight, then wait for its result. """
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+
+class TokenBucket:
+    """
+    Client side rate limit: allows `rate` requests per second on average,
+    with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: number of tokens added per second.
+        :param burst: maximum number of tokens saved up, defaults to rate.
+        """
+        if rate <= 0:
+            raise ValueError('Rate must be positive, got {!r}.'.format(rate))
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{}(rate={}, burst={})'.format(self.__class__.__name__, self.rate, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """ Take a token, sleeping until one is available. Returns the seconds waited. """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of concurrent requests to a host using additive
+    increase, multiplicative decrease (AIMD): the limit grows by one for
+    every `limit` successful responses, and is cut by `backoff` when the
+    server returns an error or responds much slower than usual for the
+    same endpoint. Requests exceeding the limit wait in a queue.
+    """
+
+    def __init__(self, max_limit=10, min_limit=1, initial_limit=None,
+                 backoff=0.7, tolerance=2.5, smoothing=0.1):
+        """
+        :param max_limit: ceiling for the number of concurrent requests.
+        :param min_limit: floor for the number of concurrent requests.
+        :param initial_limit: starting limit, defaults to max_limit.
+        :param backoff: factor applied to the limit on overload.
+        :param tolerance: a response slower than tolerance times the average
+            latency of its endpoint counts as overload.
+        :param smoothing: weight of a new sample in the average latencies.
+        """
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError('Expected 1 <= min_limit <= max_limit, got {!r} and {!r}.'
+                             .format(min_limit, max_limit))
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._limit = float(initial_limit or max_limit)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.overloads = 0
+        self._latencies = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '{}(limit={}, in_flight={}, queue_depth={})'.format(
+            self.__class__.__name__, self.limit, self.in_flight, self.queue_depth)
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self):
+        with self._condition:
+            self.queue_depth += 1
+            try:
+                while self.in_flight >= self.limit:
+                    self._condition.wait()
+            finally:
+                self.queue_depth -= 1
+            self.in_flight += 1
+
+    def release(self, latency=None, overload=False, key=None):
+        """
+        Free the slot of a finished request and adapt the limit.
+
+        :param latency: seconds the server took to respond, None if the
+            response was already counted with record().
+        :param overload: whether the server signalled overload, e.g. a 503 response.
+        :param key: endpoint of the request, latencies are compared per endpoint.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if latency is not None:
+                self._record(latency, overload, key)
+            self._condition.notify_all()
+
+    def record(self, latency, overload=False, key=None):
+        """
+        Adapt the limit to a response of which the slot is still in use,
+        e.g. while its body is downloaded. Free the slot later with release().
+        See release() for the arguments.
+        """
+        with self._condition:
+            self._record(latency, overload, key)
+            self._condition.notify_all()
+
+    def _record(self, latency, overload, key):
+        """ Adapt the limit to a response, holding the lock. """
+        average = self._latencies.get(key)
+        if average is None:
+            self._latencies[key] = latency
+        else:
+            overload = overload or latency > self.tolerance * average
+            self._latencies[key] = average + self.smoothing * (latency - average)
+
+        now = time.monotonic()
+        if overload:
+            self.overloads += 1
+            # Responses that were in flight together report the same overload, cut once per round trip.
+            if now - self._last_decrease > latency:
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def cancel(self):
+        """ Free the slot of a request that was not sent, without adapting the limit. """
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def metrics(self):
+        return dict(limit=self.limit, in_flight=self.in_flight,
+                    queue_depth=self.queue_depth, overloads=self.overloads)
@@ -0,0 +1,255 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('tm-api')
+
+HOOKS = ('on_request_start', 'on_request_end', 'on_parse_end')
+PERCENTILES = (50, 90, 99)
+
+# Stages in the order they happen, other stages are listed after these.
+STAGES = ('token', 'server', 'download', 'decode', 'format', 'normalize')
+
+_local = threading.local()
+
+
+def current_record():
+    """ The RequestRecord of the call in progress in this thread, if any. """
+    return getattr(_local, 'record', None)
+
+
+@contextmanager
+def timed(stage):
+    """ Add the time spent in the block to a stage of the current record. """
+    record = current_record()
+    if record is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.add(stage, time.perf_counter() - start)
+
+
+def count_bytes(chunks):
+    """ Pass chunks through, adding their size to the bytes received of the current record. """
+    record = current_record()
+    for chunk in chunks:
+        if record is not None:
+            record.bytes_received += len(chunk)
+        yield chunk
+
+
+def percentile(values, q):
+    """ Nearest rank percentile of a list of numbers. """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+class RequestRecord:
+    """ Timings per stage and bytes transferred of a single API call. """
+
+    def __init__(self, method, endpoint):
+        self.method = method.upper()
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.duration = None
+        self.stages = OrderedDict()
+        self.params = None
+        self.body = None
+        self.accept = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.rows = None
+        self.status = None
+        self.cached = False
+        self.error = None
+        self.request_ended = False
+        # Number of the shard, for the requests of sharded_observations().
+        self.shard = None
+
+    def __repr__(self):
+        stages = ', '.join('{}={:.3f}s'.format(k, v) for k, v in self.stages.items())
+        return '{}({} {}, {}, {} bytes)'.format(self.__class__.__name__, self.method, self.endpoint,
+                                                 stages, self.bytes_received)
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def as_dict(self):
+        return dict(method=self.method, endpoint=self.endpoint, started=self.started,
+                    duration=self.duration, stages=dict(self.stages), params=self.params,
+                    body=self.body, accept=self.accept, bytes_sent=self.bytes_sent,
+                    bytes_received=self.bytes_received, rows=self.rows, status=self.status,
+                    cached=self.cached, error=self.error, shard=self.shard)
+
+
+class Instrumentation:
+    """
+    Records the time spent in every stage of the API calls of a client,
+    e.g. getting a token, waiting for the server, downloading and parsing,
+    and the bytes transferred. Keeps the last max_records records for
+    statistics, and calls registered hooks with each RequestRecord.
+    """
+
+    def __init__(self, max_records=10000):
+        self.records = deque(maxlen=max_records)
+        self.hooks = {name: [] for name in HOOKS}
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{}({} records)'.format(self.__class__.__name__, len(self.records))
+
+    def on_request_start(self, func):
+        """ Register func(record) to be called before a request is sent. Can be used as decorator. """
+        self.hooks['on_request_start'].append(func)
+        return func
+
+    def on_request_end(self, func):
+        """ Register func(record) to be called when the response is received and decoded. """
+        self.hooks['on_request_end'].append(func)
+        return func
+
+    def on_parse_end(self, func):
+        """ Register func(record) to be called when the result of the call is ready. """
+        self.hooks['on_parse_end'].append(func)
+        return func
+
+    def _fire(self, event, record):
+        for hook in self.hooks[event]:
+            try:
+                hook(record)
+            except Exception:
+                logger.exception('Instrumentation hook {!r} failed.'.format(hook))
+
+    @contextmanager
+    def request(self, method, endpoint):
+        """
+        Record the API call made in the block. Nested calls in the same
+        thread are part of the outer call and yield its record.
+        """
+        outer = current_record()
+        if outer is not None:
+            yield outer
+            return
+
+        record = RequestRecord(method, endpoint)
+        _local.record = record
+        self._fire('on_request_start', record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = repr(e)
+            raise
+        finally:
+            _local.record = None
+            record.duration = time.perf_counter() - start
+            self.request_end(record)
+            self._fire('on_parse_end', record)
+            with self._lock:
+                self.records.append(record)
+                for profile in self._profiles:
+                    profile.append(record)
+
+    def request_end(self, record):
+        """ Mark the response of a record as received, parsing may continue. """
+        if record is not None and not record.request_ended:
+            record.request_ended = True
+            self._fire('on_request_end', record)
+
+    def stats(self, records=None):
+        """
+        Statistics per endpoint: number of calls, bytes received, and the
+        mean and percentiles of the total duration and of every stage.
+
+        :param records: records to summarize, defaults to all records kept.
+        :return: dictionary of endpoint to statistics.
+        """
+        if records is None:
+            with self._lock:
+                records = list(self.records)
+
+        by_endpoint = OrderedDict()
+        for record in records:
+            by_endpoint.setdefault(record.endpoint, []).append(record)
+
+        stats = OrderedDict()
+        for endpoint, group in by_endpoint.items():
+            timings = OrderedDict(total=[r.duration for r in group])
+            names = [s for s in STAGES if any(s in r.stages for r in group)]
+            names += sorted({s for r in group for s in r.stages} - set(names))
+            for stage in names:
+                timings[stage] = [r.stages.get(stage, 0) for r in group]
+
+            stats[endpoint] = dict(
+                calls=len(group),
+                errors=sum(r.error is not None for r in group),
+                bytes_received=sum(r.bytes_received for r in group),
+                timings=OrderedDict(
+                    (stage, dict(mean=sum(values) / len(values),
+                                 **{'p{}'.format(q): percentile(values, q) for q in PERCENTILES}))
+                    for stage, values in timings.items()))
+        return stats
+
+    def format_table(self, records=None):
+        """ Breakdown of the mean time per stage for every endpoint, as text. """
+        stats = self.stats(records)
+        stages = []
+        for endpoint_stats in stats.values():
+            stages += [s for s in endpoint_stats['timings'] if s != 'total' and s not in stages]
+
+        header = ['endpoint', 'calls', 'kB', 'total', 'p90'] + stages
+        rows = [header]
+        for endpoint, s in stats.items():
+            timings = s['timings']
+            rows.append([endpoint, str(s['calls']), '{:.1f}'.format(s['bytes_received'] / 1024),
+                         '{:.3f}'.format(timings['total']['mean']), '{:.3f}'.format(timings['total']['p90'])] +
+                        ['{:.3f}'.format(timings[stage]['mean']) if stage in timings else '-'
+                         for stage in stages])
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = ['  '.join(cell.ljust(w) if i == 0 else cell.rjust(w)
+                           for i, (cell, w) in enumerate(zip(row, widths)))
+                 for row in rows]
+        lines.insert(1, '-' * len(lines[0]))
+        return '\n'.join(lines)
+
+    @contextmanager
+    def profile(self, file=None):
+        """
+        Collect the records of all calls made in the block, in any thread,
+        and print the mean seconds per stage for every endpoint afterwards.
+
+        :param file: where to print the table, defaults to sys.stdout. Use False to not print.
+        :return: list of RequestRecords, filled when the block ends.
+        """
+        records = []
+        with self._lock:
+            self._profiles.append(records)
+        try:
+            yield records
+        finally:
+            with self._lock:
+                self._profiles.remove(records)
+            if file is not False:
+                print(self.format_table(records) if records else 'No API calls made.',
+                      file=file or sys.stdout)
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
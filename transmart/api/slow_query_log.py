@@ -0,0 +1,107 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+user = os.path.expanduser('~')
+default_path = os.path.join(user, '.transmart-api-cache', 'slow_queries.jsonl')
+
+DEFAULT_THRESHOLD = 1.0
+DEFAULT_MAX_BYTES = 10 * 2 ** 20
+DEFAULT_BACKUP_COUNT = 5
+
+
+def _constraint(record):
+    """ The constraint of a request, from its body or its query parameters. """
+    for source in (record.body, record.params):
+        if isinstance(source, dict) and 'constraint' in source:
+            constraint = source['constraint']
+            if isinstance(constraint, str):
+                try:
+                    return json.loads(constraint)
+                except ValueError:
+                    pass
+            return constraint
+    return record.body
+
+
+def replayable(method, endpoint):
+    """ Whether a logged call can be replayed, without creating patient sets or admin actions. """
+    from .v2.api import Query
+    return Query(handle=endpoint, method=method).replayable
+
+
+class SlowQueryLog:
+    """
+    Appends a JSON line for every API call slower than the threshold to a
+    rotating log file. Lines contain the endpoint, the full request with
+    its constraint, response size, number of rows and stage timings, so
+    slow queries can be reproduced later, see read_slow_query_log().
+    Calls that change state on the server, such as creating a patient set
+    or admin calls, are not logged.
+
+    Register it as on_parse_end hook of an Instrumentation, or pass it
+    to TransmartV2 as slow_query_log.
+    """
+
+    def __init__(self, path=None, threshold=DEFAULT_THRESHOLD,
+                 max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        """
+        :param path: log file, defaults to ~/.transmart-api-cache/slow_queries.jsonl.
+        :param threshold: log calls that took at least this many seconds.
+        :param max_bytes: size at which the log file is rotated.
+        :param backup_count: number of rotated log files kept.
+        """
+        self.path = path or default_path
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._handler = RotatingFileHandler(self.path, maxBytes=max_bytes,
+                                            backupCount=backup_count, encoding='utf-8')
+
+    def __repr__(self):
+        return '{}({!r}, threshold={})'.format(self.__class__.__name__, self.path, self.threshold)
+
+    def __call__(self, record):
+        if record.duration is None or record.duration < self.threshold:
+            return
+        if not replayable(record.method, record.endpoint):
+            return
+
+        entry = dict(time=datetime.fromtimestamp(record.started, timezone.utc).isoformat(),
+                     constraint=_constraint(record),
+                     **record.as_dict())
+        line = json.dumps(entry, default=str)
+        self._handler.handle(logging.makeLogRecord(dict(msg=line, levelno=logging.INFO)))
+
+    def close(self):
+        self._handler.close()
+
+
+def read_slow_query_log(path=None):
+    """
+    Yield the logged entries as dictionaries, oldest first, including those
+    in rotated files.
+
+    :param path: log file, defaults to ~/.transmart-api-cache/slow_queries.jsonl.
+    """
+    path = path or default_path
+    rotated = []
+    i = 1
+    while os.path.exists('{}.{}'.format(path, i)):
+        rotated.append('{}.{}'.format(path, i))
+        i += 1
+
+    # The highest suffix holds the oldest entries.
+    for file in rotated[::-1] + [path]:
+        if not os.path.exists(file):
+            continue
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
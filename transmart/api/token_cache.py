@@ -0,0 +1,103 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from hashlib import sha1
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+user = os.path.expanduser('~')
+token_dir = os.path.join(user, '.transmart-api-cache', 'tokens')
+
+
+class TokenCache:
+    """
+    Access tokens shared between processes of the same user, so short-lived
+    scripts and workers reuse a valid token instead of each requesting one
+    from KeyCloak. Tokens are stored in files only readable by the user,
+    and a lock file per key makes sure only one process refreshes a token,
+    while the others wait for it.
+
+    Only access tokens are stored, never offline tokens.
+    """
+
+    def __init__(self, directory=None):
+        """
+        :param directory: where to store tokens, defaults to ~/.transmart-api-cache/tokens.
+        """
+        self.directory = directory or token_dir
+        self._make_directory()
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.directory)
+
+    def _make_directory(self):
+        """
+        Create the directory only readable by the user. The permissions of an
+        existing directory are left alone, it may be shared on purpose.
+        """
+        try:
+            os.makedirs(self.directory, mode=0o700)
+        except FileExistsError:
+            return
+        # The mode given to makedirs is masked by the umask.
+        os.chmod(self.directory, 0o700)
+
+    @staticmethod
+    def key(url, realm, client_id, offline_token):
+        """ Tokens are shared per KeyCloak url, realm, client and offline token. """
+        offline = sha1((offline_token or '').encode()).hexdigest()
+        return sha1(json.dumps([url, realm, client_id, offline]).encode()).hexdigest()
+
+    def _path(self, key, extension='.json'):
+        return os.path.join(self.directory, key + extension)
+
+    @contextmanager
+    def lock(self, key):
+        """ Exclusive lock on a key, across processes. """
+        fd = os.open(self._path(key, '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+        locked = False
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            locked = True
+            yield
+        finally:
+            if locked:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            os.close(fd)
+
+    def get(self, key):
+        """ The stored token response for key, or None. """
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, token):
+        """ Store the token response for key, replacing the file atomically. """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'access_token': token['access_token']}, f)
+        os.replace(tmp, self._path(key))
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._make_directory()
@@ -0,0 +1,184 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import logging
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .concurrency import AdaptiveLimiter, TokenBucket
+
+logger = logging.getLogger('tm-api')
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+# Give up connecting after 10 seconds, but wait as long as queries take, as before the transport existed.
+DEFAULT_TIMEOUT = (10, None)
+OVERLOAD_STATUS_CODES = (429, 502, 503, 504)
+
+
+def _once(func):
+    """ Wrap func so only its first call runs. """
+    lock = threading.Lock()
+    called = []
+
+    def wrapper():
+        with lock:
+            if called:
+                return
+            called.append(True)
+        func()
+    return wrapper
+
+
+class Transport:
+    """
+    Sends all HTTP requests of a client over one shared requests.Session,
+    so connections to tranSMART and KeyCloak are kept alive and reused
+    instead of paying a new TCP/TLS handshake for every call.
+
+    The number of concurrent requests per host adapts to the observed
+    latency and errors, see AdaptiveLimiter, so parallel queries do not
+    overload the server. Requests over the limit wait in a queue.
+
+    Subclass and override `request()` to plug in a different transport.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 backoff_factor=0.5, timeout=DEFAULT_TIMEOUT, verify=None, session=None,
+                 max_concurrency=None, adaptive=True, rate_limit=None, burst=None):
+        """
+        :param pool_size: number of connections kept alive per host.
+        :param retries: number of retries on connection errors and on
+            502, 503 and 504 responses to idempotent requests.
+        :param backoff_factor: factor for the exponential sleep between retries.
+        :param timeout: seconds to wait for the server, either a single number
+            or a (connect, read) tuple. None waits forever. By default there
+            is no read timeout, so long running queries are not cut off.
+        :param verify: Either a boolean, in which case it controls whether we verify
+        the server’s TLS certificate, or a string, in which case it must be a path
+        to a CA bundle to use. Defaults to True.
+        :param session: use this requests.Session instead of creating a new one.
+            Its mounted adapters are kept, so pool_size and retries do not apply.
+        :param max_concurrency: ceiling of concurrent requests per host, defaults to pool_size.
+        :param adaptive: lower the concurrency when the server slows down or
+            returns errors, if False always allow max_concurrency requests.
+        :param rate_limit: maximum average number of requests per second, None for no limit.
+        :param burst: number of requests allowed at once above the rate limit.
+        """
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency or pool_size
+        self.adaptive = adaptive
+        self.rate_limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.limiters = {}
+        self._limiters_lock = threading.Lock()
+        self.timeout = timeout
+        self.verify = verify
+        if session is not None:
+            self.session = session
+            return
+
+        self.session = requests.Session()
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def limiter(self, host):
+        """ The AdaptiveLimiter for a host, created on first use. """
+        with self._limiters_lock:
+            if host not in self.limiters:
+                if self.adaptive:
+                    limiter = AdaptiveLimiter(max_limit=self.max_concurrency)
+                else:
+                    limiter = AdaptiveLimiter(max_limit=self.max_concurrency, min_limit=self.max_concurrency)
+                self.limiters[host] = limiter
+            return self.limiters[host]
+
+    def metrics(self):
+        """ Current concurrency limit, requests in flight and queue depth per host. """
+        with self._limiters_lock:
+            return {host: limiter.metrics() for host, limiter in self.limiters.items()}
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, see requests.Session.request for keyword arguments.
+        The limit adapts to the time until the response headers arrive, so
+        large downloads and slow parsing do not count as server overload.
+        For streamed responses the concurrency slot is kept until the body is
+        read or the response is closed, so the limit also covers downloads.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if self.verify is not None:
+            kwargs.setdefault('verify', self.verify)
+
+        parts = urlsplit(url)
+        limiter = self.limiter(parts.netloc)
+        limiter.acquire()
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            start = time.monotonic()
+            r = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            limiter.release(time.monotonic() - start, overload=True, key=(method, parts.path))
+            raise
+        except BaseException:
+            limiter.cancel()
+            raise
+
+        overload = r.status_code in OVERLOAD_STATUS_CODES
+        key = (method, parts.path)
+        release_conn = getattr(r.raw, 'release_conn', None)
+        if not kwargs.get('stream') or release_conn is None:
+            limiter.release(r.elapsed.total_seconds(), overload=overload, key=key)
+            return r
+
+        limiter.record(r.elapsed.total_seconds(), overload=overload, key=key)
+        release = _once(limiter.release)
+
+        # urllib3 releases the connection at the end of the body and on close().
+        def release_on_end():
+            try:
+                release_conn()
+            finally:
+                release()
+        r.raw.release_conn = release_on_end
+        # Free the slot of responses that are dropped without being closed.
+        weakref.finalize(r, release)
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def get_transport(transport=None, verify=None):
+    """
+    The transport to use for a client: the given one, or a new Transport
+    with the verify setting. Verify cannot be applied to a given transport,
+    pass it to its constructor instead.
+    """
+    if transport is None:
+        return Transport(verify=verify)
+    if verify is not None and verify != transport.verify:
+        raise ValueError('verify={!r} conflicts with the given transport, create the transport '
+                         'with Transport(verify={!r}) instead.'.format(verify, verify))
+    return transport
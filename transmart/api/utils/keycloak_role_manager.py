@@ -1,4 +1,3 @@
-import requests
 import logging
 import click
 
@@ -73,8 +72,8 @@ class KeyCloakRoleManager:
     def get_client_guid(self):
         print('Querying for client guid.')
 
-        r = requests.get(url='{}/auth/admin/realms/{}/clients'.format(self.url, self.realm),
-                         headers=self._headers)
+        r = self.api.transport.get(url='{}/auth/admin/realms/{}/clients'.format(self.url, self.realm),
+                                   headers=self._headers)
 
         if r.status_code == 403:
             msg = "Access denied. Do you have the 'manage-clients' role in the 'realm-management'?"
@@ -90,7 +89,7 @@ class KeyCloakRoleManager:
 
     def get_current_roles(self):
         """ Get the set of all study roles currently in KeyCloak. """
-        r = requests.get(url=self.roles_url, headers=self._headers)
+        r = self.api.transport.get(url=self.roles_url, headers=self._headers)
         r.raise_for_status()
         return {role['name'] for role in r.json()}
 
@@ -117,7 +116,7 @@ class KeyCloakRoleManager:
         for role, human_level in self.STUDY_ROLES.items():
             name = '{}|{}'.format(study_id, role)
             desc = human_level + study_description
-            r = requests.post(
+            r = self.api.transport.post(
                 url=self.roles_url,
                 headers=self._headers,
                 json=self.get_role_representation(name, desc))
@@ -0,0 +1,131 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from ..cache import get_constraint_identity
+from ..instrumentation import percentile
+from ..slow_query_log import read_slow_query_log, replayable
+
+logger = logging.getLogger('tm-api')
+
+# Stages of a logged call spent on the request itself, comparable with a replay.
+REQUEST_STAGES = ('server', 'download')
+
+
+def _replay_entry(api, entry):
+    from ..v2.api import Query
+
+    q = Query(handle=entry['endpoint'], method=entry['method'], params=entry.get('params'),
+              json=entry.get('body'), accept=entry.get('accept'))
+    logged = sum(entry.get('stages', {}).get(stage, 0) for stage in REQUEST_STAGES)
+    result = dict(endpoint=entry['endpoint'],
+                  constraint=get_constraint_identity(entry.get('constraint'))[:8],
+                  logged=logged or entry.get('duration'),
+                  logged_bytes=entry.get('bytes_received'),
+                  replayed=None, replayed_bytes=None, error=None, skipped=False)
+
+    if not replayable(q.method, q.handle):
+        logger.warning('Not replaying {} {}, it changes state on the server.'.format(q.method, q.handle))
+        result['skipped'] = True
+        return result
+
+    start = time.perf_counter()
+    try:
+        r = api._request(q)
+        result['replayed_bytes'] = len(r.content)
+        result['replayed'] = time.perf_counter() - start
+    except Exception as e:
+        logger.warning('Replay of {} failed: {!r}'.format(entry['endpoint'], e))
+        result['error'] = repr(e)
+    return result
+
+
+def replay(api, entries, concurrency=4):
+    """
+    Send the requests of slow query log entries again, and measure how long
+    the server and download take now. Calls that change state on the server,
+    such as creating a patient set or admin calls, are skipped.
+
+    :param api: TransmartV2 client of the host to replay against.
+    :param entries: entries of read_slow_query_log().
+    :param concurrency: number of requests sent at the same time.
+    :return: list of results with logged and replayed seconds, in the order of the
+        entries. Skipped entries have skipped set to True.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda entry: _replay_entry(api, entry), entries))
+
+
+def format_report(results):
+    """ Latency comparison of replay() results, as text. """
+    header = ['endpoint', 'constraint', 'logged', 'replayed', 'ratio', 'kB']
+    rows = [header]
+    for r in results:
+        ok = r['replayed'] is not None and r['logged']
+        if r.get('skipped'):
+            replayed = 'skipped'
+        else:
+            replayed = '{:.3f}'.format(r['replayed']) if r['replayed'] is not None else 'error'
+        rows.append([r['endpoint'], r['constraint'],
+                     '{:.3f}'.format(r['logged'] or 0),
+                     replayed,
+                     '{:.2f}'.format(r['replayed'] / r['logged']) if ok else '-',
+                     '{:.1f}'.format((r['replayed_bytes'] or 0) / 1024)])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(w) if i < 2 else cell.rjust(w)
+                       for i, (cell, w) in enumerate(zip(row, widths)))
+             for row in rows]
+    lines.insert(1, '-' * len(lines[0]))
+
+    done = [r for r in results if r['replayed'] is not None and r['logged']]
+    if done:
+        lines.append('')
+        for name, key in (('logged', 'logged'), ('replayed', 'replayed')):
+            values = [r[key] for r in done]
+            lines.append('{:<9} p50 {:.3f}s  p90 {:.3f}s  max {:.3f}s'.format(
+                name, percentile(values, 50), percentile(values, 90), max(values)))
+        lines.append('median ratio replayed/logged: {:.2f}'.format(
+            percentile([r['replayed'] / r['logged'] for r in done], 50)))
+    skipped = len([r for r in results if r.get('skipped')])
+    if skipped:
+        lines.append('{} of {} calls skipped, they change state on the server.'.format(skipped, len(results)))
+    errors = len([r for r in results if r['error'] is not None])
+    if errors:
+        lines.append('{} of {} replays failed.'.format(errors, len(results)))
+    return '\n'.join(lines)
+
+
+def run_replay(transmart, kc_url, realm, client_id=None, offline_token=None, log=None, concurrency=4):
+    import transmart as tm
+
+    api = tm.get_api(
+        host=transmart,
+        api_version=2,
+        offline_token=offline_token,
+        kc_url=kc_url,
+        kc_realm=realm,
+        client_id=client_id,
+        interactive=False
+    )
+    entries = list(read_slow_query_log(log))
+    print('Replaying {} queries against {}.'.format(len(entries), transmart))
+    print(format_report(replay(api, entries, concurrency)))
+
+
+@click.command()
+@click.option('-t', '--transmart', required=True,
+              help='tranSMART host url to replay against, e.g. https://transmart-dev.thehyve.net.')
+@click.option('-k', '--kc-url', required=True,
+              help='KeyCloak host, e.g. https://keycloak-dwh-test.thehyve.net.')
+@click.option('-r', '--realm', help='KeyCloak realm.', required=True)
+@click.option('-c', '--client-id', default=None, help='KeyCloak client id.')
+@click.option('-o', '--offline-token', help='KeyCloak offline token, will be asked for if not provided.')
+@click.option('-l', '--log', default=None,
+              help='Slow query log, defaults to ~/.transmart-api-cache/slow_queries.jsonl.')
+@click.option('-n', '--concurrency', default=4, show_default=True, help='Number of concurrent requests.')
+@click.version_option(prog_name="Replay logged slow queries against tranSMART.")
+def _replay_entry_point(*args, **kwargs):
+    run_replay(*args, **kwargs)
@@ -14,23 +14,25 @@
 """
 import transmart
 if transmart.dependency_mode == 'FULL':
-    import requests
-
     import google.protobuf.internal.decoder as decoder
     from pandas.io.json import json_normalize
 
     from .highdim_pb2 import HighDimHeader
     from .highdim_pb2 import Row
     import urllib
+    from urllib.parse import urlsplit
 
     from ..auth import get_auth
+    from ..instrumentation import Instrumentation, current_record, timed
+    from ..transport import get_transport
 
 
 class TransmartV1:
     """ Connect to tranSMART V1 api using Python. """
 
     def __init__(self, host, offline_token=None, kc_url=None,
-                 kc_realm=None, client_id=None, print_urls=False, verify=None, *args, **kwargs):
+                 kc_realm=None, client_id=None, print_urls=False, verify=None, transport=None,
+                 token_renewal=None, token_cache=None, *args, **kwargs):
         """
         Create the python transmart client by providing user credentials.
 
@@ -43,11 +45,31 @@ class TransmartV1:
         :param verify: Either a boolean, in which case it controls whether we verify
         the server’s TLS certificate, or a string, in which case it must be a path
         to a CA bundle to use. Defaults to True.
+        :param transport: Transport used for all HTTP requests, including
+        token requests. Defaults to a pooled keep-alive Transport. Pass verify
+        to the Transport, not to the client.
+        :param token_renewal: fraction of the access token lifetime after which
+        it is renewed in the background, e.g. 0.75. None renews when a request needs it.
+        :param token_cache: True or a TokenCache to share access tokens with other
+        processes, e.g. workers of an array job, instead of each requesting one.
         """
         self.host = host
         self.print_urls = print_urls
         self.verify = verify
-        self.auth = get_auth(host, offline_token, kc_url, kc_realm, client_id)
+        self.transport = get_transport(transport, verify)
+        self.auth = get_auth(host, offline_token, kc_url, kc_realm, client_id, self.transport,
+                             token_renewal=token_renewal, token_cache=token_cache)
+        self.instrumentation = Instrumentation()
+
+    def profile(self, file=None):
+        """
+        Context manager that prints how long the API calls made inside it
+        spent on every stage, e.g. the server, downloading and parsing.
+
+        :param file: where to print the table, defaults to sys.stdout. Use False to not print.
+        :return: list of RequestRecords of the calls.
+        """
+        return self.instrumentation.profile(file)
 
     def get_observations(self, study=None, patientSet=None, as_dataframe=True, hal=False):
         """
@@ -61,10 +83,13 @@ class TransmartV1:
         """
         url = '%s/studies/%s/observations' % (self.host, study)
 
-        observations = self._get_json(url, hal=hal)
+        with self.instrumentation.request('GET', urlsplit(url).path) as record:
+            observations = self._get_json(url, hal=hal)
+            self.instrumentation.request_end(record)
 
-        if as_dataframe:
-            observations = json_normalize(observations)
+            if as_dataframe:
+                with timed('normalize'):
+                    observations = json_normalize(observations)
 
         return observations
 
@@ -90,10 +115,13 @@ class TransmartV1:
         """
         url = '%s/studies' % (self.host)
 
-        studies = self._get_json(url, hal=hal)
+        with self.instrumentation.request('GET', urlsplit(url).path) as record:
+            studies = self._get_json(url, hal=hal)
+            self.instrumentation.request_end(record)
 
-        if as_dataframe:
-            studies = json_normalize(studies['studies'])
+            if as_dataframe:
+                with timed('normalize'):
+                    studies = json_normalize(studies['studies'])
 
         return studies
 
@@ -135,11 +163,10 @@ class TransmartV1:
 
         headers = {}
         headers['Accept'] = 'application/%s;charset=UTF-8' % ('hal+json' if hal else 'json')
-        if self.auth.access_token is not None:
-            headers['Authorization'] = 'Bearer ' + self.auth.access_token
-        r = requests.post(url, headers=headers, verify=self.verify)
-        r.raise_for_status()
-        return r.json()
+        with self.instrumentation.request('POST', urlsplit(url).path):
+            r = self._request('POST', url, headers)
+            with timed('decode'):
+                return r.json()
 
     def _get_json(self, url, hal=False):
 
@@ -149,12 +176,30 @@ class TransmartV1:
         headers = {
             'Accept': 'application/%s;charset=UTF-8' % ('hal+json' if hal else 'json')
         }
-        if self.auth.access_token is not None:
-            headers['Authorization'] = 'Bearer ' + self.auth.access_token
+        with self.instrumentation.request('GET', urlsplit(url).path):
+            r = self._request('GET', url, headers)
+            with timed('decode'):
+                return r.json()
+
+    def _request(self, method, url, headers):
+        """ Send an authorized request, time its stages and return the successful response. """
+        with timed('token'):
+            access_token = self.auth.access_token
+        if access_token is not None:
+            headers['Authorization'] = 'Bearer ' + access_token
+
+        with timed('server'):
+            r = self.transport.request(method, url, headers=headers, stream=True)
+        with timed('download'):
+            r.content
+
+        record = current_record()
+        if record is not None:
+            record.status = r.status_code
+            record.bytes_received += len(r.content)
 
-        r = requests.get(url, headers=headers, verify=self.verify)
         r.raise_for_status()
-        return r.json()
+        return r
 
     def _parse_protobuf(self, data):
         hdHeader = HighDimHeader()
@@ -176,9 +221,9 @@ class TransmartV1:
         headers = {
             'Accept': 'application/octet-stream'
         }
-        if self.auth.access_token is not None:
-            headers['Authorization'] = 'Bearer ' + self.auth.access_token
-        req = urllib.request.Request(url, headers=headers)
-        return self._parse_protobuf(urllib.request.urlopen(req).read())
+        with self.instrumentation.request('GET', urlsplit(url).path):
+            r = self._request('GET', url, headers)
+            with timed('decode'):
+                return self._parse_protobuf(r.content)
 
 
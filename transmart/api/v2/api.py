@@ -5,36 +5,57 @@
 """
 
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from functools import wraps
+from hashlib import sha1
 import json
 from json import JSONDecodeError
 from urllib.parse import unquote_plus
 
-import requests
-
 import transmart
 from ..auth import get_auth
+from ..cache import ResponseCache, MemoryCache, get_constraint_identity
+from ..concurrency import SingleFlight
+from ..instrumentation import Instrumentation, current_record, timed, count_bytes
+from ..slow_query_log import SlowQueryLog
+from ..transport import get_transport
 
 if transmart.dependency_mode == 'FULL':
 
-    from .concept_search import ConceptSearcher
     from .constraints import ObservationConstraint, Queryable, BiomarkerConstraint
+    from . import sharding
+    from .lazy_tree import LazyTree, DEFAULT_DEPTH
 
 if transmart.dependency_mode in ('FULL', 'BACKEND'):
     from pandas.io.json import json_normalize
-    from .data_structures import (ObservationSet, ObservationSetHD, TreeNodes, Patients,
-                                  PatientSets, Studies, StudyList, RelationTypes)
+    from .data_structures import (ObservationSet, ObservationStar, ObservationSetHD, TreeNodes, Patients,
+                                  PatientSets, Studies, StudyList, RelationTypes, BatchResult)
+    from .hypercube_protobuf import PROTOBUF_MEDIA_TYPE
+    from . import export
 
 
 logger = logging.getLogger('tm-api')
 
+STREAM_CHUNK_SIZE = 64 * 1024
+# POST handles that change state on the server, never coalesce these.
+MUTATING_HANDLES = ('/v2/patient_sets', )
+# Handles of administrative calls, which may change state even with GET.
+ADMIN_HANDLE_PREFIX = '/v2/admin/'
+HYPERCUBE_FORMATS = ('json', 'protobuf')
+# Steps of build_cache(), as reported to its progress callback.
+CACHE_STEPS = ('studies', 'tree_nodes', 'relation_types', 'search_index')
+
 
 def default_constraint(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
         if kwargs.get('constraint') is None:
-            if not any([isinstance(o, Queryable) for o in args]):
-                kwargs['constraint'] = ObservationConstraint(**kwargs)
+            if not any([isinstance(o, (Queryable, dict)) for o in args]):
+                constraint_kwargs = {k: v for k, v in kwargs.items()
+                                     if k in ObservationConstraint.params or k == 'subselection'}
+                kwargs['constraint'] = ObservationConstraint(**constraint_kwargs)
         return func(*args, **kwargs)
     return wrapper
 
@@ -48,6 +69,30 @@ def add_to_queryable(func):
     return func
 
 
+def _check_format(format):
+    if format not in HYPERCUBE_FORMATS:
+        raise ValueError('Unknown format {!r}, choose from: {}'.format(format, HYPERCUBE_FORMATS))
+
+
+def _cached(name, doc):
+    """
+    Property for a cache that build_cache() fills in the background. Reading
+    it waits until that part of the cache is built, and raises its error if
+    building failed. Assigning a value replaces the pending result.
+    """
+    def fget(self):
+        future = self._cache_futures.get(name)
+        if future is not None:
+            future.result()
+        return self.__dict__.get('_' + name)
+
+    def fset(self, value):
+        self._cache_futures.pop(name, None)
+        self.__dict__['_' + name] = value
+
+    return property(fget, fset, doc=doc)
+
+
 def constraint_to_dict(constraint):
     """
     Tries to convert the object to a dictionary using its
@@ -63,23 +108,43 @@ def constraint_to_dict(constraint):
 class Query:
     """ Utility to build queries for transmart v2 api. """
 
-    def __init__(self, handle=None, method='GET', params=None, hal=False, json=None):
+    def __init__(self, handle=None, method='GET', params=None, hal=False, json=None, accept=None):
         self.handle = handle
         self.method = method
         self.hal = hal
         self.params = params
         self.json = json
+        self.accept = accept
+
+    @property
+    def idempotent(self):
+        """ Whether sending this query twice has the same effect as sending it once. """
+        return self.method.upper() == 'GET' or self.handle not in MUTATING_HANDLES
+
+    @property
+    def replayable(self):
+        """ Whether this query can be sent again later without changing anything on the server. """
+        return self.idempotent and not (self.handle or '').startswith(ADMIN_HANDLE_PREFIX)
 
     @property
     def headers(self):
+        if self.accept is not None:
+            return {'Accept': self.accept}
         return {'Accept': 'application/{};charset=UTF-8'.format('hal+json' if self.hal else 'json')}
 
 
 class TransmartV2:
     """ Connect to tranSMART v2 API using Python. """
 
+    studies = _cached('studies', 'StudyList of all study ids.')
+    tree_dict = _cached('tree_dict', 'Dictionary of full name to tree node.')
+    search_tree_node = _cached('search_tree_node', 'Full text search function for tree nodes.')
+    relation_types = _cached('relation_types', 'Subject relationship types.')
+
     def __init__(self, host, offline_token=None, kc_url=None, kc_realm=None,
-                 client_id=None, print_urls=False, interactive=True, verify=None):
+                 client_id=None, print_urls=False, interactive=True, verify=None, transport=None,
+                 cache=None, memo=False, slow_query_log=None, token_renewal=None, token_cache=None,
+                 progress=None, lazy_tree=False):
         """
         Create the python transmart client by providing user credentials.
 
@@ -93,17 +158,53 @@ class TransmartV2:
         :param verify: Either a boolean, in which case it controls whether we verify
         the server’s TLS certificate, or a string, in which case it must be a path
         to a CA bundle to use. Defaults to True.
+        :param transport: Transport used for all HTTP requests, including
+        token requests. Defaults to a pooled keep-alive Transport. Pass verify
+        to the Transport, not to the client.
+        :param cache: True or a ResponseCache to keep responses on disk in
+        ~/.transmart-api-cache between sessions. Disabled by default.
+        :param memo: True or a MemoryCache to remember the results of count,
+        aggregate and dimension element calls in memory for 5 minutes, so repeated
+        calls may return results up to that old. Disabled by default.
+        :param slow_query_log: True, a file path or a SlowQueryLog to log calls
+        slower than a threshold with their constraints, for later replay.
+        :param token_renewal: fraction of the access token lifetime after which
+        it is renewed in the background, e.g. 0.75. None renews when a request needs it.
+        :param token_cache: True or a TokenCache to share access tokens with other
+        processes, e.g. workers of an array job, instead of each requesting one.
+        :param progress: function called as progress(step, done, total) while
+        the interactive caches are built in the background, see build_cache().
+        :param lazy_tree: True or a depth to cache only the top levels of the tree,
+        and load deeper levels when they are used, see LazyTree. The search
+        index then covers the nodes loaded so far.
         """
+        self._cache_futures = {}
         self.studies = None
         self.tree_dict = None
         self.search_tree_node = None
         self.relation_types = None
         self.host = host
         self.interactive = interactive
+        self.lazy_tree = lazy_tree
         self.print_urls = print_urls
         self.verify = verify
+        self.transport = get_transport(transport, verify)
+
+        self.auth = get_auth(host, offline_token, kc_url, kc_realm, client_id, self.transport,
+                             token_renewal=token_renewal, token_cache=token_cache)
 
-        self.auth = get_auth(host, offline_token, kc_url, kc_realm, client_id)
+        self.cache = ResponseCache() if cache is True else cache or None
+        token_id = sha1((self.auth.offline_token or '').encode()).hexdigest()
+        self._cache_namespace = [host, self.auth.url, self.auth.client_id, token_id]
+        self.memo = MemoryCache() if memo is True else memo or None
+        self.single_flight = SingleFlight()
+        self.instrumentation = Instrumentation()
+
+        if slow_query_log is True or isinstance(slow_query_log, str):
+            slow_query_log = SlowQueryLog(None if slow_query_log is True else slow_query_log)
+        self.slow_query_log = slow_query_log or None
+        if self.slow_query_log is not None:
+            self.instrumentation.on_parse_end(self.slow_query_log)
 
         self._admin_call_factory('/v2/admin/system/after_data_loading_update')
         self._admin_call_factory('/v2/admin/system/config')
@@ -117,70 +218,279 @@ class TransmartV2:
         self._observation_call_factory('counts_per_study_and_concept')
 
         if interactive and transmart.dependency_mode == 'FULL':
-            self.build_cache()
+            self.build_cache(progress=progress)
 
-    def build_cache(self):
-        logger.debug('Caching list of studies.')
-        self.get_studies()
+    def build_cache(self, progress=None, wait=False):
+        """
+        Cache the studies, the tree with its search index, and the subject
+        relationship types for interactive use. The endpoints are fetched
+        concurrently and the search index is built once the tree arrives,
+        all in background threads. The studies, tree_dict, search_tree_node
+        and relation_types attributes wait for their part when first used.
+
+        :param progress: function called as progress(step, done, total) when
+        each of the steps in CACHE_STEPS finishes.
+        :param wait: if True, return only when the cache is complete.
+        """
+        # Imported on first use, as it loads whoosh.
+        from .concept_search import ConceptSearcher
+
+        lock = threading.Lock()
+        done = []
+
+        def step(name, func):
+            def run():
+                logger.debug('Caching {}.'.format(name))
+                try:
+                    return func()
+                except Exception as e:
+                    logger.warning('Caching {} failed: {!r}'.format(name, e))
+                    raise
+                finally:
+                    # Report under the lock, so counts arrive in order.
+                    with lock:
+                        done.append(name)
+                        if progress is not None:
+                            try:
+                                progress(name, len(done), len(CACHE_STEPS))
+                            except Exception:
+                                logger.exception('Cache progress callback failed.')
+            return run
+
+        def load_tree():
+            if self.lazy_tree:
+                depth = DEFAULT_DEPTH if self.lazy_tree is True else self.lazy_tree
+                self._tree_dict = LazyTree(self, depth=depth)
+                return self._tree_dict
+            full_tree = self.tree_nodes()
+            self._tree_dict = full_tree.tree_dict
+            return full_tree
+
+        def build_index():
+            tree = futures['tree_dict'].result()
+            if isinstance(tree, LazyTree):
+                searcher = ConceptSearcher({})
+                tree.on_load(searcher.add)
+                searcher.add(dict(tree.items()))
+            else:
+                searcher = ConceptSearcher(tree.tree_dict, tree.identity)
+            self._search_tree_node = searcher.search
+
+        def load_relation_types():
+            self._relation_types = RelationTypes(self.get_relation_types())
+
+        executor = ThreadPoolExecutor(max_workers=len(CACHE_STEPS), thread_name_prefix='tm-cache')
+        futures = {}
+        for attribute, name, func in (('studies', 'studies', self.get_studies),
+                                      ('tree_dict', 'tree_nodes', load_tree),
+                                      ('relation_types', 'relation_types', load_relation_types),
+                                      ('search_tree_node', 'search_index', build_index)):
+            futures[attribute] = executor.submit(step(name, func))
+        self._cache_futures.update(futures)
+        executor.shutdown(wait=wait)
+
+        if wait:
+            for future in futures.values():
+                future.result()
+
+    def profile(self, file=None):
+        """
+        Context manager that prints how long the API calls made inside it
+        spent on every stage, e.g. the server, downloading and parsing.
 
-        logger.debug('Caching full tree as tree_dict.')
-        full_tree = self.tree_nodes()
-        self.tree_dict = full_tree.tree_dict
-        self.search_tree_node = ConceptSearcher(self.tree_dict, full_tree.identity).search
+        >>> with api.profile():
+        ...     api.observations(concept='O1KP:CAT8')
 
-        logger.debug('Getting subject relationship types.')
-        self.relation_types = RelationTypes(self.get_relation_types())
+        :param file: where to print the table, defaults to sys.stdout. Use False to not print.
+        :return: list of RequestRecords of the calls.
+        """
+        return self.instrumentation.profile(file)
 
-    def query(self, q):
-        """ Perform query using API client using a Query object """
+    def _request(self, q, stream=False, headers=None):
+        """ Send the request for a Query object and return the successful response. """
 
         url = "{}{}".format(self.host, q.handle)
 
-        headers = q.headers
-        headers['Authorization'] = 'Bearer ' + self.auth.access_token
-
-        if q.method.upper() == 'GET':
-            r = requests.get(url, params=q.params, headers=headers, verify=self.verify)
-        else:
-            r = requests.post(url, json=q.json, params=q.params, headers=headers, verify=self.verify)
+        headers = dict(q.headers, **(headers or {}))
+        with timed('token'):
+            headers['Authorization'] = 'Bearer ' + self.auth.access_token
+
+        # Always stream, so the time to the response headers and the download are timed apart.
+        with timed('server'):
+            if q.method.upper() == 'GET':
+                r = self.transport.get(url, params=q.params, headers=headers, stream=True)
+            else:
+                r = self.transport.post(url, json=q.json, params=q.params, headers=headers, stream=True)
+
+        if not stream:
+            with timed('download'):
+                r.content
+
+        record = current_record()
+        if record is not None:
+            record.params, record.body, record.accept = q.params, q.json, headers['Accept']
+            record.status = r.status_code
+            record.bytes_sent += len(r.request.body or b'')
+            if not stream:
+                record.bytes_received += len(r.content)
 
         if self.print_urls:
             print(unquote_plus(r.url))
 
         if r.status_code == 200 or r.status_code == 201:
-            return r.json()
+            return r
+        elif r.status_code == 304 and 'If-None-Match' in headers:
+            return r
         else:
             logger.error(json.dumps(r.json(), indent=2))
             raise Exception('Error retrieving data')
 
+    def query(self, q):
+        """ Perform query using API client using a Query object """
+        if not q.idempotent:
+            return self._query(q)
+
+        # Identical queries that are already in flight share one request and result.
+        key = get_constraint_identity([q.method.upper(), q.handle, q.params, q.json, q.headers['Accept']])
+        return self.single_flight.do(key, lambda: self._query(q))
+
+    def _query(self, q):
+        with self.instrumentation.request(q.method, q.handle):
+            if self.cache is None or not self.cache.cacheable(q.handle):
+                r = self._request(q)
+                with timed('decode'):
+                    return r.json()
+
+            return self._cached_query(q)
+
+    def _cached_query(self, q):
+        key = self.cache.key(self._cache_namespace, q.method.upper(), q.handle,
+                             q.params, q.json, q.headers['Accept'])
+        entry = self.cache.get(key)
+
+        if entry is not None and entry.fresh:
+            self.cache.record('hits')
+            current_record().cached = True
+            with timed('decode'):
+                return entry.json()
+
+        headers = {'If-None-Match': entry.etag} if entry is not None and entry.etag else None
+        r = self._request(q, headers=headers)
+
+        if r.status_code == 304:
+            self.cache.record('revalidated')
+            self.cache.record('hits')
+            self.cache.put(key, q.handle, entry.body, entry.etag)
+            current_record().cached = True
+            with timed('decode'):
+                return entry.json()
+
+        self.cache.record('misses')
+        self.cache.put(key, q.handle, r.content, r.headers.get('ETag'))
+        with timed('decode'):
+            return r.json()
+
+    def _invalidate_caches(self):
+        """ Forget cached responses, as the data on the server has changed. """
+        if self.cache is not None:
+            self.cache.clear()
+        if self.memo is not None:
+            self.memo.clear()
+
+    def _memoized(self, q, constraint):
+        """ Query, or reuse the result of an earlier query for the same constraint. """
+        if self.memo is None:
+            return self.query(q)
+
+        key = (q.handle, get_constraint_identity(constraint_to_dict(constraint)))
+        return self.memo.get_or_call(key, lambda: self.query(q))
+
+    def batch(self, endpoint, constraints, max_workers=None, **kwargs):
+        """
+        Query the same endpoint for many constraints at once, using a bounded
+        pool of threads. A failing item does not abort the other items.
+
+        :param endpoint: query method, e.g. api.observations.counts_per_concept,
+            or its name, e.g. 'counts_per_concept'.
+        :param constraints: list of Constraint objects or dictionaries.
+        :param max_workers: number of concurrent requests, defaults to the
+            connection pool size of the transport.
+        :param kwargs: passed on to every call of the endpoint.
+        :return: BatchResult with results in the order of the constraints.
+        """
+        if isinstance(endpoint, str):
+            endpoint = self.observations.__dict__.get(endpoint) or getattr(self, endpoint)
+
+        constraints = list(constraints)
+        max_workers = max_workers or getattr(self.transport, 'pool_size', None)
+
+        def call(constraint):
+            return endpoint(constraint=constraint, **kwargs)
+
+        results = [None] * len(constraints)
+        errors = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(call, c) for c in constraints]
+            for i, future in enumerate(futures):
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    logger.warning('Batch item {} failed: {!r}'.format(i, e))
+                    errors[i] = e
+
+        return BatchResult(constraints, results, errors)
+
     def admin(self):
         """
         Does nothing, but provide administrative functions via dot notation.
         """
 
     def _admin_call_factory(self, handle, doc=None):
+        name = handle.split('/')[-1]  # pick last part of handle as name.
+
         def func():
             q = Query(handle=handle, method='GET')
             try:
                 return self.query(q)
             except JSONDecodeError:
                 print('Not a valid JSON response. Returning None.')
+            finally:
+                if name in ('clear_cache', 'after_data_loading_update'):
+                    self._invalidate_caches()
 
         func.__doc__ = doc
-        name = handle.split('/')[-1]  # pick last part of handle as name.
         self.admin.__dict__[name] = func
 
     @default_constraint
     @add_to_queryable
-    def observations(self, constraint=None, as_dataframe=False, **kwargs):
+    def observations(self, constraint=None, as_dataframe=False, stream=False, format='json', star=False,
+                     dtypes=None, keep_json=True, rows=None, **kwargs):
         """
         Get observations, from the main table in the transmart data model.
 
         :param constraint: Constraint object. If left None, any keyword arguments
            are added to the constraint.
         :param as_dataframe: If True, convert json response to dataframe directly
+        :param stream: If True, decode the response incrementally while it is
+           downloaded, without keeping the raw json in memory.
+        :param format: 'json' (default) or 'protobuf'. Protobuf responses are
+           smaller and are always decoded while they are downloaded.
+        :param star: If True, return an ObservationStar: a fact table of element
+           codes and values, with a table per dimension. The wide dataframe
+           is only joined when it is used.
+        :param dtypes: None, or 'compact' for categoricals, datetimes and downcast
+           numbers, which take several times less memory.
+        :param keep_json: If False, the raw json response is dropped once it is
+           decoded. The cells are decoded into a star schema before returning,
+           the wide dataframe is joined on first use.
+        :param rows: If given, return an iterator of dataframes of at most this
+           many cells, see ObservationSet.iter_batches(). With stream=True the
+           cells are kept in compact columns while downloading, and only one
+           batch is expanded at a time.
         :return: dataframe or direct json
         """
+        _check_format(format)
         q = Query(handle='/v2/observations',
                   method='POST',
                   json={
@@ -188,12 +498,146 @@ class TransmartV2:
                       'constraint': constraint_to_dict(constraint)
                   })
 
-        observations = ObservationSet(self.query(q))
+        with self.instrumentation.request(q.method, q.handle) as record:
+            cls = ObservationStar if star else ObservationSet
+            if format == 'protobuf':
+                q.accept = PROTOBUF_MEDIA_TYPE
+                with self._request(q, stream=True) as r:
+                    observations = cls.from_protobuf(self._iter_content(r), dtypes=dtypes)
+            elif stream:
+                with self._request(q, stream=True) as r:
+                    observations = cls.from_stream(self._iter_content(r), dtypes=dtypes)
+            else:
+                json_ = self.query(q)
+                self.instrumentation.request_end(record)
+                if star:
+                    observations = ObservationStar.from_json(json_, dtypes=dtypes)
+                else:
+                    observations = ObservationSet(json_, dtypes=dtypes, keep_json=keep_json)
+                    # Decode the cells here, so their time is part of the record. Only
+                    # joining the wide dataframe is left for when it is used.
+                    observations.star
+            record.rows = len(observations)
+            if as_dataframe:
+                return observations.dataframe
+
+        if rows is not None:
+            return observations.iter_batches(rows)
+        return observations
 
-        if as_dataframe:
-            return observations.dataframe
+    @default_constraint
+    @add_to_queryable
+    def export_observations(self, constraint=None, path=None, format='parquet', rows=None,
+                            response_format='json', **kwargs):
+        """
+        Export observations to a file without building the full dataframe.
+        The response is decoded while it is downloaded into element codes and
+        values, and written in row groups of the wide dataframe, with the
+        string fields of dimensions dictionary-encoded for Parquet and Feather.
 
-        return observations
+        :param constraint: Constraint object. If left None, any keyword arguments
+           are added to the constraint.
+        :param path: file to write.
+        :param format: 'parquet', 'feather' (Arrow IPC file) or 'csv'. Parquet
+           and Feather require pyarrow.
+        :param rows: number of cells per row group, defaults to export.DEFAULT_ROWS.
+        :param response_format: 'json' or 'protobuf', see observations().
+        :return: number of cells written.
+        """
+        if path is None:
+            raise ValueError('No path to export the observations to.')
+        export.check_export_format(format)
+        batches = self.observations(constraint=constraint, stream=True, format=response_format,
+                                    dtypes=export.export_dtypes(format), rows=rows or export.DEFAULT_ROWS)
+        cells = export.write_batches(batches, path, format)
+        logger.info('Exported {} observations to {}.'.format(cells, path))
+        return cells
+
+    @staticmethod
+    def _iter_content(r):
+        return count_bytes(r.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+
+    @default_constraint
+    @add_to_queryable
+    def sharded_observations(self, constraint=None, by='study', shards=None, max_workers=None,
+                             processes=None, format='json', **kwargs):
+        """
+        Get observations in disjoint shards that are fetched in parallel and
+        parsed in worker processes, for constraints too large for a single
+        response. The result has the same rows as observations(), but they
+        are ordered by shard.
+
+        :param constraint: Constraint object. If left None, any keyword arguments
+           are added to the constraint.
+        :param by: how to split the constraint:
+           'study' or 'concept': by the elements of that dimension,
+           'start_time': in windows of observation start time,
+           'patients': in partitions of the patients, saved as patient sets.
+        :param shards: for 'study' and 'concept' the number of shards, defaults to
+           one shard per element. For 'patients' the number of partitions, defaults
+           to max_workers. For 'start_time' the list of dates to split at (required).
+        :param max_workers: number of concurrent requests, defaults to the
+            connection pool size of the transport.
+        :param processes: number of worker processes parsing responses, defaults to
+           the number of CPUs. Use 0 to parse in the main process.
+        :param format: 'json' (default) or 'protobuf'.
+        :return: ObservationSet, its json is None.
+        """
+        _check_format(format)
+        if by not in sharding.SHARD_DIMENSIONS:
+            raise ValueError('Cannot shard by {!r}, choose from: {}'.format(by, sharding.SHARD_DIMENSIONS))
+
+        max_workers = max_workers or getattr(self.transport, 'pool_size', None)
+        constraint = constraint_to_dict(constraint)
+
+        if by == 'study':
+            shard_list = sharding.study_shards(self.dimension_elements('study', constraint)['elements'], shards)
+        elif by == 'concept':
+            shard_list = sharding.concept_shards(self.dimension_elements('concept', constraint)['elements'], shards)
+        elif by == 'start_time':
+            shard_list = sharding.start_time_shards(shards or [])
+        else:
+            shard_list = sharding.patient_set_shards(self._partition_patients(constraint, shards or max_workers))
+
+        logger.info('Fetching observations in {} shards by {}.'.format(len(shard_list), by))
+
+        def fetch(i, shard):
+            q = Query(handle='/v2/observations',
+                      method='POST',
+                      json={
+                          'type': 'clinical',
+                          'constraint': sharding.restrict(constraint, shard)
+                      },
+                      accept=PROTOBUF_MEDIA_TYPE if format == 'protobuf' else None)
+            with self.instrumentation.request(q.method, q.handle) as record:
+                record.shard = i
+                return self._request(q).content
+
+        if processes == 0:
+            parsers = ThreadPoolExecutor(max_workers=1)
+        else:
+            # Spawn, because forking while the fetching threads hold locks can deadlock.
+            parsers = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+        frames = [None] * len(shard_list)
+        with ThreadPoolExecutor(max_workers=max_workers) as fetchers, parsers:
+            fetches = {fetchers.submit(fetch, i, shard): i for i, shard in enumerate(shard_list)}
+            parses = {parsers.submit(sharding.parse_observations, f.result(), format): fetches[f]
+                      for f in as_completed(fetches)}
+            for f in as_completed(parses):
+                frames[parses[f]] = f.result()
+
+        return ObservationSet(None, dataframe=sharding.concat_frames(frames))
+
+    def _partition_patients(self, constraint, n):
+        """ Save the patients matching the constraint in n patient sets, return their ids. """
+        ids = [p['id'] for p in self.patients(constraint=constraint).json['patients']]
+        patient_set_ids = []
+        for i, part in enumerate(sharding.partition(ids, n)):
+            patient_set = self.create_patient_set('python client shard {} of {}'.format(i + 1, n),
+                                                  constraint={'type': 'patient_set', 'patientIds': part})
+            patient_set_ids.append(patient_set['id'])
+        return patient_set_ids
 
     def _observation_call_factory(self, handle, doc=None):
 
@@ -203,19 +647,20 @@ class TransmartV2:
                       json={
                           'constraint': constraint_to_dict(constraint)
                       })
-            return self.query(q)
+            return self._memoized(q, constraint)
 
         func.__doc__ = doc
         self.observations.__dict__[handle] = add_to_queryable(default_constraint(func))
 
     @default_constraint
     @add_to_queryable
-    def patients(self, constraint=None, **kwargs):
+    def patients(self, constraint=None, dtypes=None, **kwargs):
         """
         Get patients.
 
         :param constraint: Constraint object. If left None, any keyword arguments
            are added to the constraint.
+        :param dtypes: None or 'compact', see data_structures.compact_dtypes().
         :return: dataframe or direct json
         """
         q = Query(handle='/v2/patients',
@@ -223,7 +668,10 @@ class TransmartV2:
                   json={
                       'constraint': constraint_to_dict(constraint)
                   })
-        return Patients(self.query(q))
+        with self.instrumentation.request(q.method, q.handle) as record:
+            json_ = self.query(q)
+            record.rows = len(json_.get('patients') or [])
+        return Patients(json_, dtypes=dtypes)
 
     def patient_sets(self, patient_set_id=None):
         q = Query(handle='/v2/patient_sets')
@@ -251,11 +699,12 @@ class TransmartV2:
 
         return self.query(q)
 
-    def get_studies(self, as_json=False):
+    def get_studies(self, as_json=False, dtypes=None):
         """
         Get all studies.
 
         :param as_json: If True, return direct json response.
+        :param dtypes: None or 'compact', see data_structures.compact_dtypes().
         :return: json or Studies object
         """
 
@@ -266,10 +715,10 @@ class TransmartV2:
         if as_json or transmart.dependency_mode == 'MINIMAL':
             return json_
 
-        studies = Studies(json_)
+        studies = Studies(json_, dtypes=dtypes)
 
-        if self.studies is None:
-            self.studies = StudyList(studies.dataframe.studyId)
+        if self._studies is None:
+            self._studies = StudyList(studies.dataframe.studyId)
 
         return studies
 
@@ -303,15 +752,19 @@ class TransmartV2:
     @default_constraint
     @add_to_queryable
     def get_hd_node_data(self, constraint=None, biomarker_constraint=None, biomarkers: list = None,
-                         biomarker_type='genes', projection='all_data', **kwargs):
+                         biomarker_type='genes', projection='all_data', format='json', dtypes=None,
+                         **kwargs):
         """
         :param constraint:
         :param biomarker_constraint:
         :param biomarkers: list of markers to get.
         :param biomarker_type: ['genes', 'transcripts']
         :param projection: ['all_data', 'zscore', 'log_intensity']
+        :param format: 'json' (default) or 'protobuf'.
+        :param dtypes: None or 'compact', see data_structures.compact_dtypes().
         :return:
         """
+        _check_format(format)
         if biomarker_constraint is None:
             biomarker_constraint = BiomarkerConstraint(biomarkers=biomarkers,
                                                        biomarker_type=biomarker_type)
@@ -321,11 +774,21 @@ class TransmartV2:
                   params=dict(
                       type='autodetect',
                       projection=projection,
-                      constraint=str(constraint),
+                      constraint=json.dumps(constraint_to_dict(constraint)),
                       biomarker_constraint=str(biomarker_constraint))
                   )
 
-        return ObservationSetHD(self.query(q))
+        with self.instrumentation.request(q.method, q.handle) as record:
+            if format == 'protobuf':
+                q.accept = PROTOBUF_MEDIA_TYPE
+                with self._request(q, stream=True) as r:
+                    observations = ObservationSetHD.from_protobuf(self._iter_content(r), dtypes=dtypes)
+            else:
+                json_ = self.query(q)
+                self.instrumentation.request_end(record)
+                observations = ObservationSetHD(json_, dtypes=dtypes)
+            record.rows = len(observations.dataframe)
+            return observations
 
     @default_constraint
     @add_to_queryable
@@ -333,10 +796,10 @@ class TransmartV2:
         q = Query(handle='/v2/dimensions/{}/elements'.format(dimension),
                   method='GET',
                   params=dict(
-                      constraint=str(constraint))
+                      constraint=json.dumps(constraint_to_dict(constraint)))
                   )
 
-        return self.query(q)
+        return self._memoized(q, constraint)
 
     def get_relation_types(self):
         q = Query(handle='/v2/pedigree/relation_types')
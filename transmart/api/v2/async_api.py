@@ -0,0 +1,252 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+
+import asyncio
+import json
+import logging
+import ssl
+from urllib.parse import unquote_plus
+
+import transmart
+from ..auth import get_auth
+from .api import Query, add_to_queryable, constraint_to_dict, default_constraint
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+if transmart.dependency_mode in ('FULL', 'BACKEND'):
+    from .data_structures import ObservationSet, TreeNodes, Patients
+
+
+logger = logging.getLogger('tm-api')
+
+
+def _query_params(params):
+    """ aiohttp only accepts str and numbers, format params like requests does. """
+    if params is None:
+        return None
+    return {k: str(v) if isinstance(v, bool) else v
+            for k, v in params.items() if v is not None}
+
+
+def _ssl_context(verify):
+    if verify is None or verify is True:
+        return None
+    if verify is False:
+        return False
+    return ssl.create_default_context(cafile=verify)
+
+
+class AsyncTransmartV2:
+    """
+    Connect to tranSMART v2 API from asyncio code. Mirrors the query
+    methods of TransmartV2, but each of them returns an awaitable.
+
+    Use as an async context manager, or await close() when done:
+
+        async with AsyncTransmartV2(host, kc_url=..., kc_realm=...) as api:
+            counts = await asyncio.gather(
+                *[api.observations.counts_per_concept(c) for c in constraints])
+    """
+
+    def __init__(self, host, offline_token=None, kc_url=None, kc_realm=None,
+                 client_id=None, print_urls=False, verify=None, pool_size=100, timeout=300,
+                 token_cache=None):
+        """
+        Create the asyncio python transmart client by providing user credentials.
+
+        :param host: a transmart URL (e.g. http://transmart-test.thehyve.net)
+        :param offline_token: if not given, it asks for it.
+        :param kc_url: KeyCloak hostname (e.g. https://keycloak-test.thehyve.net)
+        :param kc_realm: Realm that is registered for the transmart api host to listen.
+        :param client_id: client id in keycloak.
+        :param print_urls: print the url of handles being used.
+        :param verify: Either a boolean, in which case it controls whether we verify
+        the server’s TLS certificate, or a string, in which case it must be a path
+        to a CA bundle to use. Defaults to True.
+        :param pool_size: maximum number of simultaneous connections.
+        :param timeout: total number of seconds a single request may take.
+        :param token_cache: True or a TokenCache to share access tokens with other
+        processes and clients, see TransmartV2.
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncTransmartV2 requires aiohttp, install it with '
+                              '`pip install transmart[async]`.')
+
+        self.host = host
+        self.print_urls = print_urls
+        self.verify = verify
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._token_lock = None
+
+        # The token is fetched on the first query, through the event loop.
+        self.auth = get_auth(host, offline_token, kc_url, kc_realm, client_id,
+                             token_cache=token_cache, fetch_token=False)
+
+        self._observation_call_factory('aggregates_per_concept')
+        self._observation_call_factory('counts')
+        self._observation_call_factory('counts_per_concept')
+        self._observation_call_factory('counts_per_study')
+        self._observation_call_factory('counts_per_study_and_concept')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def session(self):
+        """ aiohttp.ClientSession, created in the running event loop on first use. """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ssl=_ssl_context(self.verify))
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def access_token(self):
+        """ Current access token, refreshed without blocking the event loop. """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+
+        async with self._token_lock:
+            return await self.auth.access_token_async(self.session)
+
+    async def query(self, q):
+        """ Perform query using API client using a Query object """
+
+        url = "{}{}".format(self.host, q.handle)
+
+        headers = q.headers
+        headers['Authorization'] = 'Bearer ' + await self.access_token()
+
+        kwargs = dict(params=_query_params(q.params), headers=headers)
+        if q.method.upper() != 'GET':
+            kwargs['json'] = q.json
+
+        async with self.session.request(q.method.upper(), url, **kwargs) as r:
+            if self.print_urls:
+                print(unquote_plus(str(r.url)))
+
+            if r.status == 200 or r.status == 201:
+                return await r.json(content_type=None)
+            else:
+                logger.error(json.dumps(await r.json(content_type=None), indent=2))
+                raise Exception('Error retrieving data')
+
+    @default_constraint
+    @add_to_queryable
+    async def observations(self, constraint=None, as_dataframe=False, **kwargs):
+        """
+        Get observations, from the main table in the transmart data model.
+
+        :param constraint: Constraint object. If left None, any keyword arguments
+           are added to the constraint.
+        :param as_dataframe: If True, convert json response to dataframe directly
+        :return: dataframe or direct json
+        """
+        q = Query(handle='/v2/observations',
+                  method='POST',
+                  json={
+                      'type': 'clinical',
+                      'constraint': constraint_to_dict(constraint)
+                  })
+
+        observations = ObservationSet(await self.query(q))
+
+        if as_dataframe:
+            return observations.dataframe
+
+        return observations
+
+    def _observation_call_factory(self, handle, doc=None):
+
+        async def func(constraint=None, *args, **kwargs):
+            q = Query(handle='/v2/observations/' + handle,
+                      method='POST',
+                      json={
+                          'constraint': constraint_to_dict(constraint)
+                      })
+            return await self.query(q)
+
+        func.__doc__ = doc
+        self.observations.__dict__[handle] = add_to_queryable(default_constraint(func))
+
+    @default_constraint
+    @add_to_queryable
+    async def patients(self, constraint=None, **kwargs):
+        """
+        Get patients.
+
+        :param constraint: Constraint object. If left None, any keyword arguments
+           are added to the constraint.
+        :return: dataframe or direct json
+        """
+        q = Query(handle='/v2/patients',
+                  method='POST',
+                  json={
+                      'constraint': constraint_to_dict(constraint)
+                  })
+        return Patients(await self.query(q))
+
+    @default_constraint
+    @add_to_queryable
+    async def create_patient_set(self, name: str, constraint=None, **kwargs):
+        """
+        Create a patient set that can be reused at a later stage.
+
+        :param name: name of the patient set to create.
+        :param constraint: observation constraints to use in query.
+        :return: direct json
+        """
+        q = Query(handle='/v2/patient_sets',
+                  method="POST",
+                  params={"name": name},
+                  json=constraint_to_dict(constraint)
+                  )
+
+        return await self.query(q)
+
+    async def tree_nodes(self, root=None, depth=0, counts=False, tags=True, hal=False):
+        """
+        Return the tree hierarchy
+
+        :param root: Specify the root of the tree to be returned
+        :param depth: The number of levels from the root need to be returned
+        :param counts: Whether to include counts with the tree nodes
+        :param tags: Whether to include metadata tags with the tree nodes
+        :param hal: Whether to return Hal or not (JSON)
+        :return:
+        """
+
+        q = Query(handle='/v2/tree_nodes',
+                  params={'root': root,
+                          'depth': depth,
+                          'counts': counts,
+                          'tags': tags},
+                  hal=hal)
+
+        return TreeNodes(await self.query(q))
+
+    @default_constraint
+    @add_to_queryable
+    async def dimension_elements(self, dimension, constraint=None, **kwargs):
+        q = Query(handle='/v2/dimensions/{}/elements'.format(dimension),
+                  method='GET',
+                  params=dict(
+                      constraint=json.dumps(constraint_to_dict(constraint)))
+                  )
+
+        return await self.query(q)
@@ -1,8 +1,10 @@
+import threading
 import time
 
 import os
 import shutil
 from whoosh.fields import Schema, TEXT, NGRAM, NGRAMWORDS
+from whoosh.filedb.filestore import RamStorage
 from whoosh.index import create_in, exists_in, open_dir
 from whoosh.qparser import MultifieldParser, FuzzyTermPlugin
 
@@ -17,11 +19,19 @@ def clear_cache():
 
 class ConceptSearcher:
 
-    def __init__(self, tree_dict, tree_identity):
+    def __init__(self, tree_dict, tree_identity=None):
+        """
+        :param tree_dict: dictionary of full name to tree node.
+        :param tree_identity: identity of the full tree, to cache its index on disk.
+        If None, the index is kept in memory and nodes can be added later, for
+        trees that are loaded partially.
+        """
         self.ix = None
         self.parser = None
         self.id_ = tree_identity
         self._tree_dict = tree_dict
+        self._indexed = set()
+        self._lock = threading.Lock()
         self.get_schema()
 
     def search(self, query_string, limit=50, allowed_nodes: set=None):
@@ -38,7 +48,24 @@ class ConceptSearcher:
             results = searcher.search(query, limit=limit, filter=allowed_nodes)
             return [r['fullname'] for r in results]
 
+    def add(self, tree_dict):
+        """ Add the nodes of tree_dict that are not indexed yet. """
+        with self._lock:
+            nodes = [(k, v) for k, v in tree_dict.items() if k not in self._indexed]
+            if not nodes:
+                return
+            with self.ix.writer() as writer:
+                for key, value in nodes:
+                    writer.add_document(**self._document(key, value))
+            self._indexed.update(k for k, _ in nodes)
+
     def get_schema(self):
+        if self.id_ is None:
+            self.ix = RamStorage().create_index(self._schema())
+            self.add(self._tree_dict)
+            self._create_parser()
+            return
+
         schema_dir = os.path.join(cache_dir, self.id_)
         os.makedirs(schema_dir, exist_ok=True)
 
@@ -53,13 +80,16 @@ class ConceptSearcher:
             self.__build_whoosh_index(schema_dir)
             print('Finished in {:.2f} seconds'.format(time.time() - now))
 
+        self._create_parser()
+
+    def _create_parser(self):
         self.parser = MultifieldParser(
             self.ix.schema.names(),
             schema=self.ix.schema)
         self.parser.add_plugin(FuzzyTermPlugin())
 
-    def __build_whoosh_index(self, schema_dir):
-
+    @staticmethod
+    def _schema():
         fields = dict(
             node=TEXT(),
             fullname=TEXT(stored=True),
@@ -69,17 +99,23 @@ class ConceptSearcher:
             name=NGRAMWORDS(minsize=3, field_boost=3.0),
             metadata=NGRAMWORDS(minsize=3),
         )
-        schema = Schema(**fields)
-        self.ix = create_in(schema_dir, schema)
+        return Schema(**fields)
+
+    @staticmethod
+    def _document(key, value):
+        return dict(
+            node=key.replace('\\', ' ').replace('_', ' '),
+            path=value.get('conceptPath'),
+            fullname=key,
+            type=value.get('type'),
+            study=str(value.get('studyId')),
+            name=str(value.get('name')),
+            metadata=str(value.get('metadata'))
+        )
+
+    def __build_whoosh_index(self, schema_dir):
+        self.ix = create_in(schema_dir, self._schema())
 
         with self.ix.writer(procs=2, multisegment=True, limitmb=512) as writer:
             for key, value in self._tree_dict.items():
-                writer.add_document(
-                    node=key.replace('\\', ' ').replace('_', ' '),
-                    path=value.get('conceptPath'),
-                    fullname=key,
-                    type=value.get('type'),
-                    study=str(value.get('studyId')),
-                    name=str(value.get('name')),
-                    metadata=str(value.get('metadata'))
-                )
+                writer.add_document(**self._document(key, value))
@@ -10,7 +10,6 @@ import arrow
 from functools import wraps
 
 from . import atomic
-from ..widgets import ConceptPicker, ConstraintWidget
 from ...commons import INPUT_DATE_FORMATS, input_check
 
 
@@ -243,6 +242,8 @@ class ObservationConstraint(Queryable, Grouper):
         self.api = api
 
         if api is not None:
+            # Widgets load ipywidgets and IPython, so import them only when needed.
+            from ..widgets import ConstraintWidget
             self._details_widget = ConstraintWidget(self)
 
             for name, method in _find_query_methods(api):
@@ -545,6 +546,7 @@ class ObservationConstraint(Queryable, Grouper):
         if self.api is None:
             raise AttributeError('{}.api not set. Cannot be interactive.'.format(self.__class__))
 
+        from ..widgets import ConceptPicker
         cp = ConceptPicker(target=self.apply_tree_node_constraints, api=self.api)
         if search_string is not None:
             cp.search_bar.value = str(search_string)
@@ -24,8 +24,15 @@ debug_view = widgets.Output(layout={'border': '1px solid black'})
 
 class Dashboard:
 
-    def __init__(self, api, patients: Queryable=None):
+    def __init__(self, api, patients: Queryable=None, dtypes=None):
+        """
+        :param api: TransmartV2 client.
+        :param patients: constraint on the patients to show.
+        :param dtypes: None or 'compact', the column types of the observations,
+            see data_structures.compact_dtypes().
+        """
         self.api = api
+        self.dtypes = dtypes
         self.tiles = list()
         self.hypercube = Hypercube()
         self.__linked_tile = None
@@ -68,7 +75,7 @@ class Dashboard:
         if self.subject_set_id is not None:
             c.subject_set_id = self.subject_set_id
 
-        obs = self.api.observations(c)
+        obs = self.api.observations(c, dtypes=self.dtypes)
         self.hypercube.add_variable(obs.dataframe)
 
         name = obs.dataframe['concept.name'][0]
@@ -4,6 +4,7 @@
 * version 3.
 """
 import pandas as pd
+from pandas.api.types import union_categoricals
 
 concept_id = 'concept.conceptCode'
 trial_visit_id = 'trial visit.id'
@@ -22,6 +23,18 @@ dimensions = {
 value_columns = ['numericValue', 'stringValue']
 
 
+def _append(data, df):
+    """ Append the rows of df to data, keeping columns that are categorical in both categorical. """
+    if data.empty:
+        return df.reset_index(drop=True)
+    combined = pd.concat([data, df], ignore_index=True)
+    for column in combined.columns:
+        if column in data and column in df \
+                and data[column].dtype.name == 'category' and df[column].dtype.name == 'category':
+            combined[column] = union_categoricals([data[column], df[column]], ignore_order=True)
+    return combined
+
+
 class HypercubeException(Exception):
     pass
 
@@ -60,7 +73,7 @@ class Hypercube:
         self.study_concept_pairs.update(ns)
 
         sub_set = df.loc[:, self._cols]
-        self.data = self.data.append(sub_set, ignore_index=True)
+        self.data = _append(self.data, sub_set)
         self.total_subjects = len(self.data[patient_id].unique())
 
     def query(self, no_filter=False, **constraint_keywords):
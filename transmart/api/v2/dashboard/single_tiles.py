@@ -208,6 +208,8 @@ class PieTile(Tile):
     def set_values(self, values):
         pie = self.fig.marks[0]
         counts = values.value_counts()
+        # Categorical values also count categories without any values.
+        counts = counts[counts > 0]
         labels = list(pie.labels)
 
         sizes = []
@@ -1,8 +1,32 @@
+from array import array
+from itertools import chain
+
 import transmart
+from .hypercube_stream import iter_hypercube
+from ..instrumentation import timed
 
 if transmart.dependency_mode == "FULL":
+    import numpy as np
+    import pandas as pd
     from pandas.io.json import json_normalize
     from ..commons import get_dict_identity
+    from .hypercube_protobuf import (iter_hypercube_protobuf, declarations_to_dict,
+                                     element_tables, inline_value)
+
+_ABSENT = object()
+
+# Column types of the frames: None for the types json_normalize gives, or
+# 'compact' for categoricals, datetimes and downcast numbers, see compact_dtypes().
+DTYPES = (None, 'compact')
+# String columns with at most this share of distinct values become categoricals.
+CATEGORY_RATIO = 0.5
+
+# Keys of count and aggregate responses, and the levels nested below them.
+COUNT_LEVELS = {
+    'countsPerConcept': ('concept', ),
+    'countsPerStudy': ('study', 'concept'),
+    'aggregatesPerConcept': ('concept', ),
+}
 
 
 def _format_observations(observations_result):
@@ -42,23 +66,631 @@ def _format_observations(observations_result):
     return output_cells
 
 
+def _element_table(name, elements):
+    """ Normalize the elements of one dimension into a table, one row per element. """
+    if isinstance(elements, pd.DataFrame):
+        return elements
+    if all(isinstance(element, dict) for element in elements):
+        table = json_normalize(elements)
+        table.columns = ['{}.{}'.format(name, column) for column in table.columns]
+        return table
+    return pd.DataFrame({name: elements})
+
+
+def _flat_keys(name, element):
+    """ The columns json_normalize makes of an element in a cell, depth first, like pandas. """
+    if not isinstance(element, dict):
+        return [name]
+    keys = []
+    for key, value in element.items():
+        keys += _flat_keys('{}.{}'.format(name, key), value)
+    return keys
+
+
+def _referenced_elements(name, elements, codes):
+    """
+    The table of the elements that cells refer to, indexed by their element
+    codes, and the codes of the cells as rows of that table. Fields only
+    unreferenced elements have are left out, like json_normalize of the
+    cells does, and field types only depend on the referenced elements.
+
+    :return: table, codes, and the columns of every row of the table, or None if all rows have all columns.
+    """
+    used = np.unique(codes[codes >= 0])
+    rows = np.where(codes >= 0, np.searchsorted(used, codes), -1)
+    if isinstance(elements, pd.DataFrame):
+        return elements.iloc[used], rows, None
+    referenced = [elements[i] for i in used]
+    table = _element_table(name, referenced)
+    table.index = pd.Index(used)
+    return table, rows, [_flat_keys(name, element) for element in referenced]
+
+
+def _check_dtypes(dtypes):
+    if dtypes not in DTYPES:
+        raise ValueError('Unknown dtypes {!r}, choose from: {}'.format(dtypes, DTYPES))
+
+
+def _is_time_column(name):
+    """ Whether a column holds times or dates, e.g. 'start time' or 'patient.birthDate'. """
+    field = str(name).rsplit('.', 1)[-1].lower()
+    return field.endswith('time') or field.endswith('date')
+
+
+def _compact_column(name, series):
+    dtype = series.dtype
+    if dtype.kind == 'f':
+        values = series.values
+        if np.array_equal(values.astype(np.float32).astype(values.dtype), values, equal_nan=True):
+            return series.astype(np.float32)
+        return series
+    if dtype.kind == 'i':
+        return pd.to_numeric(series, downcast='integer')
+    if dtype.kind == 'u':
+        return pd.to_numeric(series, downcast='unsigned')
+    if dtype != object:
+        # Already categorical, datetime or boolean.
+        return series
+
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if _is_time_column(name) and kind in ('string', 'datetime', 'datetime64'):
+        try:
+            return pd.to_datetime(series, utc=True).dt.tz_localize(None)
+        except (ValueError, TypeError, OverflowError):
+            pass
+    if kind == 'string' and series.nunique() <= CATEGORY_RATIO * len(series):
+        return series.astype('category')
+    return series
+
+
+def compact_dtypes(frame):
+    """
+    Convert the columns of a frame to types that take less memory, without
+    losing information:
+
+    - strings that repeat become categoricals,
+    - times and dates become datetime64, in UTC,
+    - integers are downcast to the smallest integer type that holds them,
+    - floats become float32 if all values are exactly representable.
+
+    Categorical columns are grouped by their observed values only when
+    observed=True is passed to groupby or pivot_table.
+
+    :return: new dataframe.
+    """
+    if not len(frame.columns):
+        return frame.copy()
+    compact = pd.concat([_compact_column(name, frame.iloc[:, i]) for i, name in enumerate(frame.columns)],
+                        axis=1)
+    compact.columns = frame.columns
+    return compact
+
+
+def memory_report(frame, compact=None):
+    """
+    Memory used by every column of a frame, before and after compact_dtypes().
+
+    :param frame: dataframe to report on.
+    :param compact: its compact version, computed if not given.
+    :return: dataframe with per column the dtypes, the MB used and the ratio,
+        and a total row.
+    """
+    if compact is None:
+        compact = compact_dtypes(frame)
+    mb = 2 ** 20
+    report = pd.DataFrame({
+        'dtype': frame.dtypes.astype(str),
+        'MB': frame.memory_usage(deep=True, index=False) / mb,
+        'compact dtype': compact.dtypes.astype(str),
+        'compact MB': compact.memory_usage(deep=True, index=False) / mb,
+    })
+    report.loc['total'] = ['', report['MB'].sum(), '', report['compact MB'].sum()]
+    report['ratio'] = report['MB'] / report['compact MB']
+    return report
+
+
+class CellColumns:
+    """
+    Columnar buffers for hypercube cells. Dimension indexes and values are
+    appended per cell into typed arrays, and only expanded into the wide
+    dataframe, like json_normalize(_format_observations(...)), at the end.
+    """
+
+    def __init__(self, dimension_declarations):
+        self.indexed = [d['name'] for d in dimension_declarations if not d.get('inline')]
+        self.inline = [d['name'] for d in dimension_declarations if d.get('inline')]
+        self.indexes = [array('q') for _ in self.indexed]
+        self.inline_values = [[] for _ in self.inline]
+        self.numeric = array('d')
+        self.strings = []
+        # Whether a cell has the key, null values included, as json_normalize keeps those.
+        self.numeric_keys = array('b')
+        self.string_keys = array('b')
+        self.has_numeric = False
+        self.has_string = False
+        self.integer_values = True
+        self.size = 0
+
+    def append(self, cell):
+        """ Append a cell of a JSON hypercube. """
+        self.add([-1 if index is None else int(index) for index in cell['dimensionIndexes']],
+                 cell['inlineDimensions'],
+                 cell.get('numericValue', _ABSENT),
+                 cell.get('stringValue', _ABSENT))
+
+    def extend(self, cells):
+        """
+        Append a list of JSON hypercube cells. The indexes and values are
+        gathered column by column into arrays, instead of cell by cell.
+        """
+        if not cells:
+            return
+        n = len(cells)
+        indexes = [cell['dimensionIndexes'] for cell in cells]
+        width = len(indexes[0])
+        if width > len(self.indexed) or sum(map(len, indexes)) != n * width:
+            # Cells with differing numbers of indexes.
+            for cell in cells:
+                self.append(cell)
+            return
+
+        try:
+            indexes = np.fromiter(chain.from_iterable(indexes), dtype=np.int64, count=n * width)
+        except TypeError:
+            # None indexes become NaN, and are stored as -1.
+            indexes = np.array(indexes, dtype=np.float64).ravel()
+            indexes = np.where(np.isnan(indexes), -1, indexes).astype(np.int64)
+        indexes = indexes.reshape(n, width)
+        for i, column in enumerate(self.indexes):
+            if i < width:
+                column.frombytes(np.ascontiguousarray(indexes[:, i]).tobytes())
+            else:
+                column.frombytes(np.full(n, -1, dtype=np.int64).tobytes())
+
+        inline = [cell['inlineDimensions'] for cell in cells]
+        for i, column in enumerate(self.inline_values):
+            column.extend([values[i] for values in inline])
+
+        numeric = [cell.get('numericValue', np.nan) for cell in cells]
+        values = np.array(numeric)
+        if values.dtype.kind not in 'iu':
+            # Floats, or absent values as NaN and null values as None.
+            self.integer_values = False
+            values = np.array(numeric, dtype=np.float64)
+        self.numeric.frombytes(values.astype(np.float64).tobytes())
+        if numeric.count(None):
+            numeric_keys = np.array(['numericValue' in cell for cell in cells])
+        else:
+            numeric_keys = ~np.isnan(values.astype(np.float64))
+        self.numeric_keys.frombytes(numeric_keys.astype(np.int8).tobytes())
+        self.has_numeric = self.has_numeric or numeric_keys.any()
+
+        strings = [cell.get('stringValue', np.nan) for cell in cells]
+        if strings.count(None):
+            string_keys = np.array(['stringValue' in cell for cell in cells])
+        else:
+            string_keys = ~pd.isna(pd.Series(strings, dtype=object)).values
+        self.string_keys.frombytes(string_keys.astype(np.int8).tobytes())
+        self.has_string = self.has_string or string_keys.any()
+        self.strings.extend(strings)
+
+        self.size += n
+
+    def add(self, indexes, inline_values, numeric=_ABSENT, string=_ABSENT):
+        """ Append a cell. Indexes are zero-based, with -1 for absent elements. """
+        if len(indexes) < len(self.indexed):
+            indexes = list(indexes) + [-1] * (len(self.indexed) - len(indexes))
+        for column, index in zip(self.indexes, indexes):
+            column.append(index)
+
+        for column, value in zip(self.inline_values, inline_values):
+            column.append(value)
+
+        self.numeric_keys.append(numeric is not _ABSENT)
+        self.string_keys.append(string is not _ABSENT)
+        if numeric is not _ABSENT:
+            self.has_numeric = True
+        if numeric is _ABSENT or numeric is None:
+            self.numeric.append(np.nan)
+            self.integer_values = False
+        else:
+            self.numeric.append(numeric)
+            self.integer_values = self.integer_values and isinstance(numeric, int)
+
+        if string is _ABSENT:
+            self.strings.append(np.nan)
+        else:
+            self.has_string = True
+            self.strings.append(string)
+
+        self.size += 1
+
+    def star(self, dimension_elements, dtypes=None):
+        """
+        The buffered cells as an ObservationStar: a fact table with the
+        element codes of every cell, and a table of elements per dimension.
+
+        :param dimension_elements: the dimensionElements of the response, or
+            per dimension a dataframe with already normalized elements.
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        if not self.size:
+            return ObservationStar(pd.DataFrame(), {}, dtypes=dtypes)
+
+        columns = {}
+        dimensions = {}
+        element_keys = {}
+        for name, column in zip(self.indexed, self.indexes):
+            table, rows, element_keys[name] = _referenced_elements(
+                name, dimension_elements.get(name, []), np.frombuffer(column, dtype=np.int64))
+            columns[name] = rows.astype(_code_dtype(len(table)))
+            dimensions[name] = table
+
+        for name, values in zip(self.inline, self.inline_values):
+            series = pd.Series(values, dtype=object)
+            # Only inspect values one by one if their types differ.
+            mixed = pd.api.types.infer_dtype(series, skipna=True).startswith('mixed')
+            if mixed and any(isinstance(value, dict) for value in values):
+                flat = json_normalize([{name: value} for value in values])
+                for column in flat.columns:
+                    columns[column] = flat[column].values
+            else:
+                columns[name] = series.infer_objects().values
+
+        if self.has_string:
+            columns['stringValue'] = pd.Series(self.strings, dtype=object).infer_objects().values
+        if self.has_numeric:
+            numeric = np.frombuffer(self.numeric, dtype=np.float64)
+            if self.integer_values:
+                numeric = numeric.astype(np.int64)
+            elif np.isnan(numeric).all():
+                # Only null values, which json_normalize keeps as None.
+                present = np.frombuffer(self.numeric_keys, dtype=np.int8).astype(bool)
+                numeric = pd.Series(np.where(present, None, np.nan)).infer_objects().values
+            else:
+                numeric = numeric.copy()
+            columns['numericValue'] = numeric
+
+        facts = pd.DataFrame(columns, index=pd.RangeIndex(self.size))
+        key_patterns = self._key_patterns(facts, dimensions, element_keys)
+        if dtypes == 'compact':
+            facts = compact_dtypes(facts)
+        return ObservationStar(facts, dimensions, self.inline, key_patterns, dtypes)
+
+    def dataframe(self, dimension_elements, dtypes=None):
+        """
+        Expand the buffered cells into the wide observations dataframe.
+
+        :param dimension_elements: the dimensionElements of the response, or
+            per dimension a dataframe with already normalized elements.
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        return self.star(dimension_elements, dtypes).dataframe
+
+    def _key_patterns(self, facts, dimensions, element_keys):
+        """
+        The distinct lists of columns json_normalize makes of the cells, in
+        order of first appearance: the inline dimensions and values, then the
+        fields of their elements. Inline dimensions are listed by name.
+
+        :param facts: fact table of star(), with the rows of the element tables as codes.
+        :param dimensions: element tables of star().
+        :param element_keys: per dimension the columns of every row of its table, or None.
+        """
+        shapes = []
+        shape_keys = []
+        for name in self.indexed:
+            table, keys = dimensions[name], element_keys[name]
+            if keys is None:
+                keys = [list(table.columns)] * len(table)
+            # Number the distinct column lists of the elements, -1 for absent elements.
+            distinct = {}
+            ids = np.array([distinct.setdefault(tuple(k), len(distinct)) for k in keys] + [-1], dtype=np.int64)
+            shapes.append(ids.take(facts[name].values.astype(np.int64)))
+            shape_keys.append(list(distinct))
+        shapes.append(np.frombuffer(self.string_keys, dtype=np.int8).astype(np.int64))
+        shapes.append(np.frombuffer(self.numeric_keys, dtype=np.int8).astype(np.int64))
+        # Numbers of values per column, besides -1: shapes of elements, and key presence as 0 or 1.
+        sizes = [len(keys) for keys in shape_keys] + [2, 2]
+
+        if np.prod([size + 1 for size in sizes], dtype=float) < 2 ** 62:
+            # One number per cell, of which the distinct ones are found by hashing.
+            combined = np.zeros(self.size, dtype=np.int64)
+            radix = 1
+            for shape, size in zip(shapes, sizes):
+                combined += (shape + 1) * radix
+                radix *= size + 1
+            patterns = []
+            for number in pd.unique(combined):
+                pattern = []
+                for size in sizes:
+                    number, shape = divmod(int(number), size + 1)
+                    pattern.append(shape - 1)
+                patterns.append(pattern)
+        else:
+            patterns, first = np.unique(np.stack(shapes, axis=1), axis=0, return_index=True)
+            patterns = patterns[np.argsort(first)]
+
+        result = []
+        for pattern in patterns:
+            present = [(name, shape_keys[i][shape]) for i, (name, shape) in enumerate(zip(self.indexed, pattern))
+                       if shape >= 0]
+            # Like json_normalize: plain values first, in the order of the cell, then nested fields.
+            plain = [name for name, keys in present if keys == (name,)]
+            values = [key for key, has_key in zip(('stringValue', 'numericValue'), pattern[-2:]) if has_key]
+            nested = [key for name, keys in present if keys != (name,) for key in keys]
+            result.append(plain + self.inline + values + nested)
+        return result
+
+
+def _code_dtype(n):
+    """ Smallest signed integer type for codes up to n, with -1 for absent elements. """
+    for dtype in (np.int8, np.int16, np.int32):
+        if n <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def decode_observations(observations_result, dtypes=None):
+    """
+    Expand a JSON /v2/observations response into the observations dataframe,
+    the same as json_normalize(_format_observations(...)). The elements of
+    every dimension are normalized once, and their columns are expanded to
+    the cells with array take operations.
+
+    :param dtypes: None or 'compact', see compact_dtypes().
+    """
+    columns = CellColumns(observations_result['dimensionDeclarations'])
+    with timed('format'):
+        columns.extend(observations_result['cells'])
+    with timed('normalize'):
+        return columns.dataframe(observations_result['dimensionElements'], dtypes)
+
+
+def decode_hypercube_stream(chunks, dtypes=None):
+    """
+    Decode a streamed /v2/observations response into the observations dataframe.
+    Cells are moved into columnar buffers as they arrive from the socket.
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    :param dtypes: None or 'compact', see compact_dtypes().
+    """
+    star = read_hypercube_stream(chunks, dtypes)
+    with timed('normalize'):
+        return star.dataframe
+
+
+def read_hypercube_stream(chunks, dtypes=None):
+    """
+    Decode a streamed /v2/observations response into an ObservationStar.
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    :param dtypes: None or 'compact', see compact_dtypes().
+    """
+    declarations = None
+    columns = None
+    elements = {}
+
+    # Includes waiting for the download, as cells are decoded while they arrive.
+    with timed('decode'):
+        for key, value in iter_hypercube(chunks):
+            if key == 'cell':
+                if columns is None:
+                    raise ValueError('Received cells before dimensionDeclarations.')
+                columns.append(value)
+            elif key == 'dimensionDeclarations':
+                declarations = value
+                columns = CellColumns(declarations)
+            elif key == 'dimensionElements':
+                elements = value
+
+    if columns is None:
+        return ObservationStar(pd.DataFrame(), {}, dtypes=dtypes)
+
+    with timed('normalize'):
+        return columns.star(elements, dtypes)
+
+
+def decode_hypercube_protobuf(chunks, dtypes=None):
+    """
+    Decode a protobuf /v2/observations response into the observations dataframe.
+    Dimension elements are read column-wise into typed arrays.
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    :param dtypes: None or 'compact', see compact_dtypes().
+    """
+    star = read_hypercube_protobuf(chunks, dtypes)
+    with timed('normalize'):
+        return star.dataframe
+
+
+def read_hypercube_protobuf(chunks, dtypes=None):
+    """
+    Decode a protobuf /v2/observations response into an ObservationStar.
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    :param dtypes: None or 'compact', see compact_dtypes().
+    """
+    columns = None
+    header = None
+    footer = None
+    n_inline = 0
+
+    # Includes waiting for the download, as cells are decoded while they arrive.
+    with timed('decode'):
+        for key, message in iter_hypercube_protobuf(chunks):
+            if key == 'cell':
+                inline = [inline_value(v) for v in message.inlineDimensions]
+                if message.absentInlineDimensions:
+                    absent = set(message.absentInlineDimensions)
+                    values = iter(inline)
+                    inline = [None if i in absent else next(values) for i in range(n_inline)]
+
+                kind = message.WhichOneof('value')
+                columns.add([index - 1 for index in message.dimensionIndexes],
+                            inline,
+                            message.numericValue if kind == 'numericValue' else _ABSENT,
+                            message.stringValue if kind == 'stringValue' else _ABSENT)
+
+            elif key == 'header':
+                header = message
+                columns = CellColumns(declarations_to_dict(header))
+                n_inline = len(columns.inline)
+
+            elif key == 'footer':
+                footer = message
+
+    if not header.dimensionDeclarations:
+        return ObservationStar(pd.DataFrame(), {}, dtypes=dtypes)
+
+    with timed('normalize'):
+        return columns.star(element_tables(header.dimensionDeclarations, footer), dtypes)
+
+
 class ObservationSet:
-    """ Class to represent observation sets from tranSMART API v2 """
+    """
+    Class to represent observation sets from tranSMART API v2.
 
-    def __init__(self, json):
+    The response is only decoded when it is used: len(), concepts, patients
+    and elements() read the dimension indexes of the cells, select() joins
+    only the requested columns, and the full dataframe is built on first access.
+    """
+
+    def __init__(self, json, dataframe=None, dtypes=None, keep_json=True):
+        """
+        :param json: the /v2/observations response.
+        :param dataframe: the decoded observations, if already available.
+        :param dtypes: None, or 'compact' for categoricals, datetimes and
+            downcast numbers, see compact_dtypes().
+        :param keep_json: if False, json is set to None once the response is
+            decoded, so the raw response can be freed.
+        """
+        _check_dtypes(dtypes)
         self.json = json
-        try:
-            self.dataframe = json_normalize(_format_observations(self.json))
-        except:
-            print(self.json)
-            raise
+        self.dtypes = dtypes
+        self.keep_json = keep_json
+        self._star = None
+        self._dataframe = None
+        if dataframe is not None:
+            self._dataframe = dataframe if dtypes is None else compact_dtypes(dataframe)
+
+    def __len__(self):
+        if self._dataframe is not None:
+            return len(self._dataframe)
+        if self._star is not None or self.json is None:
+            return len(self.star)
+        return len(self.json['cells'])
+
+    @property
+    def decoded(self):
+        """ Whether the wide dataframe has been built. """
+        return self._dataframe is not None
+
+    @property
+    def star(self):
+        """ The observations as an ObservationStar, decoded from json on first access. """
+        if self._star is None:
+            if self.json is None:
+                raise ValueError('The raw response is not available to decode.')
+            try:
+                self._star = ObservationStar.from_json(self.json, self.dtypes)
+            except:
+                print(self.json)
+                raise
+            if not self.keep_json:
+                self.json = None
+        return self._star
+
+    @property
+    def dataframe(self):
+        """ The wide dataframe, with a row per cell and the fields of its elements. """
+        if self._dataframe is None:
+            star = self.star
+            with timed('normalize'):
+                self._dataframe = star.dataframe
+        return self._dataframe
+
+    @dataframe.setter
+    def dataframe(self, dataframe):
+        self._dataframe = dataframe
+
+    def select(self, *columns):
+        """
+        Build only some columns of the wide dataframe, joining only the
+        dimensions they belong to.
+
+        :param columns: names of columns of the dataframe, e.g. 'patient.inTrialId'.
+        :return: new dataframe.
+        """
+        if self._dataframe is not None:
+            return self._dataframe.loc[:, list(columns)]
+        return self.star.select(*columns)
+
+    def iter_batches(self, rows):
+        """
+        Iterate over the wide dataframe in batches, for writing large results
+        in chunks. Batches are joined from the star schema one at a time, with
+        the same dimension tables, so only one batch is expanded at once.
+
+        :param rows: maximum number of cells per batch.
+        :return: iterator of dataframes with the columns of the dataframe,
+            indexed by row number.
+        """
+        if self._dataframe is not None:
+            _check_batch_rows(rows)
+            return (self._dataframe.iloc[start:start + rows] for start in range(0, len(self._dataframe), rows))
+        return self.star.iter_batches(rows)
+
+    def elements(self, dimension):
+        """
+        The elements of an indexed dimension that occur in the observations,
+        in order of first appearance. This only reads the dimension indexes of
+        the cells, without building the dataframe.
+
+        :param dimension: name of an indexed dimension, e.g. 'patient'.
+        :return: dataframe with a row per element, indexed by element code.
+        """
+        if self._star is None and self.json is not None:
+            declarations = [d['name'] for d in self.json['dimensionDeclarations'] if not d.get('inline')]
+            if dimension not in declarations:
+                raise ValueError('Unknown dimension {!r}, choose from: {}'.format(dimension, declarations))
+            codes = _cell_codes(self.json['cells'], declarations.index(dimension))
+            table = _element_table(dimension, self.json['dimensionElements'].get(dimension, []))
+        elif self._star is None and self._dataframe is not None:
+            # Only the dataframe is available, e.g. of combined shards.
+            frame = self._dataframe
+            fields = [c for c in frame.columns if c == dimension or c.startswith(dimension + '.')]
+            if not fields:
+                raise ValueError('Unknown dimension {!r}'.format(dimension))
+            return frame.loc[:, fields].dropna(how='all').drop_duplicates()
+        else:
+            return self.star.elements(dimension)
+
+        codes = pd.unique(codes[codes >= 0])
+        return table.iloc[codes].set_index(pd.Index(codes))
+
+    @property
+    def concepts(self):
+        """ Paths of the concepts of the observations, in order of first appearance. """
+        return np.asarray(self.elements('concept')['concept.conceptPath'])
+
+    @property
+    def patients(self):
+        """ The patients of the observations, a row per patient, see elements(). """
+        return self.elements('patient')
 
     @property
     def all_concepts(self):
-        return self.dataframe.loc[:, 'concept.conceptPath'].unique()
+        if self._dataframe is None:
+            return self.concepts
+        return np.asarray(self._dataframe.loc[:, 'concept.conceptPath'].unique())
+
+    def memory_report(self):
+        """ Memory per column of the dataframe, and with compact dtypes, see memory_report(). """
+        return memory_report(self.dataframe)
 
     def aggregate_numeric_on_trial_visit(self, concept):
-        concept_groups = self.dataframe.groupby('concept.conceptPath')
+        concept_groups = self.dataframe.groupby('concept.conceptPath', observed=True)
         concept_group = concept_groups.get_group(concept)
         columns_of_interest = ['patient.inTrialId', 'trial visit.relTimeLabel', 'numericValue']
         df_subset = concept_group.loc[:, columns_of_interest]
@@ -66,23 +698,297 @@ class ObservationSet:
         return df_subset.pivot_table(index='visit_label',
                                      values='value',
                                      columns='subject',
-                                     aggfunc='mean')
+                                     aggfunc='mean',
+                                     observed=True)
+
+    @classmethod
+    def from_stream(cls, chunks, dtypes=None):
+        """
+        Create an observation set from a streamed /v2/observations response,
+        decoding cells while they are downloaded. The raw JSON is not kept,
+        so json is None.
+
+        :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        return cls._from_star(read_hypercube_stream(chunks, dtypes))
+
+    @classmethod
+    def from_protobuf(cls, chunks, dtypes=None):
+        """
+        Create an observation set from a protobuf /v2/observations response.
+        The raw response is not kept, so json is None.
+
+        :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        return cls._from_star(read_hypercube_protobuf(chunks, dtypes))
+
+    @classmethod
+    def _from_star(cls, star):
+        """ Observation set of a decoded star schema, of which the dataframe is joined when used. """
+        observations = cls(None, dtypes=star.dtypes)
+        observations._star = star
+        return observations
+
+
+def _check_batch_rows(rows):
+    if rows < 1:
+        raise ValueError('rows should be at least 1, got {}.'.format(rows))
+
+
+def _cell_codes(cells, position):
+    """ The element codes at a position of the dimension indexes of JSON cells, -1 where absent. """
+    def code(indexes):
+        index = indexes[position] if position < len(indexes) else None
+        return -1 if index is None else index
+    return np.fromiter((code(cell['dimensionIndexes']) for cell in cells), dtype=np.int64, count=len(cells))
+
+
+class ObservationStar(ObservationSet):
+    """
+    Observations as a star schema. The facts table has a row per cell with
+    an integer code for every indexed dimension, the row of its element in
+    the table of that dimension or -1 if absent, the inline dimensions and
+    the values. dimensions holds a table of distinct elements per dimension.
+
+    This takes far less memory than the wide dataframe, which repeats the
+    element fields on every row, and grouping by codes is fast. The wide
+    dataframe is only joined when it is used.
+    """
+
+    def __init__(self, facts, dimensions, inline=(), key_patterns=None, dtypes=None):
+        """
+        :param facts: fact table, see above.
+        :param dimensions: dictionary of dimension name to element table.
+        :param inline: names of the inline dimensions.
+        :param key_patterns: distinct column lists of the cells in order of appearance,
+            to order the wide columns like json_normalize does.
+        :param dtypes: None or 'compact', the column types of the wide dataframe,
+            see compact_dtypes().
+        """
+        _check_dtypes(dtypes)
+        self.json = None
+        self.dtypes = dtypes
+        self.facts = facts
+        self.dimensions = dimensions
+        self.inline = list(inline)
+        self._key_patterns = key_patterns
+        self._dataframe = None
+        # Dimensions of which fields get NaN for absent elements, even if all are present.
+        self._padded = ()
+
+    def __len__(self):
+        return len(self.facts)
+
+    @property
+    def star(self):
+        return self
+
+    @property
+    def dataframe(self):
+        """ The wide dataframe, with the fields of all elements, as ObservationSet has it. """
+        if self._dataframe is None:
+            compact = self.dtypes == 'compact'
+            frame = self.join(drop_absent=True, categorical=compact)
+            if self._key_patterns is not None:
+                frame = frame[self._column_order(list(frame.columns))]
+            self._dataframe = compact_dtypes(frame) if compact else frame
+        return self._dataframe
+
+    @property
+    def all_concepts(self):
+        return self.labels('concept', 'concept.conceptPath').unique()
+
+    def iter_batches(self, rows):
+        _check_batch_rows(rows)
+        return self._iter_batches(rows)
+
+    def _iter_batches(self, rows):
+        # Leave out the same dimensions as the full dataframe, so all batches have its columns.
+        absent = [name for name in self.dimensions
+                  if name in self.facts and not (self.facts[name].values >= 0).any()]
+        # Fields of dimensions with absent elements anywhere get the same types in all batches.
+        padded = [name for name in self.dimensions
+                  if name in self.facts and (self.facts[name].values < 0).any()]
+        compact = self.dtypes == 'compact'
+        order = None
+        for start in range(0, len(self.facts), rows):
+            batch = ObservationStar(self.facts.iloc[start:start + rows].drop(columns=absent),
+                                    self.dimensions, self.inline)
+            batch._padded = padded
+            # String fields become categoricals of all elements, so their categories are the same in every batch.
+            batch = batch.join(categorical=compact)
+            if order is None:
+                order = list(batch.columns)
+                if self._key_patterns is not None:
+                    order = self._column_order(order)
+            yield batch[order]
+
+    def elements(self, dimension):
+        if dimension not in self.dimensions:
+            raise ValueError('Unknown dimension {!r}, choose from: {}'.format(dimension, list(self.dimensions)))
+        codes = self.facts[dimension].values
+        # Tables of decoded responses are indexed by element code.
+        return self.dimensions[dimension].iloc[pd.unique(codes[codes >= 0])]
+
+    def select(self, *columns):
+        if self._dataframe is not None:
+            return self._dataframe.loc[:, list(columns)]
+        fields = {field: name for name, table in self.dimensions.items() for field in table.columns}
+        compact = self.dtypes == 'compact'
+        selected = {}
+        for column in columns:
+            if column in fields:
+                name = fields[column]
+                selected[column] = self._take(name, self.dimensions[name][column], compact)
+            elif column in self.facts.columns and column not in self.dimensions:
+                selected[column] = self.facts[column].values
+            else:
+                raise ValueError('Unknown column {!r}'.format(column))
+        frame = pd.DataFrame(selected, index=self.facts.index)
+        return compact_dtypes(frame) if compact else frame
+
+    def labels(self, dimension, field):
+        """
+        A field of the elements of a dimension, for every row of the facts.
+
+        :param dimension: name of an indexed dimension, e.g. 'concept'.
+        :param field: column of its element table, e.g. 'concept.conceptCode'.
+        :return: Series with the index of facts.
+        """
+        return pd.Series(self._take(dimension, self.dimensions[dimension][field]),
+                         index=self.facts.index, name=field)
+
+    def join(self, *dimensions, drop_absent=False, categorical=False):
+        """
+        The facts with the element fields of dimensions in place of their codes.
+
+        :param dimensions: names of indexed dimensions, defaults to all.
+        :param drop_absent: leave out dimensions without any element in the facts.
+        :param categorical: make string fields categoricals, directly from the codes.
+        :return: new dataframe, facts is not changed.
+        """
+        dimensions = dimensions or tuple(self.dimensions)
+        for name in dimensions:
+            if name not in self.dimensions:
+                raise ValueError('Unknown dimension {!r}, choose from: {}'.format(name, list(self.dimensions)))
+
+        columns = {}
+        for column in self.facts.columns:
+            if column not in dimensions or column not in self.dimensions:
+                columns[column] = self.facts[column].values
+                continue
+            if drop_absent and not (self.facts[column].values >= 0).any():
+                continue
+            table = self.dimensions[column]
+            for field in table.columns:
+                columns[field] = self._take(column, table[field], categorical)
+        return pd.DataFrame(columns, index=self.facts.index)
+
+    def _take(self, dimension, values, categorical=False):
+        """ Values of an element field for the codes of a dimension, NaN where absent. """
+        codes = self.facts[dimension].values
+        missing = codes < 0
+        if categorical and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+            # Elements may share a value, so map element codes to category codes.
+            value_codes, categories = pd.factorize(values, sort=True)
+            value_codes = np.append(value_codes, -1)
+            return pd.Categorical.from_codes(value_codes.take(np.where(missing, len(values), codes)),
+                                             categories=categories)
+        values = values.values
+        if missing.any() or dimension in self._padded:
+            # Point missing codes at an extra row of NaN.
+            codes = np.where(missing, len(values), codes)
+            values = pd.Series(values).reindex(range(len(values) + 1)).values
+        return values.take(codes)
+
+    def _column_order(self, columns):
+        """
+        Order columns like json_normalize does for the cells: by first
+        appearance in the key patterns, see CellColumns._key_patterns().
+        """
+        existing = set(columns)
+
+        def members(name):
+            if name in existing:
+                return [name]
+            # Inline dimensions flattened into several columns.
+            return [c for c in columns if c.startswith(name + '.')]
+
+        order = {}
+        for cell_keys in self._key_patterns:
+            for name in cell_keys:
+                order.update((c, None) for c in members(name) if c not in order)
+        return list(order) + [c for c in columns if c not in order]
+
+    @classmethod
+    def from_json(cls, json, dtypes=None):
+        """
+        Create the star schema from a JSON /v2/observations response.
+
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        columns = CellColumns(json['dimensionDeclarations'])
+        with timed('format'):
+            columns.extend(json['cells'])
+        with timed('normalize'):
+            return columns.star(json['dimensionElements'], dtypes)
+
+    @classmethod
+    def from_stream(cls, chunks, dtypes=None):
+        """
+        Create the star schema from a streamed /v2/observations response.
+
+        :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        return read_hypercube_stream(chunks, dtypes)
+
+    @classmethod
+    def from_protobuf(cls, chunks, dtypes=None):
+        """
+        Create the star schema from a protobuf /v2/observations response.
+
+        :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        return read_hypercube_protobuf(chunks, dtypes)
 
 
 class ObservationSetHD:
 
-    def __init__(self, json):
+    def __init__(self, json, dataframe=None, dtypes=None):
+        """
+        :param json: the /v2/observations response.
+        :param dataframe: the decoded observations, if already available.
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        _check_dtypes(dtypes)
         self.json = json
+        if dataframe is not None:
+            self.dataframe = dataframe if dtypes is None else compact_dtypes(dataframe)
+            return
         try:
-            self.dataframe = json_normalize(_format_observations(self.json))
+            self.dataframe = decode_observations(self.json, dtypes)
             assert not self.dataframe.shape == (0, 0)
         except:
             print(self.json)
             raise
 
+    @classmethod
+    def from_protobuf(cls, chunks, dtypes=None):
+        """
+        Create a high dimensional observation set from a protobuf response.
+
+        :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+        :param dtypes: None or 'compact', see compact_dtypes().
+        """
+        return cls(None, dataframe=decode_hypercube_protobuf(chunks, dtypes))
+
     @property
     def all_biomarkers(self):
-        return self.dataframe.groupby(['biomarker.biomarker', 'biomarker.label']).size()
+        return self.dataframe.groupby(['biomarker.biomarker', 'biomarker.label'], observed=True).size()
 
     def biomarker_boxplot(self):
         if len(self.all_biomarkers) > 1:
@@ -91,9 +997,12 @@ class ObservationSetHD:
 
 class Studies:
 
-    def __init__(self, json):
+    def __init__(self, json, dtypes=None):
+        _check_dtypes(dtypes)
         self.json = json
         self.dataframe = json_normalize(json['studies'])
+        if dtypes == 'compact':
+            self.dataframe = compact_dtypes(self.dataframe)
 
 
 class StudyList:
@@ -118,6 +1027,9 @@ class TreeNodes:
         return self.pretty()
 
     def create_tree_dict(self):
+        if self.dataframe.empty:
+            # No nodes, e.g. the subtree of an unknown root.
+            return {}
         filled_tree = self.dataframe.fillna('')
         concepts_sub_tree = filled_tree[filled_tree['type'] != 'UNKNOWN']
         return concepts_sub_tree.set_index('fullName').T.to_dict()
@@ -157,9 +1069,12 @@ class TreeNodes:
 
 class Patients:
 
-    def __init__(self, json):
+    def __init__(self, json, dtypes=None):
+        _check_dtypes(dtypes)
         self.json = json
         self.dataframe = json_normalize(json.get('patients'))
+        if dtypes == 'compact':
+            self.dataframe = compact_dtypes(self.dataframe)
 
 
 class PatientSets:
@@ -191,3 +1106,82 @@ class RelationTypes:
     def _ipython_key_completions_(self):
         return list(self.__dict__.keys())
 
+
+def _count_rows(counts, levels):
+    """ Yield (level values, counts) for the leaves of a nested count response. """
+    if not levels or 'observationCount' in counts or 'patientCount' in counts:
+        yield {}, counts
+        return
+
+    for key, value in counts.items():
+        for row, leaf in _count_rows(value, levels[1:]):
+            yield dict({levels[0]: key}, **row), leaf
+
+
+class BatchResult:
+    """
+    Results of TransmartV2.batch(), in the same order as the constraints.
+    Failed items are None in results, their exceptions are in errors.
+    """
+
+    def __init__(self, constraints, results, errors):
+        self.constraints = constraints
+        self.results = results
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __getitem__(self, item):
+        return self.results[item]
+
+    def __repr__(self):
+        return '{}({} results, {} errors)'.format(
+            self.__class__.__name__, len(self.results), len(self.errors))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def raise_for_errors(self):
+        """ Raise the exception of the first failed item, if any. """
+        if self.errors:
+            index = min(self.errors)
+            raise self.errors[index]
+
+    @property
+    def dataframe(self):
+        """
+        Combine all successful results in one dataframe. The 'constraint'
+        column holds the position of the constraint in the input.
+        """
+        frames = []
+        rows = []
+        for i, result in enumerate(self.results):
+            if result is None:
+                continue
+
+            if hasattr(result, 'dataframe'):
+                frames.append(result.dataframe.assign(constraint=i))
+                continue
+
+            for key, levels in COUNT_LEVELS.items():
+                if key in result:
+                    counts = _count_rows(result[key], levels)
+                    break
+            else:
+                counts = [({}, result)]
+
+            for row, leaf in counts:
+                rows.append(dict(constraint=i, **row, **leaf))
+
+        if rows:
+            frames.append(json_normalize(rows))
+
+        if not frames:
+            return pd.DataFrame()
+
+        return pd.concat(frames, ignore_index=True, sort=False)
@@ -0,0 +1,84 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger('tm-api')
+
+EXPORT_FORMATS = ('parquet', 'feather', 'csv')
+# Number of cells per row group, and per batch expanded in memory.
+DEFAULT_ROWS = 100000
+
+
+def check_export_format(format):
+    if format not in EXPORT_FORMATS:
+        raise ValueError('Unknown export format {!r}, choose from: {}'.format(format, EXPORT_FORMATS))
+    if format != 'csv' and pyarrow is None:
+        raise ImportError('Exporting to {} requires pyarrow, install it with '
+                          '`pip install transmart[export]`.'.format(format))
+
+
+def export_dtypes(format):
+    """
+    Column types to decode observations with for a format. Parquet and Feather
+    get categoricals, which are written as dictionary-encoded columns, CSV
+    gets the values as the dataframe has them.
+    """
+    return None if format == 'csv' else 'compact'
+
+
+def write_batches(batches, path, format='parquet'):
+    """
+    Write dataframes with the same columns to a single file, one row group
+    or record batch per dataframe, so only one of them is in memory at once.
+
+    :param batches: iterable of dataframes, e.g. ObservationSet.iter_batches().
+    :param path: file to write.
+    :param format: 'parquet', 'feather' (Arrow IPC) or 'csv'.
+    :return: number of rows written.
+    """
+    check_export_format(format)
+    if format == 'csv':
+        return _write_csv(batches, path)
+    return _write_arrow(batches, path, format)
+
+
+def _write_csv(batches, path):
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for batch in batches:
+            batch.to_csv(f, header=not rows, index=False)
+            rows += len(batch)
+    return rows
+
+
+def _write_arrow(batches, path, format):
+    rows = 0
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                schema = pyarrow.Schema.from_pandas(batch, preserve_index=False)
+                if format == 'parquet':
+                    writer = pyarrow.parquet.ParquetWriter(path, schema)
+                else:
+                    writer = pyarrow.ipc.new_file(path, schema)
+            table = pyarrow.Table.from_pandas(batch, schema=schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        logger.warning('No observations to export, {} is not written.'.format(path))
+    return rows
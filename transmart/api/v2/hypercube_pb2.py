@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: hypercube.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0fhypercube.proto\x12\thypercube\"\'\n\x05\x45rror\x12\r\n\x05\x65rror\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"w\n\x06Header\x12>\n\x15\x64imensionDeclarations\x18\x01 \x03(\x0b\x32\x1f.hypercube.DimensionDeclaration\x12\x1f\n\x05\x65rror\x18\x02 \x01(\x0b\x32\x10.hypercube.Error\x12\x0c\n\x04last\x18\x03 \x01(\x08\"\x7f\n\x14\x44imensionDeclaration\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x1d\n\x04type\x18\x02 \x01(\x0e\x32\x0f.hypercube.Type\x12*\n\x06\x66ields\x18\x03 \x03(\x0b\x32\x1a.hypercube.FieldDefinition\x12\x0e\n\x06inline\x18\x04 \x01(\x08\">\n\x0f\x46ieldDefinition\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x1d\n\x04type\x18\x02 \x01(\x0e\x32\x0f.hypercube.Type\"\xd3\x01\n\x04\x43\x65ll\x12\x18\n\x10\x64imensionIndexes\x18\x01 \x03(\x03\x12*\n\x10inlineDimensions\x18\x02 \x03(\x0b\x32\x10.hypercube.Value\x12\x1e\n\x16\x61\x62sentInlineDimensions\x18\x03 \x03(\x05\x12\x1f\n\x05\x65rror\x18\x04 \x01(\x0b\x32\x10.hypercube.Error\x12\x0c\n\x04last\x18\x05 \x01(\x08\x12\x15\n\x0bstringValue\x18\x06 \x01(\tH\x00\x12\x16\n\x0cnumericValue\x18\x07 \x01(\x01H\x00\x42\x07\n\x05value\"l\n\x05Value\x12\x15\n\x0bstringValue\x18\x01 \x01(\tH\x00\x12\x15\n\x0b\x64oubleValue\x18\x02 \x01(\x01H\x00\x12\x12\n\x08intValue\x18\x03 \x01(\x12H\x00\x12\x18\n\x0etimestampValue\x18\x04 \x01(\x03H\x00\x42\x07\n\x05value\"h\n\x06\x46ooter\x12/\n\tdimension\x18\x01 \x03(\x0b\x32\x1c.hypercube.DimensionElements\x12\x1f\n\x05\x65rror\x18\x02 \x01(\x0b\x32\x10.hypercube.Error\x12\x0c\n\x04last\x18\x03 \x01(\x08\"\x8a\x01\n\x11\x44imensionElements\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x36\n\x06\x66ields\x18\x02 \x03(\x0b\x32&.hypercube.DimensionElementFieldColumn\x12 \n\x18\x61\x62sentFieldColumnIndices\x18\x03 \x03(\x05\x12\r\n\x05\x65mpty\x18\x04 \x01(\x08\"\x8d\x01\n\x1b\x44imensionElementFieldColumn\x12\x13\n\x0bstringValue\x18\x01 \x03(\t\x12\x13\n\x0b\x64oubleValue\x18\x02 \x03(\x01\x12\x10\n\x08intValue\x18\x03 \x03(\x12\x12\x16\n\x0etimestampValue\x18\x04 \x03(\x03\x12\x1a\n\x12\x61\x62sentValueIndices\x18\x05 \x03(\x05*B\n\x04Type\x12\n\n\x06\x44OUBLE\x10\x00\x12\n\n\x06STRING\x10\x01\x12\x07\n\x03INT\x10\x02\x12\r\n\tTIMESTAMP\x10\x03\x12\n\n\x06OBJECT\x10\x04\x42=\n(org.transmartproject.rest.hypercubeProtoB\x11ObservationsProtob\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'hypercube_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  DESCRIPTOR._serialized_options = b'\n(org.transmartproject.rest.hypercubeProtoB\021ObservationsProto'
+  _TYPE._serialized_start=1100
+  _TYPE._serialized_end=1166
+  _ERROR._serialized_start=30
+  _ERROR._serialized_end=69
+  _HEADER._serialized_start=71
+  _HEADER._serialized_end=190
+  _DIMENSIONDECLARATION._serialized_start=192
+  _DIMENSIONDECLARATION._serialized_end=319
+  _FIELDDEFINITION._serialized_start=321
+  _FIELDDEFINITION._serialized_end=383
+  _CELL._serialized_start=386
+  _CELL._serialized_end=597
+  _VALUE._serialized_start=599
+  _VALUE._serialized_end=707
+  _FOOTER._serialized_start=709
+  _FOOTER._serialized_end=813
+  _DIMENSIONELEMENTS._serialized_start=816
+  _DIMENSIONELEMENTS._serialized_end=954
+  _DIMENSIONELEMENTFIELDCOLUMN._serialized_start=957
+  _DIMENSIONELEMENTFIELDCOLUMN._serialized_end=1098
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,153 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import google.protobuf.internal.decoder as decoder
+import numpy as np
+import pandas as pd
+
+from .hypercube_pb2 import Header, Cell, Footer, Type
+
+PROTOBUF_MEDIA_TYPE = 'application/x-protobuf'
+
+_field_values = {
+    Type.DOUBLE: ('doubleValue', np.float64),
+    Type.STRING: ('stringValue', object),
+    Type.INT: ('intValue', np.int64),
+    Type.TIMESTAMP: ('timestampValue', np.int64),
+    Type.OBJECT: ('stringValue', object),
+}
+
+
+def iter_delimited(chunks):
+    """
+    Yield the serialized messages of a stream of varint length-delimited messages.
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    """
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        pos = 0
+        while pos < len(buf):
+            try:
+                length, start = decoder._DecodeVarint(buf, pos)
+            except IndexError:
+                break
+            if start + length > len(buf):
+                break
+            yield bytes(buf[start:start + length])
+            pos = start + length
+        del buf[:pos]
+
+    if buf:
+        raise ValueError('Protobuf stream ended in the middle of a message.')
+
+
+def _check(message):
+    if message.HasField('error'):
+        raise Exception('Error retrieving data: {}'.format(message.error.message or message.error.error))
+    return message
+
+
+def iter_hypercube_protobuf(chunks):
+    """
+    Parse a protobuf hypercube response, see hypercube.proto.
+
+    Yields ('header', Header), then ('cell', Cell) for every cell as soon
+    as it is received, and finally ('footer', Footer).
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    """
+    messages = iter_delimited(chunks)
+
+    header = _check(Header.FromString(next(messages)))
+    yield 'header', header
+
+    if not header.last:
+        for data in messages:
+            cell = _check(Cell.FromString(data))
+            yield 'cell', cell
+            if cell.last:
+                break
+
+    yield 'footer', _check(Footer.FromString(next(messages)))
+
+
+def declarations_to_dict(header):
+    """ Dimension declarations in the format of the JSON hypercube. """
+    return [{'name': d.name,
+             'inline': d.inline,
+             'fields': [{'name': f.name, 'type': Type.Name(f.type)} for f in d.fields]}
+            for d in header.dimensionDeclarations]
+
+
+def format_timestamps(values):
+    """ Format milliseconds since epoch like the JSON hypercube does. """
+    return pd.to_datetime(values, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ').values
+
+
+def _column_array(column, type_):
+    attribute, dtype = _field_values[type_]
+    values = getattr(column, attribute)
+    absent = column.absentValueIndices
+
+    if type_ == Type.TIMESTAMP:
+        values, dtype = format_timestamps(values), object
+
+    if not absent:
+        return np.array(values, dtype=dtype)
+
+    # Absent values become NaN for numbers and None for other types, as in the JSON format.
+    if dtype is not object:
+        dtype = np.float64
+    size = len(values) + len(absent)
+    present = np.ones(size, dtype=bool)
+    present[list(absent)] = False
+    result = np.full(size, np.nan if dtype is np.float64 else None, dtype=dtype)
+    result[present] = values
+    return result
+
+
+def element_tables(declarations, footer):
+    """
+    Build a table per indexed dimension from the column-wise elements in the
+    footer, with the same columns json_normalize creates for JSON elements.
+    """
+    declarations = {d.name: d for d in declarations}
+    tables = {}
+
+    for elements in footer.dimension:
+        declaration = declarations[elements.name]
+        if elements.empty:
+            tables[elements.name] = pd.DataFrame()
+            continue
+
+        absent = set(elements.absentFieldColumnIndices)
+        if declaration.fields:
+            names = ['{}.{}'.format(elements.name, f.name) for f in declaration.fields]
+            types = [f.type for f in declaration.fields]
+        else:
+            names, types = [elements.name], [declaration.type]
+
+        arrays = {}
+        columns = iter(elements.fields)
+        for i, (name, type_) in enumerate(zip(names, types)):
+            if i not in absent:
+                arrays[name] = _column_array(next(columns), type_)
+
+        size = max((len(a) for a in arrays.values()), default=0)
+        for i in sorted(absent):
+            arrays[names[i]] = np.full(size, None, dtype=object)
+
+        tables[elements.name] = pd.DataFrame({name: arrays[name] for name in names})
+
+    return tables
+
+
+def inline_value(value):
+    kind = value.WhichOneof('value')
+    if kind == 'timestampValue':
+        return format_timestamps([value.timestampValue])[0]
+    return getattr(value, kind) if kind else None
@@ -0,0 +1,112 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import codecs
+import json
+import re
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class _JSONStream:
+    """
+    Text buffer over an iterable of bytes chunks that decodes one JSON
+    value at a time, reading more chunks only when it needs them.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, min_size=1):
+        """ Drop consumed text and read until at least min_size characters are buffered. """
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        parts = [self.buf]
+        size = len(self.buf)
+        while size < min_size and not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self._decode(b'', final=True)
+            else:
+                text = self._decode(chunk)
+            parts.append(text)
+            size += len(text)
+        self.buf = ''.join(parts)
+
+    def peek(self):
+        """ Next non-whitespace character. """
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError('Unexpected end of JSON stream.')
+            self._fill(len(self.buf) - self.pos + 1)
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected one of {!r} at position {}, got {!r}.'.format(chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """ Decode the next complete JSON value. """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number or literal at the end of the buffer may continue in the next chunk.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            # Double the buffered text, so large values are decoded in amortized linear time.
+            self._fill(2 * (len(self.buf) - self.pos) + 1)
+
+
+def iter_hypercube(chunks):
+    """
+    Incrementally parse a hypercube JSON response, as returned by /v2/observations.
+
+    Yields ('cell', cell) for every element of the cells array as soon as
+    it is received, and (key, value) for all other members of the
+    response, e.g. dimensionDeclarations and dimensionElements.
+
+    :param chunks: iterable of bytes, e.g. requests.Response.iter_content().
+    """
+    stream = _JSONStream(chunks)
+
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+
+    while True:
+        key = stream.value()
+        stream.expect(':')
+
+        if key == 'cells':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.pos += 1
+            else:
+                while True:
+                    yield 'cell', stream.value()
+                    if stream.expect(',]') == ']':
+                        break
+        else:
+            yield key, stream.value()
+
+        if stream.expect(',}') == '}':
+            return
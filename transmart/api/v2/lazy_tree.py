@@ -0,0 +1,179 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import logging
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('tm-api')
+
+DEFAULT_DEPTH = 2
+DEFAULT_PREFETCH = 8
+
+
+def _is_leaf(node):
+    return 'LEAF' in (node.get('visualAttributes') or [])
+
+
+class LazyTree(Mapping):
+    """
+    Partially loaded tree, that can be used as tree_dict: a mapping of full
+    name to tree node. Only the top levels are fetched at first, subtrees
+    are fetched with the root and depth parameters of tree_nodes when they
+    are expanded, or when a node below them is looked up. Expanded subtrees
+    are kept, and the subtrees of the folders just loaded are prefetched in
+    the background.
+
+    Iterating, len() and items() only cover the nodes loaded so far.
+    """
+
+    def __init__(self, api, depth=DEFAULT_DEPTH, prefetch=DEFAULT_PREFETCH, max_workers=2):
+        """
+        :param api: TransmartV2 client.
+        :param depth: number of levels fetched at once.
+        :param prefetch: maximum number of subtrees prefetched after a load, 0 to disable.
+        :param max_workers: number of threads used for prefetching.
+        """
+        if depth < 1:
+            raise ValueError('depth should be at least 1, got {}.'.format(depth))
+        self.api = api
+        self.depth = depth
+        self.prefetch_limit = prefetch
+        self._nodes = {}
+        self._children = {}
+        self._unexpanded = set()
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tm-tree')
+
+        self._prefetch(self._load(None))
+
+    def __repr__(self):
+        return '{}({} nodes loaded, {} folders not expanded)'.format(
+            self.__class__.__name__, len(self._nodes), len(self._unexpanded))
+
+    def __getitem__(self, full_name):
+        with self._lock:
+            if full_name in self._nodes:
+                return self._nodes[full_name]
+        self.load_path(full_name)
+        with self._lock:
+            return self._nodes[full_name]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._nodes))
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @property
+    def unexpanded(self):
+        """ Full names of the folders of which the children are not loaded yet. """
+        with self._lock:
+            return set(self._unexpanded)
+
+    def children(self, full_name):
+        """ Full names of the children of a node, expanding it if needed. """
+        self.expand(full_name)
+        with self._lock:
+            return list(self._children.get(full_name, []))
+
+    def on_load(self, func):
+        """ Register func(nodes) to be called with the tree_dict entries of every load. """
+        self._listeners.append(func)
+        return func
+
+    def expand(self, full_name, prefetch=True):
+        """
+        Load the subtree of a node, if not done yet.
+
+        :param full_name: full name of the node.
+        :param prefetch: prefetch the subtrees of its folders in the background.
+        """
+        with self._lock:
+            if full_name not in self._unexpanded:
+                return
+        loaded = self._load(full_name)
+        if prefetch:
+            self._prefetch(loaded)
+
+    def load_path(self, full_name):
+        """ Expand the ancestors of a node, from the top, until it is loaded. """
+        while True:
+            with self._lock:
+                if full_name in self._nodes:
+                    return
+                ancestors = [f for f in self._unexpanded if full_name.startswith(f)]
+            if not ancestors:
+                return
+            self.expand(max(ancestors, key=len), prefetch=False)
+
+    def load_all(self):
+        """ Expand all folders, which loads the full tree. """
+        while True:
+            futures = self.prefetch(self.unexpanded)
+            if not futures:
+                return
+            for future in futures:
+                future.result()
+
+    def prefetch(self, full_names):
+        """
+        Expand nodes in the background.
+
+        :return: list of futures, one for every node that was not expanded yet.
+        """
+        with self._lock:
+            full_names = [f for f in full_names if f in self._unexpanded]
+        return [self._executor.submit(self._background_expand, f) for f in full_names]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _background_expand(self, full_name):
+        try:
+            self.expand(full_name, prefetch=False)
+        except Exception as e:
+            logger.warning('Prefetching tree node {!r} failed: {!r}'.format(full_name, e))
+            raise
+
+    def _prefetch(self, folders):
+        if self.prefetch_limit:
+            self.prefetch(folders[:self.prefetch_limit])
+
+    def _load(self, root):
+        """ Fetch the subtree of root, or the top of the tree, and return its unexpanded folders. """
+        tree = self.api.tree_nodes(root=root, depth=self.depth)
+        top = tree.json.get('tree_nodes') or []
+        nodes = tree.tree_dict
+
+        folders = []
+        with self._lock:
+            stack = list(top)
+            while stack:
+                node = stack.pop()
+                full_name = node.get('fullName')
+                if 'children' in node:
+                    self._children[full_name] = [c.get('fullName') for c in node['children']]
+                    self._unexpanded.discard(full_name)
+                    stack.extend(node['children'])
+                elif not _is_leaf(node) and full_name not in self._children:
+                    self._unexpanded.add(full_name)
+                    folders.append(full_name)
+            if root is not None:
+                self._children.setdefault(root, [])
+                self._unexpanded.discard(root)
+            new = {k: v for k, v in nodes.items() if k not in self._nodes}
+            self._nodes.update(new)
+
+        if new:
+            for listener in self._listeners:
+                try:
+                    listener(new)
+                except Exception:
+                    logger.exception('Tree listener {!r} failed.'.format(listener))
+        return sorted(folders)
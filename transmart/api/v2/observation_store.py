@@ -0,0 +1,370 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .data_structures import ObservationSet, ObservationStar, _check_dtypes, _code_dtype
+from .sharding import concat_frames
+
+logger = logging.getLogger('tm-api')
+
+MANIFEST = 'manifest.json'
+STORE_VERSION = 1
+
+# The query keywords of dashboard.hypercube.Hypercube, and the columns they match.
+QUERY_COLUMNS = {
+    'concept': 'concept.conceptCode',
+    'study': 'study.name',
+    'trial_visit': 'trial visit.id',
+    'start_time': 'start time',
+    'subject': 'patient.id'
+}
+PATIENT_ID = QUERY_COLUMNS['subject']
+VALUE_COLUMNS = ['numericValue', 'stringValue']
+
+
+def _json_value(value):
+    """ JSON encoding of the numpy scalars in dictionaries. """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Cannot store {!r} in a dictionary.'.format(value))
+
+
+def _write_json(path, data):
+    """ Write JSON to a file, replacing it atomically. """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, default=_json_value)
+    os.replace(tmp, path)
+
+
+def _write_column(directory, file, name, series):
+    """
+    Write a column to file.npy, and return its manifest entry. Numbers are
+    written as they are, datetimes as int64 nanoseconds, and anything else
+    as integer codes into a dictionary of distinct values in file.json.
+    """
+    entry = {'name': name, 'file': file + '.npy', 'kind': 'array'}
+    dictionary = None
+    if series.dtype.name == 'category':
+        values = series.cat.codes.values
+        dictionary = series.cat.categories.tolist()
+        entry.update(kind='dictionary', categorical=True)
+    elif series.dtype.kind == 'M':
+        values = series.values.view(np.int64)
+        entry.update(kind='datetime')
+    elif series.dtype.kind in 'biuf':
+        values = series.values
+    else:
+        codes, uniques = pd.factorize(series.values)
+        values = codes.astype(_code_dtype(len(uniques)))
+        dictionary = uniques.tolist()
+        entry.update(kind='dictionary')
+
+    np.save(os.path.join(directory, entry['file']), np.ascontiguousarray(values), allow_pickle=False)
+    if dictionary is not None:
+        entry['dictionary'] = file + '.json'
+        _write_json(os.path.join(directory, entry['dictionary']), dictionary)
+    return entry
+
+
+def _study_concept_pairs(study_codes, concept_codes, tables):
+    """ The distinct (concept code, study name) pairs of the facts, as Hypercube.add_variable() checks them. """
+    if 'study' not in tables or 'concept' not in tables:
+        return set()
+    codes = pd.DataFrame({'study': study_codes, 'concept': concept_codes})
+    codes = codes[(codes.study >= 0) & (codes.concept >= 0)].drop_duplicates()
+    concepts = tables['concept'][QUERY_COLUMNS['concept']].values.take(codes.concept.values)
+    studies = tables['study'][QUERY_COLUMNS['study']].values.take(codes.study.values)
+    return set(zip(concepts, studies))
+
+
+def _matches(series, parameter):
+    """ Hypercube matching: equal to a value, or in a set, list or Series of values. """
+    if isinstance(parameter, (pd.Series, list, set)):
+        return series.isin(list(parameter)).values
+    return (series == parameter).values
+
+
+class _Column:
+    """ A memory-mapped column of a segment. """
+
+    def __init__(self, directory, entry):
+        self.name = entry['name']
+        self.kind = entry['kind']
+        self.categorical = entry.get('categorical', False)
+        self.values = np.load(os.path.join(directory, entry['file']), mmap_mode='r', allow_pickle=False)
+        self._dictionary_path = entry.get('dictionary') and os.path.join(directory, entry['dictionary'])
+        self._dictionary = None
+
+    @property
+    def dictionary(self):
+        """ Distinct values of a dictionary column, with NaN appended for code -1. """
+        if self._dictionary is None:
+            with open(self._dictionary_path, encoding='utf-8') as f:
+                values = json.load(f)
+            dictionary = np.empty(len(values) + 1, dtype=object)
+            dictionary[:-1] = values
+            dictionary[-1] = np.nan
+            self._dictionary = dictionary
+        return self._dictionary
+
+    def decode(self, rows=None):
+        """ The values of all rows, or of an array of row numbers. """
+        values = self.values if rows is None else self.values[rows]
+        if self.kind == 'datetime':
+            return np.asarray(values).view('M8[ns]')
+        if self.kind == 'dictionary':
+            if self.categorical:
+                return pd.Categorical.from_codes(values, categories=self.dictionary[:-1])
+            return self.dictionary.take(np.where(values < 0, len(self.dictionary) - 1, values))
+        return np.asarray(values)
+
+    def matches(self, parameter):
+        """ Mask of the rows that match a query parameter. """
+        if self.kind == 'dictionary':
+            codes = np.flatnonzero(_matches(pd.Series(self.dictionary[:-1]), parameter))
+            return np.isin(self.values, codes)
+        return _matches(pd.Series(self.decode()), parameter)
+
+
+class _Segment:
+    """ The observations of one ObservationStore.add(), in a directory of column files. """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.rows = manifest['rows']
+        self.dtypes = manifest['dtypes']
+        self.inline = manifest['inline']
+        self.key_patterns = manifest['key_patterns']
+        self.facts = {e['name']: _Column(directory, e) for e in manifest['facts']}
+        self.dimension_columns = {name: [_Column(directory, e) for e in entries]
+                                  for name, entries in manifest['dimensions'].items()}
+        self._tables = None
+
+    def __len__(self):
+        return self.rows
+
+    @staticmethod
+    def write(directory, star):
+        os.makedirs(directory)
+        facts = [_write_column(directory, 'facts.{}'.format(i), name, star.facts[name])
+                 for i, name in enumerate(star.facts.columns)]
+        dimensions = {}
+        for i, (dimension, table) in enumerate(star.dimensions.items()):
+            dimensions[dimension] = [_write_column(directory, 'dimension.{}.{}'.format(i, j), name, table[name])
+                                     for j, name in enumerate(table.columns)]
+        _write_json(os.path.join(directory, MANIFEST), {
+            'rows': len(star),
+            'dtypes': star.dtypes,
+            'inline': star.inline,
+            'key_patterns': star._key_patterns,
+            'facts': facts,
+            'dimensions': dimensions,
+        })
+
+    @property
+    def tables(self):
+        """ The element table per dimension, loaded on first use. """
+        if self._tables is None:
+            self._tables = {name: pd.DataFrame({c.name: c.decode() for c in columns})
+                            for name, columns in self.dimension_columns.items()}
+        return self._tables
+
+    def star(self, rows=None):
+        facts = pd.DataFrame({name: column.decode(rows) for name, column in self.facts.items()})
+        return ObservationStar(facts, self.tables, self.inline, self.key_patterns, self.dtypes)
+
+    def column(self, name, rows=None):
+        """ A column of the wide dataframe for some rows, without joining the others. """
+        if name in self.facts and name not in self.dimension_columns:
+            return self.facts[name].decode(rows)
+        for dimension, table in self.tables.items():
+            if name in table.columns:
+                codes = self.facts[dimension].values if rows is None else self.facts[dimension].values[rows]
+                values = np.append(table[name].values.astype(object), np.nan)
+                return values.take(np.where(codes < 0, len(values) - 1, codes))
+        return np.full(self.rows if rows is None else len(rows), np.nan)
+
+    def mask(self, **constraint_keywords):
+        """ Mask of the rows matching Hypercube query keywords, scanning the mapped columns. """
+        mask = np.ones(self.rows, dtype=bool)
+        for keyword, name in QUERY_COLUMNS.items():
+            if keyword not in constraint_keywords:
+                continue
+            parameter = constraint_keywords[keyword]
+            if name in self.facts and name not in self.dimension_columns:
+                mask &= self.facts[name].matches(parameter)
+                continue
+            dimension = next((d for d, table in self.tables.items() if name in table.columns), None)
+            if dimension is None:
+                return np.zeros(self.rows, dtype=bool)
+            codes = np.flatnonzero(_matches(self.tables[dimension][name], parameter))
+            mask &= np.isin(self.facts[dimension].values, codes)
+        return mask
+
+
+class ObservationStore:
+    """
+    Local store for observations larger than memory. Every added observation
+    set is written as a segment: a directory with a .npy file per column of
+    the star schema, memory-mapped when the store is opened, so opening
+    reads only the manifests. Element codes and values are stored as
+    arrays, other columns as integer codes into a dictionary of values.
+
+    Queries scan the mapped code columns and only decode the matching rows.
+    query(), subject_mask and total_subjects work as on the dashboard
+    Hypercube, with row numbers of the store as index.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory of the store, created if it does not exist.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        manifest = {'version': STORE_VERSION, 'segments': []}
+        path = os.path.join(directory, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') != STORE_VERSION:
+                raise ValueError('Unsupported observation store version {!r} in {}.'.format(
+                    manifest.get('version'), directory))
+        self._segment_names = manifest['segments']
+        self._segments = [_Segment(os.path.join(directory, name)) for name in self._segment_names]
+        self.study_concept_pairs = {tuple(pair) for pair in manifest.get('study_concept_pairs', [])}
+        self.dims = []
+        self._subject_mask = None
+        self._subject_bool_masks = None
+
+    def __repr__(self):
+        return '{}({!r}, {} observations in {} segments)'.format(
+            self.__class__.__name__, self.directory, len(self), len(self._segments))
+
+    def __len__(self):
+        return sum(len(segment) for segment in self._segments)
+
+    def add(self, observations, dtypes=None):
+        """
+        Add observations as a new segment, unless they have a study and
+        concept pair that is already stored, like Hypercube.add_variable().
+
+        :param observations: ObservationSet or ObservationStar, decoded from a
+            response, e.g. api.observations(..., keep_json=False).
+        :param dtypes: None or 'compact', the column types the observations
+            are stored and read with, defaults to those of observations.
+        :return: True if the observations were added.
+        """
+        _check_dtypes(dtypes)
+        if not isinstance(observations, ObservationSet):
+            raise ValueError('Expected an ObservationSet, got {!r}.'.format(type(observations)))
+        star = observations.star
+        if not len(star):
+            return False
+        if dtypes is not None and dtypes != star.dtypes:
+            star = ObservationStar(star.facts, star.dimensions, star.inline, star._key_patterns, dtypes)
+
+        pairs = set()
+        if 'study' in star.facts and 'concept' in star.facts:
+            pairs = _study_concept_pairs(star.facts['study'].values, star.facts['concept'].values, star.dimensions)
+        if self.study_concept_pairs.intersection(pairs):
+            logger.warning('Study and concept already stored, not adding {} observations.'.format(len(star)))
+            return False
+
+        index = len(self._segment_names)
+        while os.path.exists(os.path.join(self.directory, 'segment-{:05d}'.format(index))):
+            # Left by an add() that did not finish.
+            index += 1
+        name = 'segment-{:05d}'.format(index)
+        _Segment.write(os.path.join(self.directory, name), star)
+
+        self._segment_names.append(name)
+        self._segments.append(_Segment(os.path.join(self.directory, name)))
+        self.study_concept_pairs.update(pairs)
+        _write_json(os.path.join(self.directory, MANIFEST), {
+            'version': STORE_VERSION,
+            'segments': self._segment_names,
+            'study_concept_pairs': sorted(self.study_concept_pairs),
+        })
+        self.subject_mask = self._subject_mask
+        return True
+
+    def observations(self, **constraint_keywords):
+        """
+        The stored observations matching Hypercube query keywords, e.g.
+        concept='CV:DEM:AGE', or all observations.
+
+        :return: ObservationSet. Its dataframe is joined when it is used if
+            the observations come from a single segment.
+        """
+        selected = [(segment, np.flatnonzero(segment.mask(**constraint_keywords))) for segment in self._segments]
+        selected = [(segment, rows) for segment, rows in selected if len(rows)]
+        if len(selected) == 1:
+            segment, rows = selected[0]
+            return ObservationSet._from_star(segment.star(None if len(rows) == len(segment) else rows))
+        return ObservationSet(None, dataframe=concat_frames([segment.star(rows).dataframe
+                                                             for segment, rows in selected]))
+
+    @property
+    def subject_mask(self):
+        """
+        Controls a boolean mask on subjects. Setting this reduces the
+        values returned by self.query() method.
+        """
+        return self._subject_mask
+
+    @subject_mask.setter
+    def subject_mask(self, values):
+        self._subject_mask = values
+        self._subject_bool_masks = None
+        if values is not None:
+            self._subject_bool_masks = [segment.mask(subject=values) for segment in self._segments]
+
+    @property
+    def total_subjects(self):
+        ids = [segment.column(PATIENT_ID) for segment in self._segments]
+        if not ids:
+            return None
+        return len(pd.unique(pd.Series(np.concatenate(ids)).dropna()))
+
+    @property
+    def data(self):
+        """ The Hypercube columns of all observations, read into memory. """
+        return self._frame(list(QUERY_COLUMNS.values()) + VALUE_COLUMNS, no_filter=True)
+
+    def query(self, no_filter=False, **constraint_keywords):
+        """
+        Query the store like Hypercube.query(). Constraints are keyword arguments
+        where the value is either a value to look for, or a collection of values
+        provided as a set, list, or pd.Series.
+
+        :param no_filter: if this store has a subject mask, set this to True to bypass it.
+        :param constraint_keywords: Possible keywords [concept, study, trial_visit, subject, start_time].
+        :return: pd.Dataframe with values, indexed by row number in the store.
+        """
+        return self._frame([PATIENT_ID, *VALUE_COLUMNS], no_filter, **constraint_keywords)
+
+    def _frame(self, columns, no_filter=False, **constraint_keywords):
+        frames = []
+        offset = 0
+        for i, segment in enumerate(self._segments):
+            mask = segment.mask(**constraint_keywords)
+            if not no_filter and self._subject_bool_masks is not None:
+                mask &= self._subject_bool_masks[i]
+            rows = np.flatnonzero(mask)
+            frames.append(pd.DataFrame({name: segment.column(name, rows) for name in columns},
+                                       index=rows + offset))
+            offset += len(segment)
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames)
@@ -0,0 +1,108 @@
+"""
+* Copyright (c) 2015-2017 The Hyve B.V.
+* This code is licensed under the GNU General Public License,
+* version 3.
+"""
+import arrow
+import pandas as pd
+
+from .constraints.atomic import (StudyConstraint, ConceptCodeConstraint, SubjectSetConstraint,
+                                 StartTimeConstraint, StartTimeBeforeConstraint, StartTimeAfterConstraint)
+from .data_structures import decode_hypercube_stream, decode_hypercube_protobuf
+
+SHARD_DIMENSIONS = ('study', 'concept', 'start_time', 'patients')
+
+
+def partition(items, n):
+    """ Split items in at most n contiguous parts of nearly equal size. """
+    items = list(items)
+    n = max(1, min(n, len(items)))
+    size, rest = divmod(len(items), n)
+    parts, start = [], 0
+    for i in range(n):
+        end = start + size + (i < rest)
+        parts.append(items[start:end])
+        start = end
+    return [part for part in parts if part]
+
+
+def any_of(constraints):
+    """ Combine constraints with or, without nesting a single constraint. """
+    if len(constraints) == 1:
+        return constraints[0]
+    return {'type': 'or', 'args': constraints}
+
+
+def element_shards(constraint_type, values, n=None):
+    """
+    Shards selecting one dimension element each, or n shards that each
+    select a group of elements.
+
+    :param constraint_type: e.g. StudyConstraint or ConceptCodeConstraint.
+    :param values: element values, e.g. study ids or concept codes.
+    :param n: number of shards, defaults to one per element.
+    """
+    constraints = [constraint_type(value).json() for value in values]
+    if n is None:
+        return constraints
+    return [any_of(group) for group in partition(constraints, n)]
+
+
+def study_shards(elements, n=None):
+    return element_shards(StudyConstraint, [e['name'] for e in elements], n)
+
+
+def concept_shards(elements, n=None):
+    return element_shards(ConceptCodeConstraint, [e['conceptCode'] for e in elements], n)
+
+
+def patient_set_shards(patient_set_ids):
+    return [SubjectSetConstraint(id_).json() for id_ in patient_set_ids]
+
+
+def start_time_shards(boundaries):
+    """
+    Disjoint start time windows split at the boundary dates: before the
+    first date, between consecutive dates, from the last date on, and
+    a final shard for observations without a start time.
+
+    :param boundaries: list of dates, or anything else arrow.get() accepts.
+    """
+    dates = sorted({arrow.get(b).floor('day') for b in boundaries})
+    if not dates:
+        raise ValueError('Expected at least one boundary date to shard on start time.')
+
+    shards = [StartTimeBeforeConstraint(dates[0].shift(days=-1)).json()]
+    for start, end in zip(dates, dates[1:]):
+        shards.append(StartTimeConstraint([start, end.shift(days=-1)]).json())
+    shards.append(StartTimeAfterConstraint(dates[-1]).json())
+
+    # Everything not in any window, i.e. observations without start time.
+    shards.append({'type': 'negation', 'arg': any_of(list(shards))})
+    return shards
+
+
+def restrict(constraint, shard):
+    return {'type': 'and', 'args': [constraint, shard]}
+
+
+def parse_observations(content, format='json'):
+    """
+    Decode a complete /v2/observations response body into a dataframe.
+    Module level, so it can run in a worker process.
+    """
+    if format == 'protobuf':
+        return decode_hypercube_protobuf([content])
+    return decode_hypercube_stream([content])
+
+
+def concat_frames(frames):
+    """ Concatenate the frames of all shards, with the columns of the widest frame first. """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+
+    columns = list(max(frames, key=lambda f: f.shape[1]).columns)
+    result = pd.concat(frames, ignore_index=True, sort=False)
+    columns += [c for c in result.columns if c not in columns]
+    return result[columns]
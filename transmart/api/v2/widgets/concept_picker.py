@@ -56,10 +56,7 @@ class ConceptPicker:
         self.api = api
         self.allowed_nodes = allowed_nodes
 
-        nodes = allowed_nodes or self.api.tree_dict.keys()
-
-        self.list_of_default_options = sorted(nodes)
-        self.no_filter_len = len(self.list_of_default_options)
+        self._update_default_options()
 
         self.result_count = ipywidgets.HTML(
             value=self.result_count_template.format(self.no_filter_len),
@@ -108,6 +105,7 @@ class ConceptPicker:
                 self.result_count.value = self.result_count_template.format(count)
 
             else:
+                self._update_default_options()
                 self.concept_list.options = self.list_of_default_options[:MAX_OPTIONS]
                 self.result_count.value = self.result_count_template.format(self.no_filter_len)
 
@@ -120,6 +118,10 @@ class ConceptPicker:
             x = change.get('new')
             if x:
                 node = self.api.tree_dict.get(x)
+                # A partially loaded tree starts loading the subtree of the selection.
+                prefetch = getattr(self.api.tree_dict, 'prefetch', None)
+                if prefetch is not None:
+                    prefetch([x])
                 metadata = dict(node.get('metadata', {}))
                 d = {
                     'path': node.get('conceptPath'),
@@ -142,5 +144,11 @@ class ConceptPicker:
         concept_list.observe(concept_list_watcher, 'value')
         return concept_list
 
+    def _update_default_options(self):
+        # The tree may still be loading, so list the nodes available now.
+        nodes = self.allowed_nodes or self.api.tree_dict.keys()
+        self.list_of_default_options = sorted(nodes)
+        self.no_filter_len = len(self.list_of_default_options)
+
     def get(self):
         return self.concept_picker
@@ -4,7 +4,7 @@ from .api.v2.api import TransmartV2
 
 def get_api(host, api_version=2,
             offline_token=None, kc_url=None, kc_realm=None,
-            print_urls=False, interactive=True, client_id=None, verify=None, **kwargs):
+            print_urls=False, interactive=True, client_id=None, verify=None, transport=None, **kwargs):
     """
     Create the python transmart client by providing user credentials.
 
@@ -19,6 +19,8 @@ def get_api(host, api_version=2,
     :param verify: Either a boolean, in which case it controls whether we verify
     the server’s TLS certificate, or a string, in which case it must be a path
     to a CA bundle to use. Defaults to True.
+    :param transport: transmart.api.transport.Transport used for all HTTP requests.
+    Pass one to configure connection pool size, retries and timeouts.
     """
     api_versions = (1, 2)
 
@@ -35,4 +37,5 @@ def get_api(host, api_version=2,
                interactive=interactive,
                client_id=client_id,
                verify=verify,
+               transport=transport,
                **kwargs)